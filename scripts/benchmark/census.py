@@ -0,0 +1,59 @@
+"""Benchmarks the retrieval of census data from a local nomis stand-in.
+
+The stand-in serves the recordings of the tests of the urbanoccupants library, with a latency
+per request to mimic the remote nomis API.
+"""
+from pathlib import Path
+import os
+import tempfile
+import time
+
+import click
+
+from urbanoccupants.census import CensusStore, read_local_authorities, read_concurrently, \
+    clear_memo, GeographicalLayer
+from urbanoccupants.nomisstandin import NomisStandIn
+from urbanoccupants import PeopleFeature, HouseholdFeature
+
+ROOT_FOLDER = Path(os.path.abspath(__file__)).parent.parent.parent
+PATH_TO_RECORDINGS = ROOT_FOLDER / 'urbanoccupants' / 'tests' / 'resources' / 'nomis'
+FEATURES = [PeopleFeature.AGE, PeopleFeature.ECONOMIC_ACTIVITY, PeopleFeature.QUALIFICATION,
+            HouseholdFeature.HOUSEHOLD_TYPE]
+
+
+@click.command()
+@click.option('--latency', default=0.2, help='Latency of the stand-in per request [s].')
+def benchmark_census(latency):
+    """Reports the time to read census data of all features.
+
+    Features are read one after another, and concurrently, each first from the stand-in (cold),
+    then from the census store (stored), and last from memory (memoized).
+    """
+    local_authority = read_local_authorities(['Haringey'])[0]
+    read_functions = [feature.read_census_data for feature in FEATURES]
+    for mode in ['sequential', 'concurrent']:
+        with NomisStandIn(PATH_TO_RECORDINGS, latency=latency) as nomis,\
+                tempfile.TemporaryDirectory(prefix='census-store') as path_to_store:
+            for run in ['cold', 'stored', 'memoized']:
+                if run != 'memoized':
+                    clear_memo()
+                census_store = CensusStore(path_to_store, nomis_api_url=nomis.url)
+                number_requests = len(nomis.requests)
+                start_time = time.time()
+                if mode == 'sequential':
+                    for read_function in read_functions:
+                        read_function(GeographicalLayer.LSOA, local_authority, census_store)
+                else:
+                    read_concurrently(read_functions, GeographicalLayer.LSOA, local_authority,
+                                      census_store)
+                duration = time.time() - start_time
+                print("{:<10} {:<8} {:8.1f} ms, {} requests".format(
+                    mode,
+                    run,
+                    duration * 1000,
+                    len(nomis.requests) - number_requests
+                ))
+
+
+if __name__ == '__main__':
+    benchmark_census()
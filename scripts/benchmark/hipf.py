@@ -0,0 +1,190 @@
+"""Benchmarks the HIPF engines and solvers on the test problems of the urbanoccupants library.
+
+Both the toy example of Müller and Axhausen 2011 and the two controls problem are scaled up by
+replicating all households of the reference sample `scale` times. Controls are scaled
+accordingly, so that the fitted weights are independent of the scale. The solvers are further
+benchmarked on a large synthetic seed.
+"""
+from pathlib import Path
+import os
+import time
+import timeit
+
+import click
+import numpy as np
+import pandas as pd
+
+from urbanoccupants.hipf import fit_hipf, ENGINES, SOLVERS
+
+ROOT_FOLDER = Path(os.path.abspath(__file__)).parent.parent.parent
+PATH_TO_TWO_CONTROLS_REFERENCE_SAMPLE = (ROOT_FOLDER / 'urbanoccupants' / 'tests' / 'resources' /
+                                         'two_controls_reference_sample.csv')
+# (number of households, a, alpha of each household member), taken from the original paper
+TOY_HOUSEHOLD_TYPES = [
+    (22, True, [True, False, False]), (21, True, [True, False]),
+    (21, True, [False, False, False]), (16, False, [False, False]),
+    (16, False, [True, False, False]), (12, False, [False]), (11, True, [False, False]),
+    (9, True, [False]), (8, False, [True, True, False]), (8, True, [True, True, False]),
+    (7, False, [True, False]), (7, False, [False, False, False]), (6, True, [True]),
+    (6, True, [True, True]), (3, False, [True]), (2, True, [True, True, True]),
+    (1, False, [True, True])
+]
+
+
+@click.group()
+def benchmark_hipf():
+    pass
+
+
+@benchmark_hipf.command()
+@click.option('--scale', default=100, help='Number of replications of each household.')
+@click.option('--maxiter', default=10, help='Number of iterations to time.')
+@click.option('--repeat', default=3, help='Number of repetitions, the fastest is reported.')
+def engines(scale, maxiter, repeat):
+    """Reports the time per HIPF iteration of all engines on scaled up test problems."""
+    problems = {
+        'toy example': _toy_example(scale),
+        'two controls': _two_controls(scale)
+    }
+    for name, (reference_sample, controls_individuals, controls_households) in problems.items():
+        print("{} with {} households and {} individuals:".format(
+            name,
+            reference_sample.index.get_level_values(0).nunique(),
+            len(reference_sample.index)
+        ))
+        time_per_iteration = {
+            engine: min(timeit.repeat(
+                lambda: fit_hipf(
+                    reference_sample=reference_sample,
+                    controls_individuals=controls_individuals,
+                    controls_households=controls_households,
+                    maxiter=maxiter,
+                    engine=engine
+                ),
+                number=1,
+                repeat=repeat
+            )) / maxiter
+            for engine in ENGINES
+        }
+        for engine, duration in time_per_iteration.items():
+            print("    {:<8} {:8.2f} ms per iteration, speedup {:6.1f}".format(
+                engine,
+                duration * 1000,
+                time_per_iteration['pandas'] / duration
+            ))
+
+
+@benchmark_hipf.command()
+@click.option('--scale', default=1, help='Number of replications of each household.')
+@click.option('--households', default=20000, help='Number of households in the synthetic seed.')
+@click.option('--tol', default=1e-6, help='Tolerance on the residuals.')
+@click.option('--maxiter', default=1000, help='Maximum number of iterations.')
+def solvers(scale, households, tol, maxiter):
+    """Reports iterations and time until the residuals tolerance is reached for all solvers."""
+    problems = {
+        'toy example': _toy_example(scale),
+        'two controls': _two_controls(scale),
+        'synthetic seed': _synthetic_seed(households)
+    }
+    for name, (reference_sample, controls_individuals, controls_households) in problems.items():
+        print("{} with {} households and {} individuals:".format(
+            name,
+            reference_sample.index.get_level_values(0).nunique(),
+            len(reference_sample.index)
+        ))
+        for solver in SOLVERS:
+            start_time = time.time()
+            _, trace = fit_hipf(
+                reference_sample=reference_sample,
+                controls_individuals=controls_individuals,
+                controls_households=controls_households,
+                maxiter=maxiter,
+                residuals_tol=tol,
+                engine='numpy',
+                compress=True,
+                solver=solver,
+                return_trace=True
+            )
+            duration = time.time() - start_time
+            phases = ", ".join("{} {:.1f} ms".format(phase, phase_duration * 1000)
+                               for phase, phase_duration in trace.total_durations.items()
+                               if phase_duration > 0)
+            print("    {:<12} {:5d} iterations {:10.1f} ms ({}), max residual {:.2e}".format(
+                solver,
+                trace.iterations,
+                duration * 1000,
+                phases,
+                trace.max_residuals[-1]
+            ))
+
+
+def _toy_example(scale):
+    rows = []
+    household_id = 1
+    for _ in range(scale):
+        for number_households, a, alpha in TOY_HOUSEHOLD_TYPES:
+            for _ in range(number_households):
+                rows.extend((household_id, person_id + 1, a, alpha_person)
+                            for person_id, alpha_person in enumerate(alpha))
+                household_id += 1
+    reference_sample = pd.DataFrame(
+        rows,
+        columns=['household_id', 'person_id', 'a', 'alpha']
+    ).set_index(['household_id', 'person_id'])
+    controls_individuals = {'alpha': {True: 227 * scale, False: 207 * scale}}
+    controls_households = {'a': {True: 145 * scale, False: 45 * scale}}
+    return reference_sample, controls_individuals, controls_households
+
+
+def _two_controls(scale):
+    single_sample = pd.read_csv(PATH_TO_TWO_CONTROLS_REFERENCE_SAMPLE)
+    number_households = single_sample['HHNR'].max() + 1
+    samples = []
+    for replication in range(scale):
+        sample = single_sample.copy()
+        sample['HHNR'] = sample['HHNR'] + replication * number_households
+        samples.append(sample)
+    reference_sample = pd.concat(samples).set_index(['HHNR', 'PNR'])
+    controls_individuals = {'WKSTAT': {0: 395 * scale, 1: 459 * scale},
+                            'GENDER': {'X': 434 * scale, 'Y': 420 * scale}}
+    controls_households = {'CAR': {0: 99 * scale, 1: 273 * scale}}
+    return reference_sample, controls_individuals, controls_households
+
+
+def _synthetic_seed(number_households, random_seed=2017):
+    # a random seed with two household and two person controls, fitted to controls which are
+    # derived from random integer weights so that a solution exists
+    random_state = np.random.RandomState(random_seed)
+    household_sizes = random_state.choice([1, 2, 3, 4, 5, 6], size=number_households,
+                                          p=[0.3, 0.3, 0.15, 0.15, 0.07, 0.03])
+    household_ids = np.repeat(np.arange(number_households), household_sizes)
+    person_ids = np.concatenate([np.arange(1, size + 1) for size in household_sizes])
+    reference_sample = pd.DataFrame(
+        index=pd.MultiIndex.from_arrays([household_ids, person_ids],
+                                        names=['household_id', 'person_id']),
+        data={
+            'hh_type': random_state.randint(4, size=number_households)[household_ids],
+            'tenure': random_state.randint(3, size=number_households)[household_ids],
+            'age': random_state.randint(6, size=len(household_ids)),
+            'activity': random_state.randint(5, size=len(household_ids))
+        }
+    )
+    true_weights = random_state.randint(1, 20, size=number_households)
+    true_person_weights = true_weights[household_ids]
+    controls_households = {
+        control: pd.Series(true_weights).groupby(
+            reference_sample[control].values[np.cumsum(household_sizes) - 1]
+        ).sum().to_dict()
+        for control in ['hh_type', 'tenure']
+    }
+    controls_individuals = {
+        control: pd.Series(true_person_weights).groupby(
+            reference_sample[control].values
+        ).sum().to_dict()
+        for control in ['age', 'activity']
+    }
+    return reference_sample, controls_individuals, controls_households
+
+
+if __name__ == '__main__':
+    benchmark_hipf()
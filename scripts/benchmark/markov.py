@@ -0,0 +1,86 @@
+"""Benchmarks the estimation of the markov chains of all clusters of a synthetic time use seed.
+
+The seed consists of diaries of random activities, with 10 minute time steps like the time use
+survey, divided into clusters of random size. For each cluster, the transition probabilities
+of a day are estimated both by counting each pair of activities of each time step separately,
+as done previously, and by the vectorised estimation of `WeekMarkovChain`. Both estimations
+must result in the exact same probabilities.
+"""
+from datetime import timedelta
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+from urbanoccupants import Activity, WeekMarkovChain
+
+TIME_STEP_SIZE = timedelta(minutes=10)
+
+
+@click.command()
+@click.option('--clusters', default=50, help='Number of clusters.')
+@click.option('--diaries', default=200, help='Mean number of diaries per cluster.')
+def benchmark_markov(clusters, diaries):
+    """Reports the time to estimate the transition probabilities of all clusters."""
+    day_time_series = _synthetic_clusters(clusters, diaries)
+    print("{} clusters with {} diaries in total:".format(
+        clusters,
+        sum(len(cluster.columns) for cluster in day_time_series)
+    ))
+
+    start_time = time.time()
+    expected = [_pairwise_transition_probabilities(cluster) for cluster in day_time_series]
+    pairwise_duration = time.time() - start_time
+
+    start_time = time.time()
+    actual = [WeekMarkovChain._transition_probabilities(
+        WeekMarkovChain._encode_states(cluster.values)
+    ) for cluster in day_time_series]
+    vectorised_duration = time.time() - start_time
+
+    assert all((a == e).all() for a, e in zip(actual, expected))
+    print("    {:<10} {:10.1f} ms".format('pairwise', pairwise_duration * 1000))
+    print("    {:<10} {:10.1f} ms, speedup {:6.1f}".format(
+        'vectorised',
+        vectorised_duration * 1000,
+        pairwise_duration / vectorised_duration
+    ))
+
+
+def _synthetic_clusters(number_clusters, mean_number_diaries, random_seed=2017):
+    random_state = np.random.RandomState(random_seed)
+    time_steps = list(WeekMarkovChain._day_time_step_generator(TIME_STEP_SIZE))
+    activities = np.array(list(Activity), dtype=object)
+    return [
+        pd.DataFrame(
+            index=time_steps,
+            data=activities[random_state.choice(
+                len(activities),
+                size=(len(time_steps), number_diaries),
+                p=[0.6, 0.3, 0.1]
+            )]
+        )
+        for number_diaries in random_state.geometric(1 / mean_number_diaries,
+                                                     size=number_clusters)
+    ]
+
+
+def _pairwise_transition_probabilities(day_time_series):
+    time_steps = list(day_time_series.index)
+    probabilities = np.zeros((len(time_steps), len(Activity), len(Activity)))
+    for slot, time_step in enumerate(time_steps):
+        current_vector = day_time_series.ix[time_step]
+        next_vector = day_time_series.ix[time_steps[(slot + 1) % len(time_steps)]]
+        for i, current_state in enumerate(Activity):
+            if current_state not in current_vector.unique():
+                continue
+            current_mask = current_vector == current_state
+            for j, next_state in enumerate(Activity):
+                next_mask = next_vector == next_state
+                probabilities[slot, i, j] = (current_mask & next_mask).sum() / current_mask.sum()
+    return probabilities
+
+
+if __name__ == '__main__':
+    benchmark_markov()
@@ -0,0 +1,99 @@
+"""Benchmarks the simulation of the activities of a population over one week.
+
+The markov chains are estimated from synthetic clusters of random diaries with 10 minute time
+steps, like the time use survey. The population is simulated once by the `PopulationSimulator`
+and, for a small sample, person by person, from which the time for the entire population is
+extrapolated.
+"""
+from datetime import datetime, timedelta
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+from urbanoccupants import Activity, WeekMarkovChain, Person, PopulationSimulator
+from urbanoccupants.rng import RandomStream
+
+TIME_STEP_SIZE = timedelta(minutes=10)
+INITIAL_TIME = datetime(2017, 3, 6, 0, 0)
+NUMBER_TIME_STEPS = 7 * 24 * 6
+
+
+@click.command()
+@click.option('--people', default=250000, help='Number of people in the population.')
+@click.option('--clusters', default=50, help='Number of markov chains.')
+@click.option('--sample', default=100, help='Number of people simulated person by person.')
+def benchmark_occupancy(people, clusters, sample):
+    """Reports the time to simulate the activities of a population over one week."""
+    random_state = np.random.RandomState(2017)
+    markov_chains = {markov_id: _synthetic_markov_chain(random_state)
+                     for markov_id in range(clusters)}
+    markov_ids = random_state.randint(clusters, size=people)
+    initial_activities = [markov_chains[markov_id].valid_states(INITIAL_TIME)[0]
+                          for markov_id in markov_ids]
+    random_seeds = RandomStream(2017, 'people').integers(np.arange(people))
+    print("{} people with {} markov chains over {} time steps:".format(
+        people, clusters, NUMBER_TIME_STEPS
+    ))
+
+    start_time = time.time()
+    for _ in range(sample):
+        _simulate_person(markov_chains[markov_ids[0]], initial_activities[0], random_seeds[0])
+    person_duration = (time.time() - start_time) / sample * people
+
+    start_time = time.time()
+    simulator = PopulationSimulator(
+        markov_chains=markov_chains,
+        markov_ids=markov_ids,
+        initial_activities=initial_activities,
+        random_seeds=random_seeds,
+        initial_time=INITIAL_TIME,
+        time_step_size=TIME_STEP_SIZE
+    )
+    for _, counts in simulator.occupancy(NUMBER_TIME_STEPS):
+        assert counts.sum() == people
+    population_duration = time.time() - start_time
+
+    print("    {:<12} {:10.1f} s (extrapolated from {} people)".format(
+        'per person',
+        person_duration,
+        sample
+    ))
+    print("    {:<12} {:10.1f} s, {:.2f} ms per time step, speedup {:6.1f}".format(
+        'population',
+        population_duration,
+        population_duration / NUMBER_TIME_STEPS * 1000,
+        person_duration / population_duration
+    ))
+
+
+def _synthetic_markov_chain(random_state, number_diaries=100):
+    time_steps = list(WeekMarkovChain._day_time_step_generator(TIME_STEP_SIZE))
+    activities = np.array(list(Activity), dtype=object)
+
+    def random_time_series():
+        return pd.DataFrame(
+            index=time_steps,
+            data=activities[random_state.choice(len(activities),
+                                                size=(len(time_steps), number_diaries),
+                                                p=[0.6, 0.3, 0.1])]
+        )
+    return WeekMarkovChain(random_time_series(), random_time_series(), TIME_STEP_SIZE)
+
+
+def _simulate_person(markov_chain, initial_activity, random_seed):
+    random_state = np.random.RandomState(random_seed % 2 ** 32)
+    person = Person(
+        week_markov_chain=markov_chain,
+        initial_activity=initial_activity,
+        number_generator=random_state.uniform,
+        initial_time=INITIAL_TIME,
+        time_step_size=TIME_STEP_SIZE
+    )
+    for _ in range(NUMBER_TIME_STEPS):
+        person.step()
+
+
+if __name__ == '__main__':
+    benchmark_occupancy()
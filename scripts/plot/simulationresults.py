@@ -9,13 +9,12 @@ import seaborn as sns
 import pandas as pd
 import numpy as np
 import sqlalchemy
-import requests_cache
 
 import urbanoccupants as uo
 import geopandasplotting as gpdplt
 ROOT_FOLDER = Path(os.path.abspath(__file__)).parent.parent.parent
-CACHE_PATH = ROOT_FOLDER / 'build' / 'web-cache'
-requests_cache.install_cache((CACHE_PATH).as_posix())
+CENSUS_STORE_PATH = ROOT_FOLDER / 'build' / 'census-store'
+GEOMETRY_STORE_PATH = ROOT_FOLDER / 'build' / 'geometry-store'
 
 ENERGY_TIME_SPAN = timedelta(days=7) # energy will be reported as kWh per timespan, e.g kWh per week
 
@@ -71,10 +70,14 @@ def _read_thermal_power(disk_engine, dwellings):
 
 
 def _read_geo_data(config, thermal_power):
-    geo_data = uo.census.read_haringey_shape_file(config['spatial-resolution'])
-    household_data = uo.census.read_household_type_data(config['spatial-resolution'])
-    age_structure = uo.census.read_age_structure_data(config['spatial-resolution'])
-    economic_activity_data = uo.census.read_economic_activity_data(config['spatial-resolution'])
+    geo_data = uo.census.read_shape_file(config['spatial-resolution'],
+                                         config['local-authorities'],
+                                         uo.census.GeometryStore(GEOMETRY_STORE_PATH))
+    household_data, age_structure, economic_activity_data = _read_census_data(
+        [uo.census.read_household_type_data, uo.census.read_age_structure_data,
+         uo.census.read_economic_activity_data],
+        config
+    )
 
     energy = thermal_power.copy()
     energy.value = energy.value * config['time-step-size'].total_seconds() / 1000 / 3600 # kWh
@@ -95,6 +98,18 @@ def _read_geo_data(config, thermal_power):
     return geo_data
 
 
+def _read_census_data(census_read_functions, config):
+    if config['aggregate-from-oa']:
+        oa_lookup = uo.census.GeometryStore(GEOMETRY_STORE_PATH).oa_lookup()
+    else:
+        oa_lookup = None
+    census_store = uo.census.CensusStore(CENSUS_STORE_PATH, oa_lookup=oa_lookup)
+    data = [uo.census.read_concurrently(census_read_functions, config['spatial-resolution'],
+                                        local_authority, census_store)
+            for local_authority in config['local-authorities']]
+    return [pd.concat(data_of_function) for data_of_function in zip(*data)]
+
+
 def _reweight_energy(energy):
     weekend_mask = ((energy.set_index('datetime', drop=True).index.weekday == 5) |
                     (energy.set_index('datetime', drop=True).index.weekday == 6))
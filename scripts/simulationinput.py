@@ -1,27 +1,25 @@
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
-from itertools import count, chain
-import math
+from itertools import accumulate, islice, tee, zip_longest
+from operator import itemgetter
 from multiprocessing import Pool, cpu_count
 import os
 from pathlib import Path
-import random
 
 import click
 import pandas as pd
 import yaml
 from tqdm import tqdm
-import requests_cache
 import sqlalchemy
 
 import urbanoccupants as uo
 
-NUMBER_HOUSEHOLDS_HARINGEY = 101955
-NUMBER_USUAL_RESIDENTS_HARINGEY = 254926
 RANDOM_SEED = 'haringey-case-study'
 ROOT_FOLDER = Path(os.path.abspath(__file__)).parent.parent
-CACHE_PATH = ROOT_FOLDER / 'build' / 'web-cache'
+CENSUS_STORE_PATH = ROOT_FOLDER / 'build' / 'census-store'
+GEOMETRY_STORE_PATH = ROOT_FOLDER / 'build' / 'geometry-store'
+HIPF_CACHE_PATH = ROOT_FOLDER / 'build' / 'hipf-cache'
 MIDAS_DATABASE_PATH = ROOT_FOLDER / 'data' / 'Londhour.csv'
-requests_cache.install_cache((CACHE_PATH).as_posix())
 
 
 @click.command()
@@ -29,9 +27,23 @@ requests_cache.install_cache((CACHE_PATH).as_posix())
 @click.argument('path_to_markov_ts')
 @click.argument('path_to_config')
 @click.argument('path_to_result')
-def simulation_input(path_to_seed, path_to_markov_ts, path_to_config, path_to_result):
-    random.seed(RANDOM_SEED)
-    _check_paths(path_to_seed, path_to_markov_ts, path_to_config, path_to_result)
+@click.option('--replicates', default=1,
+              help='Number of replicate populations drawn from the same fit. With more than one '
+                   'replicate, replicate k is written to <path_to_result>-<k>.')
+@click.option('--offline', is_flag=True,
+              help='Use only census data that has been retrieved before, never access nomis.')
+def simulation_input(path_to_seed, path_to_markov_ts, path_to_config, path_to_result, replicates,
+                     offline):
+    """Creates synthetic populations of the local authorities of the config and their markov chains.
+
+    The config option `local-authorities` lists the local authorities to synthesise, by their
+    names in the local authority lookup of urbanoccupants. The local authorities run one after
+    another, and each parallelises the fitting and sampling of its regions over
+    `number-processes` processes. The populations of all local authorities end up in the same
+    result database.
+    """
+    paths_to_result = _replicate_paths(path_to_result, replicates)
+    _check_paths(path_to_seed, path_to_markov_ts, path_to_config, paths_to_result)
     seed = pd.read_pickle(path_to_seed)
     markov_ts = pd.read_pickle(path_to_markov_ts)
     config = uo.read_simulation_config(path_to_config)
@@ -49,38 +61,73 @@ def simulation_input(path_to_seed, path_to_markov_ts, path_to_config, path_to_re
     )
     seed = _amend_seed_by_markov_model(seed, markov_chains, features, config['start-time'])
     seed = _amend_seed_by_metabolic_rate(seed, config)
-    census_data_ppl = {feature: feature.read_census_data(config['spatial-resolution'])
-                       for feature in config['people-features']}
-    for data in census_data_ppl.values():
-        assert data.sum().sum() == NUMBER_USUAL_RESIDENTS_HARINGEY
-    census_data_hh = {feature: feature.read_census_data(config['spatial-resolution'])
-                      for feature in config['household-features']}
-    for data in census_data_hh.values():
-        assert data.sum().sum() == NUMBER_HOUSEHOLDS_HARINGEY
     seed = _prepare_seed_index(seed)
-    households, citizens = _create_synthetic_population(
-        seed,
-        census_data_hh,
-        census_data_ppl,
-        config
+    local_authorities = config['local-authorities']
+    first_household_ids = accumulate(
+        [1] + [local_authority.number_households for local_authority in local_authorities[:-1]]
     )
-    _write_dwellings_table(households, config, path_to_result)
-    _write_citizens_table(citizens, path_to_result)
-    _write_markov_chains(markov_chains, path_to_result)
-    _write_temperature_table(config, path_to_result)
-    _write_simulation_parameter_table(config, path_to_result)
+    census_store = _census_store(config, offline)
+    print('Synthesising population of {} local authorities.'.format(len(local_authorities)))
+    number_citizens = [0] * replicates
+    with Pool(config['number-processes']) as pool:
+        # local authorities are synthesised one after another, each using all processes for
+        # its regions, as there are typically few local authorities but many regions
+        for local_authority, first_household_id in tqdm(zip(local_authorities,
+                                                            first_household_ids),
+                                                        total=len(local_authorities),
+                                                        desc='Local authorities        '):
+            paths_to_parts = _synthesise_local_authority(
+                local_authority=local_authority,
+                seed=seed,
+                config=config,
+                census_store=census_store,
+                replicates=replicates,
+                first_household_id=first_household_id,
+                paths_to_parts=[_part_path(path, local_authority) for path in paths_to_result],
+                path_to_hipf_report=_part_path(Path(path_to_result).with_suffix('.hipf.csv'),
+                                               local_authority),
+                pool=pool
+            )
+            for replicate, path_to_part in enumerate(paths_to_parts):
+                number_citizens[replicate] += _merge_part(
+                    path_to_part,
+                    paths_to_result[replicate],
+                    first_citizen_index=number_citizens[replicate]
+                )
+    for path_to_replicate in paths_to_result:
+        _write_markov_chains(markov_chains, path_to_replicate)
+        _write_temperature_table(config, path_to_replicate)
+        _write_simulation_parameter_table(config, path_to_replicate)
+
+
+def _census_store(config, offline=False):
+    if config['aggregate-from-oa']:
+        oa_lookup = uo.census.GeometryStore(GEOMETRY_STORE_PATH).oa_lookup()
+    else:
+        oa_lookup = None
+    return uo.census.CensusStore(CENSUS_STORE_PATH, offline=offline, oa_lookup=oa_lookup)
+
+
+def _replicate_paths(path_to_result, replicates):
+    assert replicates >= 1
+    if replicates == 1:
+        return [Path(path_to_result)]
+    path_to_result = Path(path_to_result)
+    return [path_to_result.with_name('{}-{}{}'.format(path_to_result.stem, replicate,
+                                                      path_to_result.suffix))
+            for replicate in range(1, replicates + 1)]
 
 
-def _check_paths(path_to_seed, path_to_markov_ts, path_to_config, path_to_result):
+def _check_paths(path_to_seed, path_to_markov_ts, path_to_config, paths_to_result):
     if not Path(path_to_seed).exists():
         raise ValueError("Seed is missing: {}.".format(path_to_seed))
     if not Path(path_to_markov_ts).exists():
         raise ValueError("Markov timeseries is missing: {}.".format(path_to_markov_ts))
     if not Path(path_to_config).exists():
         raise ValueError("Config file is missing: {}.".format(path_to_config))
-    path_to_result = Path(path_to_result)
-    if path_to_result.exists():
-        path_to_result.unlink()
+    for path_to_result in paths_to_result:
+        if path_to_result.exists():
+            path_to_result.unlink()
     if not MIDAS_DATABASE_PATH.exists():
         raise ValueError('MIDAS weather data file is missing: {}.'.format(MIDAS_DATABASE_PATH))
 
@@ -142,64 +189,170 @@ def _prepare_seed_index(seed):
     return seed
 
 
-def _create_synthetic_population(seed, census_data_hh, census_data_ppl, config):
-    random_hh_feature = list(census_data_hh.values())[0]
-    regions = list(random_hh_feature.index)
-    controls_hh = {region: {str(feature): census_data_hh[feature].ix[region, :]
-                            for feature in config['household-features']}
-                   for region in regions}
-    controls_ppl = {region: {str(feature): census_data_ppl[feature].ix[region, :]
-                             for feature in config['people-features']}
-                    for region in regions}
-    number_households = {region: random_hh_feature.ix[region, :].sum() for region in regions}
-    household_counter = count(start=1, step=1)
-    household_ids = {region: [household_counter.__next__()
-                              for _ in range(number_households[region])]
+def _part_path(path, local_authority):
+    return path.with_name('{}.{}{}'.format(path.stem, local_authority.name.replace(' ', '-'),
+                                           path.suffix))
+
+
+def _synthesise_local_authority(local_authority, seed, config, census_store, replicates,
+                                first_household_id, paths_to_parts, path_to_hipf_report, pool):
+    # synthesises the population of a single local authority into one part database per
+    # replicate; fitting and sampling of regions run in parallel in the pool
+    for path_to_part in paths_to_parts:
+        if path_to_part.exists():
+            path_to_part.unlink()
+    features = config['people-features'] + config['household-features']
+    census_data = dict(zip(features, uo.census.read_concurrently(
+        [feature.read_census_data for feature in features],
+        config['spatial-resolution'],
+        local_authority,
+        census_store
+    )))
+    controls_hh = uo.synthpop.ControlCube.from_census_data(
+        OrderedDict((str(feature), census_data[feature])
+                    for feature in config['household-features'])
+    )
+    controls_ppl = uo.synthpop.ControlCube.from_census_data(
+        OrderedDict((str(feature), census_data[feature])
+                    for feature in config['people-features'])
+    ).select_regions(controls_hh.regions)
+    assert controls_hh.consistent_grand_totals().all()
+    assert controls_ppl.consistent_grand_totals().all()
+    assert controls_hh.grand_totals()[:, 0].sum() == local_authority.number_households
+    assert controls_ppl.grand_totals()[:, 0].sum() == local_authority.number_usual_residents
+    population_chunks = _stream_synthetic_populations(
+        seed,
+        controls_hh,
+        controls_ppl,
+        config,
+        local_authority=local_authority,
+        replicates=replicates,
+        first_household_id=first_household_id,
+        path_to_hipf_report=path_to_hipf_report,
+        pool=pool
+    )
+    number_citizens = [0] * replicates
+    goodness_of_fit = [uo.synthpop.GoodnessOfFit(seed, controls_hh, controls_ppl)
+                       for _ in range(replicates)]
+    for replicate, population in population_chunks:
+        _write_dwellings_table(population, config, paths_to_parts[replicate])
+        _write_citizens_table(population, paths_to_parts[replicate],
+                              first_index=number_citizens[replicate])
+        number_citizens[replicate] += population.number_citizens
+        goodness_of_fit[replicate].add(population)
+    for replicate, path_to_part in enumerate(paths_to_parts):
+        _write_goodness_of_fit_table(goodness_of_fit[replicate], path_to_part)
+    return paths_to_parts
+
+
+def _stream_synthetic_populations(seed, controls_hh, controls_ppl, config, local_authority,
+                                  replicates, first_household_id, path_to_hipf_report, pool):
+    # yields chunks of at least config['population-chunk-size'] households with their citizens,
+    # as tuples of (replicate, population), so that chunks can be written as soon as they are
+    # sampled
+    regions = list(controls_hh.regions)
+    number_households = dict(zip(regions, controls_hh.grand_totals()[:, 0].tolist()))
+    first_household_ids = dict(zip(
+        regions,
+        accumulate([first_household_id] +
+                   [number_households[region] for region in regions[:-1]])
+    ))
+    household_ids = {region: range(first_household_ids[region],
+                                   first_household_ids[region] + number_households[region])
                      for region in regions}
-    random_numbers = {region: [random.uniform(0, 1) for _ in range(number_households[region])]
-                      for region in regions}
-    hh_chunk_size = int(NUMBER_HOUSEHOLDS_HARINGEY / config['number-processes'] / 4)
 
-    with Pool(config['number-processes']) as pool:
-        hipf_params = ((seed, controls_hh[region], controls_ppl[region], region)
-                       for region in regions)
-        household_weights = dict(tqdm(
-            pool.imap_unordered(uo.synthpop.run_hipf, hipf_params),
-            total=len(regions),
-            desc='Hierarchical IPF         '
-        ))
-        household_params = ((region, seed, household_weights[region],
-                             random_numbers[region], household_ids[region])
-                            for region in regions)
-        households = list(chain(*tqdm(
-            pool.imap_unordered(uo.synthpop.sample_households, household_params),
-            total=len(regions),
-            desc='Sampling households      '
-        )))
-        household_chunks = [households[i:i + hh_chunk_size]
-                            for i in range(0, len(households), hh_chunk_size)]
-        citizens = list(chain(*tqdm(
-            pool.imap_unordered(
-                uo.synthpop.sample_citizen,
-                ((households, seed) for households in household_chunks)
-            ),
-            total=math.ceil(NUMBER_HOUSEHOLDS_HARINGEY / hh_chunk_size),
-            desc='Sampling individuals     '
-        )))
-
-    assert len(households) == NUMBER_HOUSEHOLDS_HARINGEY
-    assert abs(len(citizens) - NUMBER_USUAL_RESIDENTS_HARINGEY) < 2000
-    return households, citizens
-
-
-def _df_to_input_db(df, table_name, path_to_db):
+    household_weights = uo.synthpop.run_hipf_batch(
+        seed,
+        controls_hh,
+        controls_ppl,
+        weight_store=uo.synthpop.WeightStore(
+            HIPF_CACHE_PATH / local_authority.name.replace(' ', '-')
+        ),
+        path_to_report=path_to_hipf_report,
+        pool=pool,
+        number_batches=config['number-processes']
+    )
+    seed_members = uo.synthpop.index_seed_members(seed)
+    sampled_households = [0] * replicates
+    sampled_citizens = [0] * replicates
+    household_params = ((region, seed, household_weights[region],
+                         uo.synthpop.household_random_numbers(RANDOM_SEED, region,
+                                                              number_households[region],
+                                                              replicates),
+                         household_ids[region])
+                        for region in regions)
+    # regions are returned in order, hence the populations are the same for any number of
+    # processes; only number-processes regions are sampled ahead of the writer, and the
+    # replicates consume the same regions in lockstep, hence only few regions are held in
+    # memory at any time
+    households_per_region = _bounded_imap(
+        pool,
+        config['household-sampling'].sample_replicates_function,
+        household_params,
+        window=config['number-processes']
+    )
+    households_per_replicate = [
+        map(itemgetter(replicate), region_households_stream)
+        for replicate, region_households_stream in enumerate(tee(households_per_region,
+                                                                 replicates))
+    ]
+    population_streams = [
+        uo.synthpop.stream_population(households, seed_members,
+                                      config['population-chunk-size'])
+        for households in households_per_replicate
+    ]
+    for chunks in zip_longest(*population_streams):
+        for replicate, population in enumerate(chunks):
+            sampled_households[replicate] += population.number_households
+            sampled_citizens[replicate] += population.number_citizens
+            yield replicate, population
+    for replicate in range(replicates):
+        assert sampled_households[replicate] == local_authority.number_households
+        assert abs(sampled_citizens[replicate] - local_authority.number_usual_residents) < 2000
+
+
+def _bounded_imap(pool, function, params, window):
+    # like pool.imap, but with at most `window` tasks submitted whose results have not been
+    # consumed yet; params are drawn from their iterator only when they are submitted
+    params = iter(params)
+    pending = deque(pool.apply_async(function, (param, )) for param in islice(params, window))
+    while pending:
+        result = pending.popleft().get()
+        pending.extend(pool.apply_async(function, (param, )) for param in islice(params, 1))
+        yield result
+
+
+def _merge_part(path_to_part, path_to_db, first_citizen_index, chunk_size=100000):
+    # appends dwellings and citizens of a part database to the result database and removes the
+    # part; returns the number of merged citizens
+    part_engine = sqlalchemy.create_engine('sqlite:///{}'.format(path_to_part))
+    for chunk in pd.read_sql_table(uo.DWELLINGS_TABLE_NAME, part_engine, index_col='index',
+                                   chunksize=chunk_size):
+        _df_to_input_db(chunk, uo.DWELLINGS_TABLE_NAME, path_to_db, if_exists='append')
+    number_citizens = 0
+    for chunk in pd.read_sql_table(uo.PEOPLE_TABLE_NAME, part_engine, index_col='index',
+                                   chunksize=chunk_size):
+        chunk.index = chunk.index + first_citizen_index
+        _df_to_input_db(chunk, uo.PEOPLE_TABLE_NAME, path_to_db, if_exists='append')
+        number_citizens += len(chunk.index)
+    # one row per region and control only, hence no need to read in chunks
+    goodness_of_fit = pd.read_sql_table(uo.GOODNESS_OF_FIT_TABLE_NAME, part_engine,
+                                        index_col=['region', 'control'])
+    _df_to_input_db(goodness_of_fit, uo.GOODNESS_OF_FIT_TABLE_NAME, path_to_db,
+                    if_exists='append')
+    part_engine.dispose()
+    path_to_part.unlink()
+    return number_citizens
+
+
+def _df_to_input_db(df, table_name, path_to_db, if_exists='fail'):
     disk_engine = sqlalchemy.create_engine('sqlite:///{}'.format(path_to_db))
-    df.to_sql(name=table_name, con=disk_engine)
+    df.to_sql(name=table_name, con=disk_engine, if_exists=if_exists)
 
 
-def _write_dwellings_table(households, config, path_to_db):
+def _write_dwellings_table(population, config, path_to_db):
     df = pd.DataFrame(
-        index=[household.id for household in households],
+        index=population.household_column('id'),
         data={
             'thermalMassCapacity': config['dwelling']['thermal-mass-capacity'],
             'thermalMassArea': config['dwelling']['thermal-mass-area'],
@@ -215,25 +368,33 @@ def _write_dwellings_table(households, config, path_to_db):
             'maxHeatingPower': config['dwelling']['max-heating-power'],
             'initialTemperature': config['dwelling']['initial-temperature'],
             'heatingControlStrategy': config['dwelling']['heating-control-strategy'],
-            'region': [household.region for household in households]
+            'region': population.household_column('region')
         }
     )
-    _df_to_input_db(df, uo.DWELLINGS_TABLE_NAME, path_to_db)
+    _df_to_input_db(df, uo.DWELLINGS_TABLE_NAME, path_to_db, if_exists='append')
 
 
-def _write_citizens_table(citizens, path_to_db):
+def _write_citizens_table(population, path_to_db, first_index=0):
     df = pd.DataFrame(
-        index=list(range(len(citizens))),
+        index=list(range(first_index, first_index + population.number_citizens)),
         data={
-            'markovChainId': [citizen.markovId for citizen in citizens],
-            'dwellingId': [citizen.householdId for citizen in citizens],
-            'initialActivity': [str(citizen.initialActivity) for citizen in citizens],
-            'activeMetabolicRate': [citizen.activeMetabolicRate for citizen in citizens],
-            'passiveMetabolicRate': [citizen.passiveMetabolicRate for citizen in citizens],
-            'randomSeed': [citizen.randomSeed for citizen in citizens]
+            'markovChainId': population.citizen_column('markovId'),
+            'dwellingId': population.citizen_column('householdId'),
+            'initialActivity': population.citizen_column('initialActivity').astype(str),
+            'activeMetabolicRate': population.citizen_column('activeMetabolicRate'),
+            'passiveMetabolicRate': population.citizen_column('passiveMetabolicRate'),
+            'randomSeed': population.citizen_column('randomSeed')
         }
     )
-    _df_to_input_db(df, uo.PEOPLE_TABLE_NAME, path_to_db)
+    _df_to_input_db(df, uo.PEOPLE_TABLE_NAME, path_to_db, if_exists='append')
+
+
+def _write_goodness_of_fit_table(goodness_of_fit, path_to_db):
+    df = goodness_of_fit.report().rename(columns={
+        'total_absolute_error': 'totalAbsoluteError',
+        'max_relative_error': 'maxRelativeError'
+    })
+    _df_to_input_db(df, uo.GOODNESS_OF_FIT_TABLE_NAME, path_to_db)
 
 
 def _write_markov_chains(markov_chains, path_to_db):
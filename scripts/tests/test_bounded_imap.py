@@ -0,0 +1,61 @@
+import sys
+
+import pytest
+
+sys.path.append('./scripts/')
+import simulationinput
+
+
+class CountingPool():
+    # runs tasks on submission and counts the tasks whose results have not been consumed
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def apply_async(self, function, args):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return CountingResult(self, function(*args))
+
+
+class CountingResult():
+
+    def __init__(self, pool, value):
+        self.__pool = pool
+        self.__value = value
+
+    def get(self):
+        self.__pool.in_flight -= 1
+        return self.__value
+
+
+@pytest.fixture
+def pool():
+    return CountingPool()
+
+
+def square(x):
+    return x * x
+
+
+@pytest.mark.parametrize('window', [1, 2, 4, 20])
+def test_results_are_in_order(pool, window):
+    assert list(simulationinput._bounded_imap(pool, square, range(10), window)) == \
+        [x * x for x in range(10)]
+
+
+@pytest.mark.parametrize('window', [1, 2, 4])
+def test_no_more_than_window_in_flight(pool, window):
+    drawn_params = []
+
+    def params():
+        for x in range(10):
+            drawn_params.append(x)
+            yield x
+
+    results = simulationinput._bounded_imap(pool, square, params(), window)
+    for consumed, _ in enumerate(results, start=1):
+        assert pool.in_flight <= window
+        assert len(drawn_params) <= consumed + window
+    assert pool.max_in_flight == window
@@ -0,0 +1,77 @@
+from pathlib import Path
+import sys
+
+import pandas as pd
+from pandas.util.testing import assert_frame_equal
+import pytest
+import sqlalchemy
+
+sys.path.append('./scripts/')
+import simulationinput
+import urbanoccupants as uo
+
+
+def dwellings(ids):
+    return pd.DataFrame(index=ids, data={'floorArea': [100.0] * len(ids)})
+
+
+def people(dwelling_ids):
+    return pd.DataFrame({'dwellingId': dwelling_ids, 'markovChainId': [1] * len(dwelling_ids)})
+
+
+def goodness_of_fit(region):
+    return pd.DataFrame(
+        index=pd.MultiIndex.from_tuples([(region, 'AGE'), (region, 'CAR')],
+                                        names=['region', 'control']),
+        data={'srmse': [0.1, 0.2], 'totalAbsoluteError': [1, 2], 'maxRelativeError': [0.1, 0.2]}
+    )
+
+
+def part(path, region, dwelling_ids, dwelling_ids_of_people):
+    simulationinput._df_to_input_db(dwellings(dwelling_ids), uo.DWELLINGS_TABLE_NAME, path)
+    simulationinput._df_to_input_db(people(dwelling_ids_of_people), uo.PEOPLE_TABLE_NAME, path)
+    simulationinput._df_to_input_db(goodness_of_fit(region), uo.GOODNESS_OF_FIT_TABLE_NAME,
+                                    path)
+    return path
+
+
+@pytest.fixture
+def parts(tmpdir):
+    return [
+        part(Path(str(tmpdir.join('part1.db'))), 'E01', [1, 2], [1, 1, 2]),
+        part(Path(str(tmpdir.join('part2.db'))), 'E02', [3], [3, 3])
+    ]
+
+
+@pytest.fixture
+def path_to_db(tmpdir):
+    return Path(str(tmpdir.join('result.db')))
+
+
+def read_table(path_to_db, table_name, index_col='index'):
+    engine = sqlalchemy.create_engine('sqlite:///{}'.format(path_to_db))
+    return pd.read_sql_table(table_name, engine, index_col=index_col)
+
+
+def test_merge_parts(parts, path_to_db):
+    first_citizen_index = 0
+    for path_to_part in parts:
+        first_citizen_index += simulationinput._merge_part(
+            path_to_part, path_to_db, first_citizen_index, chunk_size=2
+        )
+    assert first_citizen_index == 5
+    assert list(read_table(path_to_db, uo.DWELLINGS_TABLE_NAME).index) == [1, 2, 3]
+    merged_people = read_table(path_to_db, uo.PEOPLE_TABLE_NAME)
+    assert list(merged_people.index) == [0, 1, 2, 3, 4]
+    assert list(merged_people.dwellingId) == [1, 1, 2, 3, 3]
+    assert_frame_equal(
+        read_table(path_to_db, uo.GOODNESS_OF_FIT_TABLE_NAME, ['region', 'control']),
+        pd.concat([goodness_of_fit('E01'), goodness_of_fit('E02')]),
+        check_like=True
+    )
+
+
+def test_merged_parts_are_removed(parts, path_to_db):
+    simulationinput._merge_part(parts[0], path_to_db, 0)
+    assert not parts[0].exists()
+    assert parts[1].exists()
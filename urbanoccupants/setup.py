@@ -13,6 +13,7 @@ setup(
     url='https://www.github.com/timtroendle/urbanoccupants',
     packages=find_packages(exclude=['tests*']),
     include_package_data=True,
+    package_data={'urbanoccupants': ['local-authorities.yaml']},
     install_requires=['pytus2000'],
     classifiers=[
         'Environment :: Console',
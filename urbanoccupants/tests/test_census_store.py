@@ -0,0 +1,277 @@
+"""Tests of the retrieval of census data, using the nomis stand-in.
+
+The recordings in resources/nomis are synthetic data in the format of nomis."""
+from pathlib import Path
+import pickle
+
+import pandas as pd
+import pytest
+
+import urbanoccupants.census as census
+from urbanoccupants.census import CensusStore, read_age_structure_data, \
+    read_household_type_data, read_economic_activity_data, read_qualification_level_data, \
+    read_pseudo_individual_data, read_local_authorities, read_concurrently, GeographicalLayer, \
+    clear_memo, aggregate_oa_data, NOMIS_KS102EW_TABLE
+from urbanoccupants.nomisstandin import NomisStandIn
+from urbanoccupants.types import AgeStructure
+
+PATH_TO_RECORDINGS = Path(__file__).parent / 'resources' / 'nomis'
+AREAS = ['E01002000', 'E01002001', 'E01002002']
+
+
+@pytest.fixture(autouse=True)
+def empty_memo():
+    clear_memo()
+    yield
+    clear_memo()
+
+
+@pytest.fixture
+def nomis():
+    with NomisStandIn(PATH_TO_RECORDINGS) as nomis:
+        yield nomis
+
+
+@pytest.fixture
+def haringey():
+    return read_local_authorities(['Haringey'])[0]
+
+
+def geography(local_authority):
+    return local_authority.nomis_geography[GeographicalLayer.LSOA]
+
+
+@pytest.mark.parametrize('read_census_data', [
+    read_age_structure_data,
+    read_household_type_data,
+    read_economic_activity_data,
+    read_qualification_level_data
+])
+def test_read_census_data_from_stand_in(nomis, haringey, read_census_data):
+    data = read_census_data(GeographicalLayer.LSOA, haringey, CensusStore(nomis_api_url=nomis.url))
+    assert list(data.index) == AREAS
+    assert (data.dtypes == 'int64').all()
+
+
+def test_age_structure_data(nomis, haringey):
+    data = read_age_structure_data(GeographicalLayer.LSOA, haringey,
+                                   CensusStore(nomis_api_url=nomis.url))
+    recording = pd.read_csv(PATH_TO_RECORDINGS / 'NM_145_1.csv')
+    recording = recording[recording.CELL_NAME == 'Age 15'].set_index('GEOGRAPHY_CODE')
+    assert list(data[AgeStructure.AGE_15]) == list(recording.OBS_VALUE)
+
+
+def test_query_of_stand_in(nomis, haringey):
+    CensusStore(nomis_api_url=nomis.url).table(NOMIS_KS102EW_TABLE, geography(haringey))
+    (path, query), = nomis.requests
+    assert path == '/api/v01/dataset/NM_145_1.data.csv'
+    assert query['geography'] == [geography(haringey)]
+    assert query['select'] == ['geography_code,cell_name,obs_value']
+
+
+def test_store_retrieves_table_only_once(nomis, haringey, tmpdir):
+    census_store = CensusStore(path=str(tmpdir), nomis_api_url=nomis.url)
+    first = census_store.table(NOMIS_KS102EW_TABLE, geography(haringey))
+    second = census_store.table(NOMIS_KS102EW_TABLE, geography(haringey))
+    assert len(nomis.requests) == 1
+    pd.util.testing.assert_frame_equal(first, second)
+
+
+def test_store_without_path_retrieves_table_every_time(nomis, haringey):
+    census_store = CensusStore(nomis_api_url=nomis.url)
+    census_store.table(NOMIS_KS102EW_TABLE, geography(haringey))
+    census_store.table(NOMIS_KS102EW_TABLE, geography(haringey))
+    assert len(nomis.requests) == 2
+
+
+def test_store_distinguishes_geographies(nomis, haringey, tmpdir):
+    census_store = CensusStore(path=str(tmpdir), nomis_api_url=nomis.url)
+    census_store.table(NOMIS_KS102EW_TABLE, haringey.nomis_geography[GeographicalLayer.LSOA])
+    census_store.table(NOMIS_KS102EW_TABLE, haringey.nomis_geography[GeographicalLayer.MSOA])
+    assert len(nomis.requests) == 2
+
+
+def test_offline_store_reads_stored_table(nomis, haringey, tmpdir):
+    online = CensusStore(path=str(tmpdir), nomis_api_url=nomis.url)
+    expected = online.table(NOMIS_KS102EW_TABLE, geography(haringey))
+    offline = CensusStore(path=str(tmpdir), offline=True, nomis_api_url=nomis.url)
+    pd.util.testing.assert_frame_equal(
+        offline.table(NOMIS_KS102EW_TABLE, geography(haringey)),
+        expected
+    )
+    assert len(nomis.requests) == 1
+
+
+def test_offline_store_fails_without_stored_table(nomis, haringey, tmpdir):
+    census_store = CensusStore(path=str(tmpdir), offline=True, nomis_api_url=nomis.url)
+    with pytest.raises(IOError):
+        census_store.table(NOMIS_KS102EW_TABLE, geography(haringey))
+    assert len(nomis.requests) == 0
+
+
+def test_fails_for_unknown_dataset(nomis, haringey):
+    census_store = CensusStore(nomis_api_url=nomis.url)
+    with pytest.raises(IOError):
+        census_store.table(NOMIS_KS102EW_TABLE._replace(dataset_id='NM_0_0'), geography(haringey))
+
+
+def test_concurrent_requests_for_same_table_are_sent_once(haringey, tmpdir):
+    with NomisStandIn(PATH_TO_RECORDINGS, latency=0.2) as nomis:
+        census_store = CensusStore(path=str(tmpdir), nomis_api_url=nomis.url)
+        data = read_concurrently(
+            [read_age_structure_data, read_pseudo_individual_data, read_age_structure_data],
+            GeographicalLayer.LSOA,
+            haringey,
+            census_store
+        )
+    assert len(nomis.requests) == 1
+    assert (data[1].sum(axis=1) == data[0].sum(axis=1)).all()
+
+
+def test_read_concurrently_keeps_order(nomis, haringey):
+    read_functions = [read_household_type_data, read_age_structure_data,
+                      read_economic_activity_data]
+    data = read_concurrently(read_functions, GeographicalLayer.LSOA, haringey,
+                             CensusStore(nomis_api_url=nomis.url))
+    for read_function, concurrent_data in zip(read_functions, data):
+        expected = read_function(GeographicalLayer.LSOA, haringey,
+                                 CensusStore(nomis_api_url=nomis.url))
+        pd.util.testing.assert_frame_equal(concurrent_data, expected)
+
+
+def test_failed_requests_are_retried(haringey):
+    with NomisStandIn(PATH_TO_RECORDINGS, failures=2) as nomis:
+        data = read_age_structure_data(GeographicalLayer.LSOA, haringey,
+                                       CensusStore(nomis_api_url=nomis.url))
+    assert len(nomis.requests) == 3
+    assert list(data.index) == AREAS
+
+
+def test_store_can_be_pickled(nomis, haringey, tmpdir):
+    census_store = pickle.loads(pickle.dumps(
+        CensusStore(path=str(tmpdir), nomis_api_url=nomis.url)
+    ))
+    census_store.table(NOMIS_KS102EW_TABLE, geography(haringey))
+    assert len(nomis.requests) == 1
+    assert len(tmpdir.listdir()) == 1
+
+
+def test_census_data_is_read_once_per_process(nomis, haringey):
+    census_store = CensusStore(nomis_api_url=nomis.url)
+    first = read_age_structure_data(GeographicalLayer.LSOA, haringey, census_store)
+    second = read_age_structure_data(GeographicalLayer.LSOA, haringey, census_store)
+    read_pseudo_individual_data(GeographicalLayer.LSOA, haringey, census_store)
+    assert len(nomis.requests) == 1
+    pd.util.testing.assert_frame_equal(first, second)
+
+
+def test_memoized_census_data_cannot_be_altered(nomis, haringey):
+    census_store = CensusStore(nomis_api_url=nomis.url)
+    data = read_age_structure_data(GeographicalLayer.LSOA, haringey, census_store)
+    data[AgeStructure.AGE_15] = -1
+    data.drop(AREAS[0], inplace=True)
+    data = read_age_structure_data(GeographicalLayer.LSOA, haringey, census_store)
+    assert list(data.index) == AREAS
+    assert (data[AgeStructure.AGE_15] >= 0).all()
+
+
+def test_memo_is_bounded(nomis, haringey, monkeypatch):
+    monkeypatch.setattr(census, 'CENSUS_MEMO_SIZE', 1)
+    census_store = CensusStore(nomis_api_url=nomis.url)
+    read_age_structure_data(GeographicalLayer.LSOA, haringey, census_store)
+    read_household_type_data(GeographicalLayer.LSOA, haringey, census_store)
+    read_household_type_data(GeographicalLayer.LSOA, haringey, census_store)
+    read_age_structure_data(GeographicalLayer.LSOA, haringey, census_store)
+    assert len(nomis.requests) == 3
+
+
+def test_memo_distinguishes_geographies(nomis, haringey):
+    census_store = CensusStore(nomis_api_url=nomis.url)
+    read_age_structure_data(GeographicalLayer.LSOA, haringey, census_store)
+    read_age_structure_data(GeographicalLayer.MSOA, haringey, census_store)
+    assert len(nomis.requests) == 2
+
+
+@pytest.fixture
+def oa_lookup():
+    return pd.DataFrame(
+        index=['E00000001', 'E00000002', 'E00000003', 'E00000004', 'E00000005', 'E00000006'],
+        data={'LSOA': ['E01002000', 'E01002000', 'E01002001', 'E01002001', 'E01002002',
+                       'E01002002'],
+              'MSOA': ['E02000001'] * 4 + ['E02000002'] * 2}
+    )
+
+
+@pytest.fixture
+def oa_recordings(oa_lookup, tmpdir):
+    # distributes the values of each LSOA evenly to its OAs
+    recording = pd.read_csv(PATH_TO_RECORDINGS / 'NM_145_1.csv')
+    first_oas = recording.merge(
+        oa_lookup.groupby('LSOA').head(1).reset_index(),
+        left_on='GEOGRAPHY_CODE', right_on='LSOA'
+    )
+    first_oas['OBS_VALUE'] = first_oas['OBS_VALUE'] // 2
+    second_oas = recording.merge(
+        oa_lookup.groupby('LSOA').tail(1).reset_index(),
+        left_on='GEOGRAPHY_CODE', right_on='LSOA'
+    )
+    second_oas['OBS_VALUE'] = second_oas['OBS_VALUE'] - second_oas['OBS_VALUE'] // 2
+    oa_recording = pd.concat([first_oas, second_oas])
+    oa_recording['GEOGRAPHY_CODE'] = oa_recording['index']
+    oa_recording[['GEOGRAPHY_CODE', 'CELL_NAME', 'OBS_VALUE']].to_csv(
+        str(tmpdir.join('NM_145_1.csv')), index=False
+    )
+    return str(tmpdir)
+
+
+def test_aggregate_oa_data(oa_lookup):
+    oa_data = pd.DataFrame(index=oa_lookup.index, data={'a': [1, 2, 3, 4, 5, 6],
+                                                        'b': [0, 0, 1, 0, 1, 1]})
+    msoa_data = aggregate_oa_data(oa_data, oa_lookup['MSOA'])
+    assert list(msoa_data.index) == ['E02000001', 'E02000002']
+    assert list(msoa_data['a']) == [10, 11]
+    assert list(msoa_data['b']) == [1, 2]
+
+
+def test_aggregate_oa_data_fails_for_unknown_oa(oa_lookup):
+    oa_data = pd.DataFrame(index=['E00000001', 'E00000007'], data={'a': [1, 2]})
+    with pytest.raises((AssertionError, KeyError)):
+        aggregate_oa_data(oa_data, oa_lookup['LSOA'])
+
+
+def test_layers_are_aggregated_from_oa_table(nomis, oa_recordings, oa_lookup, haringey,
+                                             tmpdir):
+    expected = read_age_structure_data(GeographicalLayer.LSOA, haringey,
+                                       CensusStore(nomis_api_url=nomis.url))
+    with NomisStandIn(oa_recordings) as oa_nomis:
+        census_store = CensusStore(path=str(tmpdir.join('store')), nomis_api_url=oa_nomis.url,
+                                   oa_lookup=oa_lookup)
+        lsoa_data = read_age_structure_data(GeographicalLayer.LSOA, haringey, census_store)
+        read_age_structure_data(GeographicalLayer.MSOA, haringey, census_store)
+        (_, query), = oa_nomis.requests
+    pd.util.testing.assert_frame_equal(lsoa_data, expected)
+    assert query['geography'] == [haringey.nomis_geography[GeographicalLayer.OA]]
+
+
+def test_memo_distinguishes_aggregated_data(nomis, oa_recordings, oa_lookup, haringey):
+    direct = read_age_structure_data(GeographicalLayer.MSOA, haringey,
+                                     CensusStore(nomis_api_url=nomis.url))
+    with NomisStandIn(oa_recordings) as oa_nomis:
+        aggregated = read_age_structure_data(
+            GeographicalLayer.MSOA,
+            haringey,
+            CensusStore(nomis_api_url=oa_nomis.url, oa_lookup=oa_lookup)
+        )
+        assert len(oa_nomis.requests) == 1
+    assert list(direct.index) == AREAS # the stand-in ignores the geography
+    assert list(aggregated.index) == ['E02000001', 'E02000002']
+
+
+def test_store_with_oa_lookup_can_be_pickled(oa_recordings, oa_lookup, haringey):
+    with NomisStandIn(oa_recordings) as oa_nomis:
+        census_store = pickle.loads(pickle.dumps(
+            CensusStore(nomis_api_url=oa_nomis.url, oa_lookup=oa_lookup)
+        ))
+        msoa_data = census_store.layer_table(NOMIS_KS102EW_TABLE, GeographicalLayer.MSOA,
+                                             haringey)
+    assert list(msoa_data.index) == ['E02000001', 'E02000002']
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from pandas.util.testing import assert_frame_equal
+import pytest
+
+from urbanoccupants.synthpop import ControlCube
+
+
+@pytest.fixture
+def census_data():
+    return OrderedDict([
+        ('age', pd.DataFrame(index=['A', 'B', 'C'],
+                             data=OrderedDict([('young', [3, 2, 4]), ('old', [2, 1, 0])]))),
+        ('activity', pd.DataFrame(index=['C', 'A', 'B'],
+                                  data=OrderedDict([('active', [1, 4, 2]),
+                                                    ('inactive', [3, 1, 0]),
+                                                    ('retired', [0, 0, 1])])))
+    ])
+
+
+@pytest.fixture
+def cube(census_data):
+    return ControlCube.from_census_data(census_data)
+
+
+def test_layout(cube):
+    assert list(cube.regions) == ['A', 'B', 'C']
+    assert cube.control_names == ['age', 'activity']
+    assert cube.categories('activity') == ['active', 'inactive', 'retired']
+    assert cube.values.dtype == np.int64
+    assert cube.values.flags['C_CONTIGUOUS']
+    np.testing.assert_array_equal(cube.values, [[3, 2, 4, 1, 0],
+                                                [2, 1, 2, 0, 1],
+                                                [4, 0, 1, 3, 0]])
+
+
+def test_round_trip(cube, census_data):
+    controls = cube.to_dict()
+    assert set(controls.keys()) == set(census_data.keys())
+    for control_name, data in census_data.items():
+        assert_frame_equal(controls[control_name], data.loc[cube.regions, :])
+
+
+def test_grand_totals(cube):
+    np.testing.assert_array_equal(cube.grand_totals(), [[5, 5], [3, 3], [4, 4]])
+    assert cube.consistent_grand_totals().all()
+
+
+def test_inconsistent_grand_totals(census_data):
+    census_data['age'].loc['B', 'old'] = 2
+    cube = ControlCube.from_census_data(census_data)
+    np.testing.assert_array_equal(cube.consistent_grand_totals(), [True, False, True])
+
+
+def test_mismatching_regions_fail(census_data):
+    census_data['activity'] = census_data['activity'].loc[['A', 'B'], :]
+    with pytest.raises(AssertionError):
+        ControlCube.from_census_data(census_data)
+
+
+def test_select_regions(cube):
+    selection = cube.select_regions(['C', 'A'])
+    assert list(selection.regions) == ['C', 'A']
+    np.testing.assert_array_equal(selection.values, [[4, 0, 1, 3, 0], [3, 2, 4, 1, 0]])
+
+
+def test_select_unknown_regions_fails(cube):
+    with pytest.raises(AssertionError):
+        cube.select_regions(['A', 'D'])
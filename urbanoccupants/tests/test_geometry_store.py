@@ -0,0 +1,91 @@
+"""Tests of the geometry store, using small synthetic boundary files in the layout of the London
+Data Store."""
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import urbanoccupants.census as census
+from urbanoccupants.census import GeometryStore, GeographicalLayer, read_shape_file, \
+    read_local_authorities, LocalAuthority
+
+PATH_TO_BOUNDARY_FILES = Path(__file__).parent / 'resources' / \
+    'statistical-gis-boundaries-london.zip'
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    downloads = []
+
+    def download_boundary_files():
+        downloads.append(1)
+        return PATH_TO_BOUNDARY_FILES.read_bytes()
+    monkeypatch.setattr(census, '_download_boundary_files', download_boundary_files)
+    return downloads
+
+
+@pytest.fixture
+def haringey():
+    return read_local_authorities(['Haringey'])
+
+
+@pytest.fixture
+def city_of_london():
+    return [LocalAuthority(name='City of London', nomis_geography={}, number_households=0,
+                           number_usual_residents=0)]
+
+
+def test_geometries_of_local_authority(downloads, haringey, tmpdir):
+    geometries = GeometryStore(str(tmpdir)).geometries(GeographicalLayer.LSOA, haringey)
+    assert list(geometries.index) == ['E01002000', 'E01002001']
+    assert geometries.geometry.area.sum() == 2
+
+
+def test_geometries_of_several_local_authorities(downloads, haringey, city_of_london, tmpdir):
+    geometries = GeometryStore(str(tmpdir)).geometries(GeographicalLayer.LSOA,
+                                                       city_of_london + haringey)
+    assert list(geometries.index) == ['E01000001', 'E01002000', 'E01002001']
+
+
+def test_boundary_files_are_downloaded_and_read_once(downloads, haringey, city_of_london,
+                                                     tmpdir, monkeypatch):
+    GeometryStore(str(tmpdir)).geometries(GeographicalLayer.LSOA, haringey)
+    monkeypatch.setattr(census, '_read_boundary_file', None)
+    GeometryStore(str(tmpdir)).geometries(GeographicalLayer.LSOA, haringey)
+    GeometryStore(str(tmpdir)).geometries(GeographicalLayer.LSOA, city_of_london)
+    assert len(downloads) == 1
+
+
+def test_layers_share_boundary_files(downloads, haringey, tmpdir):
+    geometry_store = GeometryStore(str(tmpdir))
+    geometry_store.geometries(GeographicalLayer.LSOA, haringey)
+    wards = geometry_store.geometries(GeographicalLayer.WARD, haringey)
+    assert list(wards.index) == ['E05000268', 'E05000269']
+    assert len(downloads) == 1
+
+
+def test_fails_for_local_authority_without_geometries(downloads, city_of_london, tmpdir):
+    with pytest.raises(ValueError):
+        GeometryStore(str(tmpdir)).geometries(GeographicalLayer.WARD, city_of_london)
+
+
+def test_shape_file_with_and_without_store(downloads, haringey, tmpdir):
+    without_store = read_shape_file(GeographicalLayer.LSOA, haringey)
+    with_store = read_shape_file(GeographicalLayer.LSOA, haringey, GeometryStore(str(tmpdir)))
+    assert list(without_store.index) == list(with_store.index)
+    assert without_store.geometry.equals(with_store.geometry)
+
+
+def test_oa_lookup(downloads, tmpdir):
+    lookup = GeometryStore(str(tmpdir)).oa_lookup()
+    assert list(lookup.columns) == ['LSOA', 'MSOA', 'WARD']
+    assert list(lookup.ix['E00010003']) == ['E01002001', 'E02000400', 'E05000268']
+    assert list(lookup.ix['E00010004']) == ['E01002001', 'E02000400', 'E05000269']
+    assert lookup.ix['E00000001', 'LSOA'] == 'E01000001'
+    assert pd.isnull(lookup.ix['E00000001', 'WARD'])
+
+
+def test_oa_lookup_is_created_once(downloads, tmpdir, monkeypatch):
+    expected = GeometryStore(str(tmpdir)).oa_lookup()
+    monkeypatch.setattr(GeometryStore, '_create_oa_lookup', None)
+    pd.util.testing.assert_frame_equal(GeometryStore(str(tmpdir)).oa_lookup(), expected)
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from urbanoccupants.synthpop import GoodnessOfFit, Population, sample_citizen
+
+
+@pytest.fixture
+def seed():
+    # two seed households of size 2 and one of size 1
+    return pd.DataFrame(
+        index=pd.MultiIndex.from_arrays([[1, 1, 2, 2, 3], [1, 2, 1, 2, 1]],
+                                        names=['household_id', 'person_id']),
+        data={
+            'car': ['yes', 'yes', 'no', 'no', 'yes'],
+            'age': ['young', 'old', 'young', 'young', 'old'],
+            'markov_id': [1, 2, 3, 4, 5],
+            'initial_activity': ['HOME'] * 5,
+            'metabolic_heat_gain_active': [140.0] * 5,
+            'metabolic_heat_gain_passive': [70.0] * 5
+        }
+    )
+
+
+@pytest.fixture
+def controls_hh():
+    return {'car': pd.DataFrame(index=['A', 'B'], data={'yes': [2, 1], 'no': [1, 1]})}
+
+
+@pytest.fixture
+def controls_ppl():
+    return {'age': pd.DataFrame(index=['A', 'B'], data={'young': [3, 2], 'old': [2, 1]})}
+
+
+def population(seed, region, seed_ids, first_id=1):
+    return sample_citizen((
+        Population.from_households(region, range(first_id, first_id + len(seed_ids)), seed_ids),
+        seed
+    ))
+
+
+def test_perfect_fit(seed, controls_hh, controls_ppl):
+    fit = GoodnessOfFit(seed, controls_hh, controls_ppl)
+    fit.add(population(seed, 'A', [1, 2, 3]))
+    fit.add(population(seed, 'B', [2, 3], first_id=4))
+    report = fit.report()
+    assert len(report.index) == 4
+    assert (report == 0).all().all()
+
+
+def test_statistics(seed, controls_hh, controls_ppl):
+    fit = GoodnessOfFit(seed, controls_hh, controls_ppl)
+    fit.add(population(seed, 'A', [1, 1, 1]))
+    report = fit.report()
+    # region A has 3 households with a car, 3 young, and 3 old people
+    assert report.ix[('A', 'car'), 'total_absolute_error'] == 2
+    assert report.ix[('A', 'car'), 'max_relative_error'] == 1
+    assert report.ix[('A', 'car'), 'srmse'] == pytest.approx(1 / 1.5)
+    assert report.ix[('A', 'age'), 'total_absolute_error'] == 1
+    assert report.ix[('A', 'age'), 'max_relative_error'] == pytest.approx(1 / 2)
+    assert report.ix[('A', 'age'), 'srmse'] == pytest.approx(np.sqrt(1 / 2) / 2.5)
+    # region B has no households at all
+    assert report.ix[('B', 'car'), 'total_absolute_error'] == 2
+    assert report.ix[('B', 'age'), 'max_relative_error'] == 1
+
+
+def test_chunks_equal_entire_population(seed, controls_hh, controls_ppl):
+    seed_ids = [1, 3, 2, 2, 1, 3, 3]
+    entire = GoodnessOfFit(seed, controls_hh, controls_ppl)
+    entire.add(population(seed, 'A', seed_ids))
+    chunked = GoodnessOfFit(seed, controls_hh, controls_ppl)
+    chunked.add(population(seed, 'A', seed_ids[:3]))
+    chunked.add(population(seed, 'A', seed_ids[3:], first_id=4))
+    pd.util.testing.assert_frame_equal(entire.report(), chunked.report())
+
+
+def test_infinite_relative_error_without_target(seed, controls_ppl):
+    controls_hh = {'car': pd.DataFrame(index=['A', 'B'], data={'yes': [0, 1], 'no': [3, 1]})}
+    fit = GoodnessOfFit(seed, controls_hh, controls_ppl)
+    fit.add(population(seed, 'A', [1]))
+    assert np.isinf(fit.report().ix[('A', 'car'), 'max_relative_error'])
+
+
+def test_fails_with_unknown_region(seed, controls_hh, controls_ppl):
+    fit = GoodnessOfFit(seed, controls_hh, controls_ppl)
+    with pytest.raises(AssertionError):
+        fit.add(population(seed, 'C', [1]))
@@ -12,7 +12,7 @@ import numpy as np
 from pandas.util.testing import assert_series_equal
 import pytest
 
-from urbanoccupants.hipf import fit_hipf
+from urbanoccupants.hipf import fit_hipf, ENGINES
 
 
 HouseholdType = namedtuple('HouseholdType', ['household_ids', 'a', 'alpha', 'weights'])
@@ -159,6 +159,11 @@ def expected_weights(household_types, reference_sample):
     return expected_weights
 
 
+@pytest.fixture(params=ENGINES)
+def engine(request):
+    return request.param
+
+
 @pytest.fixture
 def controls_households():
     return {'a': {True: 145, False: 45}}
@@ -175,33 +180,36 @@ def assert_weights_equal(expected_weights, weights, precision=1):
 
 
 def test_first_iteration(reference_sample, expected_weights,
-                         controls_households, controls_individuals):
+                         controls_households, controls_individuals, engine):
     weights = fit_hipf(
         reference_sample=reference_sample,
         controls_individuals=controls_individuals,
         controls_households=controls_households,
+        engine=engine,
         maxiter=1
     )
     assert_weights_equal(expected_weights[5], weights) # 5 iterations in paper represent 1 iteration
 
 
 def test_second_iteration(reference_sample, expected_weights,
-                          controls_households, controls_individuals):
+                          controls_households, controls_individuals, engine):
     weights = fit_hipf(
         reference_sample=reference_sample,
         controls_individuals=controls_individuals,
         controls_households=controls_households,
+        engine=engine,
         maxiter=2
     )
     assert_weights_equal(expected_weights[10], weights) # 5 iteration in paper represent 1 iteration
 
 
 def test_convergence(reference_sample, expected_weights,
-                     controls_households, controls_individuals):
+                     controls_households, controls_individuals, engine):
     weights = fit_hipf(
         reference_sample=reference_sample,
         controls_individuals=controls_individuals,
         controls_households=controls_households,
+        engine=engine,
         maxiter=10
     )
     assert_weights_equal(expected_weights['infinity'], weights)
@@ -209,11 +217,13 @@ def test_convergence(reference_sample, expected_weights,
 
 @pytest.mark.parametrize("tol", [(10), (1), (0.1)]) # assertion below uses tolerance 0.01
 def test_residuals_tolerance_criteria_stops_early(reference_sample, expected_weights, tol,
-                                                  controls_households, controls_individuals):
+                                                  controls_households, controls_individuals,
+                                                  engine):
     weights = fit_hipf(
         reference_sample=reference_sample,
         controls_individuals=controls_individuals,
         controls_households=controls_households,
+        engine=engine,
         residuals_tol=tol,
         weights_tol=1e-16,
         maxiter=10
@@ -225,11 +235,12 @@ def test_residuals_tolerance_criteria_stops_early(reference_sample, expected_wei
 @pytest.mark.parametrize("tol", [(0.01), (0.001)]) # assertion below uses tolerance 0.01
 def test_residuals_tolerance_criteria_does_not_stop_early(reference_sample, expected_weights,
                                                           tol, controls_households,
-                                                          controls_individuals):
+                                                          controls_individuals, engine):
     weights = fit_hipf(
         reference_sample=reference_sample,
         controls_individuals=controls_individuals,
         controls_households=controls_households,
+        engine=engine,
         residuals_tol=tol,
         weights_tol=1e-16,
         maxiter=10
@@ -239,11 +250,12 @@ def test_residuals_tolerance_criteria_does_not_stop_early(reference_sample, expe
 
 @pytest.mark.parametrize("tol", [(10), (1), (0.1)]) # assertion below uses tolerance 0.01
 def test_weights_tolerance_criteria_stops_early(reference_sample, expected_weights, tol,
-                                                controls_households, controls_individuals):
+                                                controls_households, controls_individuals, engine):
     weights = fit_hipf(
         reference_sample=reference_sample,
         controls_individuals=controls_individuals,
         controls_households=controls_households,
+        engine=engine,
         residuals_tol=1e-16,
         weights_tol=tol,
         maxiter=10
@@ -255,13 +267,48 @@ def test_weights_tolerance_criteria_stops_early(reference_sample, expected_weigh
 @pytest.mark.parametrize("tol", [(0.01), (0.001)]) # assertion below uses tolerance 0.01
 def test_weights_tolerance_criteria_does_not_stop_early(reference_sample, expected_weights,
                                                         tol, controls_households,
-                                                        controls_individuals):
+                                                        controls_individuals, engine):
     weights = fit_hipf(
         reference_sample=reference_sample,
         controls_individuals=controls_individuals,
         controls_households=controls_households,
+        engine=engine,
         residuals_tol=1e-16,
         weights_tol=tol,
         maxiter=10
     )
     assert_weights_equal(expected_weights['infinity'], weights)
+
+
+def test_squarem_converges_to_same_weights(reference_sample, expected_weights,
+                                           controls_households, controls_individuals):
+    weights = fit_hipf(
+        reference_sample=reference_sample,
+        controls_individuals=controls_individuals,
+        controls_households=controls_households,
+        engine='numpy',
+        solver='squarem',
+        maxiter=4
+    )
+    assert_weights_equal(expected_weights['infinity'], weights)
+
+
+@pytest.mark.parametrize("maxiter", [(1), (2), (10)])
+def test_compressed_households_lead_to_same_weights(reference_sample, controls_households,
+                                                    controls_individuals, maxiter):
+    weights = fit_hipf(
+        reference_sample=reference_sample,
+        controls_individuals=controls_individuals,
+        controls_households=controls_households,
+        engine='numpy',
+        maxiter=maxiter
+    )
+    compressed_weights = fit_hipf(
+        reference_sample=reference_sample,
+        controls_individuals=controls_individuals,
+        controls_households=controls_households,
+        engine='numpy',
+        compress=True,
+        maxiter=maxiter
+    )
+    assert_series_equal(weights, compressed_weights)
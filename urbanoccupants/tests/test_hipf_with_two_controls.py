@@ -15,7 +15,8 @@ import pandas as pd
 from pandas.util.testing import assert_series_equal
 import pytest
 
-from urbanoccupants.hipf import fit_hipf, _all_residuals
+from urbanoccupants.hipf import fit_hipf, fit_hipf_batch, SOLVERS, _all_residuals,\
+    _encode_reference_sample, _all_residuals_encoded
 
 
 RESOURCES_PATH = Path(__file__).parent / 'resources'
@@ -101,6 +102,237 @@ def test_converges(reference_sample, controls_households, controls_individuals,
     assert residuals.abs().max() < tol
 
 
+def test_numpy_engine_same_result_like_mlipf(reference_sample, expected_weights,
+                                             controls_individuals, controls_households):
+    # the numpy engine does not rely on person ids starting at 1 in every household
+    weights = fit_hipf(
+        reference_sample=reference_sample,
+        controls_individuals=controls_individuals,
+        controls_households=controls_households,
+        weights_tol=2.220446e-16,
+        residuals_tol=1e-6,
+        maxiter=200,
+        engine='numpy'
+    )
+    assert_weights_equal(expected_weights, weights)
+
+
+def test_numpy_engine_converges(reference_sample, controls_households, controls_individuals):
+    residuals_tol = 1e-6
+    weights = fit_hipf(
+        reference_sample=reference_sample,
+        controls_individuals=controls_individuals,
+        controls_households=controls_households,
+        weights_tol=2.220446e-16,
+        residuals_tol=residuals_tol,
+        maxiter=200,
+        engine='numpy'
+    )
+    sample = _encode_reference_sample(reference_sample, controls_individuals, controls_households)
+    residuals = _all_residuals_encoded(sample, weights.values[np.newaxis, :])
+    assert abs(residuals).max() < residuals_tol
+
+
+@pytest.mark.parametrize("solver", SOLVERS)
+def test_solvers_converge(reference_sample, controls_households, controls_individuals, solver):
+    weights = fit_hipf(
+        reference_sample=reference_sample,
+        controls_individuals=controls_individuals,
+        controls_households=controls_households,
+        residuals_tol=1e-6,
+        maxiter=200,
+        engine='numpy',
+        solver=solver
+    )
+    sample = _encode_reference_sample(reference_sample, controls_individuals, controls_households)
+    residuals = _all_residuals_encoded(sample, weights.values[np.newaxis, :])
+    assert abs(residuals).max() < 1e-6
+
+
+@pytest.mark.parametrize("solver", SOLVERS)
+def test_trace_records_each_iteration(reference_sample, controls_households, controls_individuals,
+                                      solver):
+    weights, trace = fit_hipf(
+        reference_sample=reference_sample,
+        controls_individuals=controls_individuals,
+        controls_households=controls_households,
+        residuals_tol=1e-6,
+        maxiter=200,
+        engine='numpy',
+        solver=solver,
+        return_trace=True
+    )
+    sample = _encode_reference_sample(reference_sample, controls_individuals, controls_households)
+    residuals = _all_residuals_encoded(sample, weights.values[np.newaxis, :])
+    assert 0 < trace.iterations < 200
+    assert len(trace.max_residuals) == trace.iterations
+    assert len(trace.max_weight_changes) == trace.iterations
+    assert trace.max_residuals[-1] == pytest.approx(abs(residuals).max())
+    assert all(len(durations) == trace.iterations for durations in trace.durations.values())
+    assert sum(trace.total_durations.values()) > 0
+
+
+def test_compressed_households_lead_to_same_weights(reference_sample, controls_households,
+                                                    controls_individuals):
+    weights = fit_hipf(
+        reference_sample=reference_sample,
+        controls_individuals=controls_individuals,
+        controls_households=controls_households,
+        weights_tol=2.220446e-16,
+        residuals_tol=1e-6,
+        maxiter=200,
+        engine='numpy'
+    )
+    compressed_weights = fit_hipf(
+        reference_sample=reference_sample,
+        controls_individuals=controls_individuals,
+        controls_households=controls_households,
+        weights_tol=2.220446e-16,
+        residuals_tol=1e-6,
+        maxiter=200,
+        engine='numpy',
+        compress=True
+    )
+    assert_series_equal(weights, compressed_weights)
+
+
+def test_batch_fit_equals_fit_of_each_region(reference_sample, controls_households,
+                                             controls_individuals):
+    regions = ['region1', 'region2']
+    controls_households_batch = {
+        'CAR': pd.DataFrame(index=regions, data={0: [99, 198], 1: [273, 546]})
+    }
+    controls_individuals_batch = {
+        'WKSTAT': pd.DataFrame(index=regions, data={0: [395, 800], 1: [459, 908]}),
+        'GENDER': pd.DataFrame(index=regions, data={'X': [434, 840], 'Y': [420, 868]})
+    }
+    batch_weights = fit_hipf_batch(
+        reference_sample=reference_sample,
+        controls_individuals=controls_individuals_batch,
+        controls_households=controls_households_batch,
+        weights_tol=2.220446e-16,
+        residuals_tol=1e-6,
+        maxiter=200
+    )
+    for region in regions:
+        weights = fit_hipf(
+            reference_sample=reference_sample,
+            controls_individuals={name: controls.ix[region].to_dict()
+                                  for name, controls in controls_individuals_batch.items()},
+            controls_households={name: controls.ix[region].to_dict()
+                                 for name, controls in controls_households_batch.items()},
+            weights_tol=2.220446e-16,
+            residuals_tol=1e-6,
+            maxiter=200,
+            engine='numpy'
+        )
+        batch_weights_region = batch_weights.ix[region]
+        batch_weights_region.name = None
+        assert_series_equal(weights, batch_weights_region)
+
+
+@pytest.mark.parametrize("engine,compress", [('pandas', False), ('numpy', False), ('numpy', True)])
+def test_warm_start_from_solution_stays_at_solution(reference_sample, controls_households,
+                                                    controls_individuals, engine, compress):
+    weights = fit_hipf(
+        reference_sample=reference_sample,
+        controls_individuals=controls_individuals,
+        controls_households=controls_households,
+        weights_tol=2.220446e-16,
+        residuals_tol=1e-6,
+        maxiter=200,
+        engine=engine
+    )
+    warm_started_weights = fit_hipf(
+        reference_sample=reference_sample,
+        controls_individuals=controls_individuals,
+        controls_households=controls_households,
+        maxiter=1,
+        engine=engine,
+        compress=compress,
+        initial_weights=weights
+    )
+    assert_series_equal(weights, warm_started_weights)
+
+
+@pytest.fixture
+def joint_controls_individuals():
+    return {('WKSTAT', 'GENDER'): {(0, 'X'): 200, (0, 'Y'): 195, (1, 'X'): 234, (1, 'Y'): 225}}
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_multi_dimensional_controls_equal_flattened_controls(reference_sample,
+                                                             controls_households,
+                                                             joint_controls_individuals,
+                                                             compress):
+    flattened_reference_sample = reference_sample.copy()
+    flattened_reference_sample['WKSTAT_GENDER'] = (reference_sample['WKSTAT'].astype(str) + '_' +
+                                                   reference_sample['GENDER'])
+    flattened_weights = fit_hipf(
+        reference_sample=flattened_reference_sample,
+        controls_individuals={
+            'WKSTAT_GENDER': {'{}_{}'.format(*category): value for category, value
+                              in joint_controls_individuals[('WKSTAT', 'GENDER')].items()}
+        },
+        controls_households=controls_households,
+        residuals_tol=1e-6,
+        maxiter=200,
+        engine='numpy'
+    )
+    weights = fit_hipf(
+        reference_sample=reference_sample,
+        controls_individuals=joint_controls_individuals,
+        controls_households=controls_households,
+        residuals_tol=1e-6,
+        maxiter=200,
+        engine='numpy',
+        compress=compress
+    )
+    assert_series_equal(flattened_weights, weights)
+
+
+def test_batch_fit_with_multi_dimensional_controls(reference_sample, controls_households,
+                                                   joint_controls_individuals):
+    categories = list(joint_controls_individuals[('WKSTAT', 'GENDER')].keys())
+    weights = fit_hipf(
+        reference_sample=reference_sample,
+        controls_individuals=joint_controls_individuals,
+        controls_households=controls_households,
+        residuals_tol=1e-6,
+        maxiter=200,
+        engine='numpy'
+    )
+    batch_weights = fit_hipf_batch(
+        reference_sample=reference_sample,
+        controls_individuals={('WKSTAT', 'GENDER'): pd.DataFrame(
+            [[joint_controls_individuals[('WKSTAT', 'GENDER')][category]
+              for category in categories]],
+            index=['region1'],
+            columns=pd.MultiIndex.from_tuples(categories)
+        )},
+        controls_households={name: pd.DataFrame([controls], index=['region1'])
+                             for name, controls in controls_households.items()},
+        residuals_tol=1e-6,
+        maxiter=200,
+        compress=False
+    )
+    batch_weights_region = batch_weights.ix['region1']
+    batch_weights_region.name = None
+    assert_series_equal(weights, batch_weights_region)
+
+
+def test_pandas_engine_fails_with_multi_dimensional_controls(reference_sample,
+                                                             controls_households,
+                                                             joint_controls_individuals):
+    with pytest.raises(AssertionError):
+        fit_hipf(
+            reference_sample=reference_sample,
+            controls_individuals=joint_controls_individuals,
+            controls_households=controls_households,
+            maxiter=2
+        )
+
+
 def test_fails_with_invalid_controls_individuals(reference_sample, controls_households,
                                                  invalid_controls_individuals):
     with pytest.raises(AssertionError):
@@ -0,0 +1,59 @@
+import pytest
+
+from urbanoccupants.census import read_local_authorities, GeographicalLayer
+
+
+def test_haringey_totals():
+    haringey, = read_local_authorities(['Haringey'])
+    assert haringey.name == 'Haringey'
+    assert haringey.number_households == 101955
+    assert haringey.number_usual_residents == 254926
+
+
+@pytest.mark.parametrize('geographical_layer', list(GeographicalLayer))
+def test_nomis_geography_on_all_layers(geographical_layer):
+    haringey, = read_local_authorities(['Haringey'])
+    codes = haringey.nomis_geography[geographical_layer]
+    assert len(codes) > 0
+    assert ' ' not in codes
+
+
+def test_read_all_local_authorities():
+    names = [local_authority.name for local_authority in read_local_authorities()]
+    assert 'Haringey' in names
+
+
+def test_fails_with_unknown_local_authority():
+    with pytest.raises(ValueError):
+        read_local_authorities(['Gotham'])
+
+
+def test_read_local_authorities_from_own_lookup(tmpdir):
+    path_to_lookup = tmpdir.join('local-authorities.yaml')
+    path_to_lookup.write(
+        "Haringey:\n"
+        "    number-households: 101955\n"
+        "    number-usual-residents: 254926\n"
+        "    nomis-geography:\n"
+        "        OA: \"1254106458...1254107181\"\n"
+        "        LSOA: \"1249904507...1249904648\"\n"
+        "        MSOA: \"1245709222...1245709257\"\n"
+        "        WARD: \"1237320484...1237320502\"\n"
+        "Springfield:\n"
+        "    number-households: 4\n"
+        "    number-usual-residents: 10\n"
+        "    nomis-geography:\n"
+        "        OA: \"1,2,\\\n"
+        "            3...5\"\n"
+        "        LSOA: \"6\"\n"
+        "        MSOA: \"7\"\n"
+        "        WARD: \"8\"\n"
+    )
+    springfield, haringey = read_local_authorities(['Springfield', 'Haringey'],
+                                                   path_to_lookup=str(path_to_lookup))
+    assert springfield.name == 'Springfield'
+    assert springfield.number_households == 4
+    assert springfield.number_usual_residents == 10
+    assert springfield.nomis_geography[GeographicalLayer.OA] == '1,2,3...5'
+    assert haringey.name == 'Haringey'
+    assert haringey.number_households == 101955
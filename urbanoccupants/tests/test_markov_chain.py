@@ -4,10 +4,10 @@ import math
 from io import StringIO
 import random
 
+import numpy as np
 import pandas as pd
 from pandas.util.testing import assert_frame_equal
 import pytest
-import pykov
 
 from urbanoccupants import Activity, WeekMarkovChain
 import urbanoccupants.person as person
@@ -128,6 +128,35 @@ def markov_chain_as_dataframe():
     return df
 
 
+@pytest.fixture
+def random_day_time_series():
+    random_state = np.random.RandomState(2017)
+    time_steps = list(WeekMarkovChain._day_time_step_generator(timedelta(minutes=10)))
+    activities = np.array(list(Activity), dtype=object)
+    return pd.DataFrame(
+        index=time_steps,
+        # few diaries and a dominant activity, so that some activities are missing at some times
+        data=activities[random_state.choice(3, size=(len(time_steps), 20), p=[0.8, 0.15, 0.05])]
+    )
+
+
+def expected_transition_probabilities(day_time_series):
+    # straightforward estimation counting each transition of each time step separately
+    probabilities = []
+    time_steps = list(day_time_series.index)
+    for i, time_step in enumerate(time_steps):
+        current_vector = day_time_series.ix[time_step]
+        next_vector = day_time_series.ix[time_steps[(i + 1) % len(time_steps)]]
+        probabilities.append([
+            [((current_vector == current_state) & (next_vector == next_state)).sum() /
+             (current_vector == current_state).sum()
+             if (current_vector == current_state).any() else 0
+             for next_state in Activity]
+            for current_state in Activity
+        ])
+    return np.array(probabilities)
+
+
 def test_time_step_size(markov_chain):
     assert markov_chain.time_step_size == timedelta(hours=12)
 
@@ -224,3 +253,33 @@ def test_dataframe_representation(markov_chain, markov_chain_as_dataframe):
         check_exact=False,
         check_less_precise=2
     )
+
+
+def test_transition_probabilities_are_estimated_exactly(random_day_time_series):
+    probabilities = WeekMarkovChain._transition_probabilities(
+        WeekMarkovChain._encode_states(random_day_time_series.values)
+    )
+    assert probabilities.shape == (144, 3, 3)
+    np.testing.assert_array_equal(
+        probabilities,
+        expected_transition_probabilities(random_day_time_series)
+    )
+
+
+def test_dense_representation(markov_chain):
+    assert markov_chain.probabilities.shape == (2, 2, 3, 3)
+    np.testing.assert_allclose(
+        markov_chain.probabilities[0, 0], # weekday midnight
+        [[1 / 3, 0, 2 / 3], [0, 0, 0], [0, 0, 0]]
+    )
+    np.testing.assert_allclose(
+        markov_chain.cumulative_probabilities[1, 1], # weekend noon
+        [[1, 1, 1], [0, 0, 0], [1, 1, 1]]
+    )
+
+
+def test_dead_locks_are_added_to_dense_representation(dead_locked_markov_chain):
+    np.testing.assert_array_equal(
+        dead_locked_markov_chain.probabilities[0, 0, 2], # weekday midnight, not at home
+        [0, 0, 1]
+    )
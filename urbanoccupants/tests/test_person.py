@@ -3,7 +3,6 @@ from datetime import datetime, timedelta, time
 from unittest.mock import Mock
 import random
 
-import pykov
 import pytest
 
 from urbanoccupants import Person, Activity, WeekMarkovChain
@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from urbanoccupants import Person, Activity, WeekMarkovChain, PopulationSimulator
+import urbanoccupants.person as person
+
+TIME_STEP_SIZE = timedelta(hours=1)
+INITIAL_TIME = datetime(2017, 3, 10, 0, 0) # Friday, to cover weekdays and weekend
+NUMBER_TIME_STEPS = 24 * 4
+
+
+def random_markov_chain(random_state, number_diaries, p):
+    time_steps = list(WeekMarkovChain._day_time_step_generator(TIME_STEP_SIZE))
+    activities = np.array(list(Activity), dtype=object)
+
+    def random_time_series():
+        return pd.DataFrame(
+            index=time_steps,
+            data=activities[random_state.choice(3, size=(len(time_steps), number_diaries), p=p)]
+        )
+    return WeekMarkovChain(random_time_series(), random_time_series(), TIME_STEP_SIZE)
+
+
+@pytest.fixture
+def markov_chains():
+    random_state = np.random.RandomState(2017)
+    return {
+        11: random_markov_chain(random_state, 30, p=[0.5, 0.3, 0.2]),
+        7: random_markov_chain(random_state, 5, p=[0.1, 0.2, 0.7])
+    }
+
+
+@pytest.fixture
+def people(markov_chains):
+    return pd.DataFrame({
+        'markov_id': [11, 7, 11, 7, 7],
+        'initial_activity': [markov_chains[markov_id].valid_states(INITIAL_TIME)[0]
+                             for markov_id in [11, 7, 11, 7, 7]],
+        'random_seed': [3, 1, 4, 1, 5]
+    })
+
+
+def simulator(markov_chains, people):
+    return PopulationSimulator(
+        markov_chains=markov_chains,
+        markov_ids=people.markov_id,
+        initial_activities=people.initial_activity,
+        random_seeds=people.random_seed,
+        initial_time=INITIAL_TIME,
+        time_step_size=TIME_STEP_SIZE
+    )
+
+
+def trajectories(simulator):
+    activities = [simulator.activities]
+    for _ in range(NUMBER_TIME_STEPS):
+        simulator.step()
+        activities.append(simulator.activities)
+    return np.array(activities)
+
+
+def person_trajectory(markov_chain, initial_activity, random_seed):
+    time_steps = iter(range(NUMBER_TIME_STEPS))
+    single_person = Person(
+        week_markov_chain=markov_chain,
+        initial_activity=initial_activity,
+        number_generator=lambda a, b: person.activity_random_numbers(random_seed,
+                                                                     next(time_steps)),
+        initial_time=INITIAL_TIME,
+        time_step_size=TIME_STEP_SIZE
+    )
+    activities = [single_person.activity]
+    for _ in range(NUMBER_TIME_STEPS):
+        single_person.step()
+        activities.append(single_person.activity)
+    return [person.ACTIVITIES.index(activity) for activity in activities]
+
+
+def test_people_move_like_persons(markov_chains, people):
+    actual = trajectories(simulator(markov_chains, people))
+    for i, single_person in people.iterrows():
+        expected = person_trajectory(markov_chains[single_person.markov_id],
+                                     single_person.initial_activity,
+                                     single_person.random_seed)
+        assert list(actual[:, i]) == expected
+
+
+def test_trajectories_are_independent_of_population(markov_chains, people):
+    population_trajectories = trajectories(simulator(markov_chains, people))
+    single_trajectory = trajectories(simulator(markov_chains, people.iloc[[2]]))
+    np.testing.assert_array_equal(single_trajectory[:, 0], population_trajectories[:, 2])
+
+
+def test_people_with_same_seed_and_chain_move_the_same(markov_chains, people):
+    activities = trajectories(simulator(markov_chains, people))
+    np.testing.assert_array_equal(activities[:, 1], activities[:, 3])
+
+
+def test_occupancy(markov_chains, people):
+    expected_activities = trajectories(simulator(markov_chains, people))
+    occupancy = list(simulator(markov_chains, people).occupancy(NUMBER_TIME_STEPS))
+    assert len(occupancy) == NUMBER_TIME_STEPS
+    for time_step, (time_stamp, counts) in enumerate(occupancy):
+        assert time_stamp == INITIAL_TIME + time_step * TIME_STEP_SIZE
+        np.testing.assert_array_equal(
+            counts,
+            np.bincount(expected_activities[time_step], minlength=len(Activity))
+        )
+
+
+def test_occupancy_per_group(markov_chains, people):
+    groups = [1, 0, 1, 2, 0]
+    for _, counts in simulator(markov_chains, people).occupancy(NUMBER_TIME_STEPS, groups):
+        assert counts.shape == (3, len(Activity))
+        np.testing.assert_array_equal(counts.sum(axis=1), [2, 2, 1])
+
+
+def test_unknown_markov_id_fails(markov_chains, people):
+    people.ix[0, 'markov_id'] = 12
+    with pytest.raises(AssertionError):
+        simulator(markov_chains, people)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from urbanoccupants.rng import RandomStream
+
+
+SEED = 'test-seed'
+
+
+@pytest.fixture
+def stream():
+    return RandomStream(SEED, 'households', 'region1')
+
+
+def test_same_numbers_for_same_key_and_counters(stream):
+    assert (stream.uniform(np.arange(1000)) ==
+            RandomStream(SEED, 'households', 'region1').uniform(np.arange(1000))).all()
+
+
+def test_numbers_do_not_depend_on_order_of_generation(stream):
+    counters = np.arange(1000)
+    reversed_numbers = stream.uniform(counters[::-1])
+    assert (stream.uniform(counters) == reversed_numbers[::-1]).all()
+    assert stream.uniform(42) == stream.uniform(counters)[42]
+
+
+def test_different_streams_have_different_numbers(stream):
+    other_stream = RandomStream(SEED, 'households', 'region2')
+    assert (stream.uniform(np.arange(1000)) != other_stream.uniform(np.arange(1000))).all()
+
+
+def test_counters_are_broadcast(stream):
+    numbers = stream.uniform(np.arange(3)[:, np.newaxis], np.arange(4)[np.newaxis, :])
+    assert numbers.shape == (3, 4)
+    assert numbers[2, 3] == stream.uniform(2, 3)
+    assert numbers[2, 0] != numbers[0, 2]
+
+
+def test_uniform_numbers_are_uniformly_distributed(stream):
+    numbers = stream.uniform(np.arange(100000))
+    assert ((numbers >= 0) & (numbers < 1)).all()
+    assert abs(numbers.mean() - 0.5) < 0.01
+    assert (np.histogram(numbers, bins=10)[0] > 9500).all()
+
+
+def test_integers_are_non_negative(stream):
+    integers = stream.integers(np.arange(10000))
+    assert integers.dtype == np.int64
+    assert (integers >= 0).all()
+    assert len(np.unique(integers)) == 10000
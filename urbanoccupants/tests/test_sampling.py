@@ -0,0 +1,210 @@
+import numpy as np
+import pandas as pd
+from pandas.util.testing import assert_frame_equal
+import pytest
+
+from urbanoccupants.synthpop import sample_households, integerise_households, Household,\
+    HouseholdSampling, sample_citizen, index_seed_members, Citizen, Population, RANDOM_SEED,\
+    household_random_numbers, stream_population
+from urbanoccupants.rng import RandomStream
+
+
+REGION = 'region'
+
+
+@pytest.fixture
+def household_weights():
+    random_state = np.random.RandomState(42)
+    return pd.Series(
+        index=['hh{}'.format(i) for i in range(50)],
+        data=random_state.uniform(0, 10, size=50)
+    )
+
+
+@pytest.fixture
+def seed():
+    household_ids = [(1, 2), (1, 2), (1, 2), (3, 1), (2, 7), (2, 7)]
+    person_ids = [1, 2, 3, 1, 2, 1]
+    return pd.DataFrame(
+        index=pd.MultiIndex.from_arrays([household_ids, person_ids],
+                                        names=['household_id', 'person_id']),
+        data={
+            'markov_id': [10, 11, 12, 13, 14, 15],
+            'initial_activity': ['HOME', 'SLEEP', 'HOME', 'NOT_AT_HOME', 'HOME', 'SLEEP'],
+            'metabolic_heat_gain_active': [140.0, 105.0, 140.0, 140.0, 140.0, 105.0],
+            'metabolic_heat_gain_passive': [70.0, 52.5, 70.0, 70.0, 70.0, 52.5]
+        }
+    )
+
+
+def seed_ids(population):
+    return list(population.household_column('seedId'))
+
+
+def linear_scan(household_weights, random_numbers):
+    cum_norm_hh_weights = (household_weights / household_weights.sum()).cumsum()
+    return [cum_norm_hh_weights[cum_norm_hh_weights >= random_number].index[0]
+            for random_number in random_numbers]
+
+
+def test_same_households_like_linear_scan(household_weights):
+    random_numbers = list(np.random.RandomState(1).uniform(0, 1, size=1000))
+    households = sample_households(
+        (REGION, None, household_weights, random_numbers, list(range(1000)))
+    )
+    assert seed_ids(households) == linear_scan(household_weights, random_numbers)
+
+
+def test_random_numbers_on_boundaries(household_weights):
+    cum_norm_hh_weights = (household_weights / household_weights.sum()).cumsum()
+    random_numbers = [0.0] + list(cum_norm_hh_weights.values[:-1])
+    households = sample_households(
+        (REGION, None, household_weights, random_numbers, list(range(len(random_numbers))))
+    )
+    assert seed_ids(households) == linear_scan(household_weights, random_numbers)
+
+
+def test_households_keep_ids_and_region(household_weights):
+    households = sample_households((REGION, None, household_weights, [0.1, 0.9], [7, 8]))
+    assert list(households.household_column('id')) == [7, 8]
+    assert list(households.household_column('region')) == [REGION, REGION]
+    assert households.number_citizens == 0
+
+
+def test_rounding_beyond_last_weight_maps_to_last_household(household_weights):
+    households = sample_households((REGION, None, household_weights, [1.0], [1]))
+    assert seed_ids(households) == [household_weights.index[-1]]
+
+
+@pytest.mark.parametrize('random_number', [0.0, 0.3, 0.999])
+def test_integerisation_replicates_integer_part_of_weights(household_weights, random_number):
+    number_households = 500
+    households = integerise_households(
+        (REGION, None, household_weights, [random_number] * number_households,
+         list(range(number_households)))
+    )
+    weights = household_weights * number_households / household_weights.sum()
+    counts = pd.Series(seed_ids(households)).value_counts()
+    counts = counts.reindex(household_weights.index).fillna(0)
+    assert households.number_households == number_households
+    assert ((counts - weights).abs() < 1).all()
+
+
+def test_integerisation_of_integer_weights_is_exact():
+    household_weights = pd.Series(index=['hh1', 'hh2', 'hh3'], data=[2.0, 0.0, 3.0])
+    households = integerise_households(
+        (REGION, None, household_weights, [0.5] * 5, [1, 2, 3, 4, 5])
+    )
+    assert seed_ids(households) == ['hh1', 'hh1', 'hh3', 'hh3', 'hh3']
+    assert list(households.household_column('id')) == [1, 2, 3, 4, 5]
+
+
+def test_sampling_modes_are_reproducible(household_weights):
+    random_numbers = list(np.random.RandomState(1).uniform(0, 1, size=100))
+    for sampling in HouseholdSampling:
+        params = (REGION, None, household_weights, random_numbers, list(range(100)))
+        assert_frame_equal(sampling.sample_function(params).households,
+                           sampling.sample_function(params).households)
+
+
+@pytest.mark.parametrize('sampling', HouseholdSampling)
+def test_replicates_equal_separately_sampled_households(household_weights, sampling):
+    random_numbers = np.random.RandomState(1).uniform(0, 1, size=(3, 100))
+    household_ids = list(range(100))
+    replicates = sampling.sample_replicates_function(
+        (REGION, None, household_weights, random_numbers, household_ids)
+    )
+    assert len(replicates) == 3
+    for replicate, replicate_random_numbers in zip(replicates, random_numbers):
+        assert_frame_equal(replicate.households, sampling.sample_function(
+            (REGION, None, household_weights, list(replicate_random_numbers), household_ids)
+        ).households)
+
+
+def iterrows_citizens(households, seed):
+    return pd.DataFrame([
+        Citizen(householdId=household.id,
+                markovId=row.markov_id,
+                initialActivity=row.initial_activity,
+                activeMetabolicRate=row.metabolic_heat_gain_active,
+                passiveMetabolicRate=row.metabolic_heat_gain_passive,
+                randomSeed=RandomStream(RANDOM_SEED, 'citizens').integers(household.id,
+                                                                         occupant_id))
+        for household in households
+        for occupant_id, (_, row) in enumerate(seed[[
+            household_id == household.seedId
+            for household_id in seed.index.get_level_values(0)
+        ]].iterrows())
+    ])
+
+
+def population_of(households):
+    return Population.from_households(
+        REGION,
+        [household.id for household in households],
+        [household.seedId for household in households]
+    )
+
+
+def test_same_citizens_like_iterrows(seed):
+    households = [Household(id=i, seedId=seed_id, region=REGION)
+                  for i, seed_id in enumerate([(2, 7), (1, 2), (3, 1), (2, 7)], start=5)]
+    population = sample_citizen((population_of(households), index_seed_members(seed)))
+    assert_frame_equal(population.citizens, iterrows_citizens(households, seed),
+                       check_dtype=False)
+
+
+def test_sample_citizen_from_seed_dataframe(seed):
+    households = [Household(id=1, seedId=(3, 1), region=REGION)]
+    population = sample_citizen((population_of(households), seed))
+    assert_frame_equal(population.citizens, iterrows_citizens(households, seed),
+                       check_dtype=False)
+
+
+def test_sample_citizen_of_no_households(seed):
+    population = sample_citizen((population_of([]), index_seed_members(seed)))
+    assert population.number_households == 0
+    assert population.number_citizens == 0
+
+
+def test_concatenated_population_keeps_households_and_citizens(seed):
+    populations = [
+        sample_citizen((population_of([Household(id=1, seedId=(3, 1), region=REGION)]), seed)),
+        sample_citizen((population_of([Household(id=2, seedId=(1, 2), region=REGION)]), seed))
+    ]
+    population = Population.concat(populations)
+    assert population.number_households == 2
+    assert population.number_citizens == 4
+    assert list(population.household_column('id')) == [1, 2]
+    assert seed_ids(population) == [(3, 1), (1, 2)]
+    assert list(population.citizen_column('householdId')) == [1, 2, 2, 2]
+    assert list(population.households.columns) == list(Household._fields)
+    assert list(population.citizens.columns) == list(Citizen._fields)
+
+
+def test_household_random_numbers_are_independent_of_other_regions():
+    random_numbers = household_random_numbers(RANDOM_SEED, 'region1', 100, replicates=2)
+    household_random_numbers(RANDOM_SEED, 'region2', 100, replicates=2)
+    assert random_numbers.shape == (2, 100)
+    assert (random_numbers == household_random_numbers(RANDOM_SEED, 'region1', 100, 2)).all()
+    assert (random_numbers[:, :10] == household_random_numbers(RANDOM_SEED, 'region1', 10, 2)).all()
+    assert (random_numbers != household_random_numbers(RANDOM_SEED, 'region2', 100, 2)).all()
+
+
+@pytest.mark.parametrize('chunk_size,expected_chunk_sizes', [
+    (1, [1, 2, 3]),
+    (2, [3, 3]),
+    (3, [3, 3]),
+    (10, [6])
+])
+def test_stream_population_in_chunks(seed, chunk_size, expected_chunk_sizes):
+    seed_ids = [(3, 1), (1, 2), (2, 7), (3, 1), (1, 2), (2, 7)]
+    households = [population_of([Household(id=i + 1, seedId=seed_ids[i], region=REGION)
+                                 for i in range(start, stop)])
+                  for start, stop in [(0, 1), (1, 3), (3, 6)]]
+    chunks = list(stream_population(iter(households), index_seed_members(seed), chunk_size))
+    assert [chunk.number_households for chunk in chunks] == expected_chunk_sizes
+    assert_frame_equal(
+        Population.concat(chunks).citizens,
+        sample_citizen((Population.concat(households), seed)).citizens
+    )
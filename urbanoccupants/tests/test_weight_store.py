@@ -0,0 +1,125 @@
+from multiprocessing.dummy import Pool as ThreadPool
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from pandas.util.testing import assert_series_equal
+import pytest
+
+import urbanoccupants.synthpop as synthpop
+from urbanoccupants.synthpop import run_hipf_batch, WeightStore, ControlCube
+from urbanoccupants.hipf import _encode_reference_sample, _all_residuals_encoded
+
+
+RESOURCES_PATH = Path(__file__).parent / 'resources'
+PATH_TO_REFERENCE_SAMPLE = RESOURCES_PATH / 'two_controls_reference_sample.csv'
+REGIONS = ['region1', 'region2']
+
+
+@pytest.fixture
+def seed():
+    sample = pd.read_csv(PATH_TO_REFERENCE_SAMPLE)
+    return sample.set_index(['HHNR', 'PNR'])
+
+
+@pytest.fixture
+def controls_households():
+    return {'CAR': pd.DataFrame(index=REGIONS, data={0: [99, 198], 1: [273, 546]})}
+
+
+@pytest.fixture
+def controls_individuals():
+    return {
+        'WKSTAT': pd.DataFrame(index=REGIONS, data={0: [395, 800], 1: [459, 908]}),
+        'GENDER': pd.DataFrame(index=REGIONS, data={'X': [434, 840], 'Y': [420, 868]})
+    }
+
+
+@pytest.fixture
+def weight_store(tmpdir):
+    return WeightStore(str(tmpdir))
+
+
+@pytest.fixture
+def fitted_regions(monkeypatch):
+    fitted_regions = []
+    fit_hipf_batch = synthpop.fit_hipf_batch
+
+    def fit_and_log(**kwargs):
+        fitted_regions.extend(list(kwargs['controls_households'].values())[0].index)
+        return fit_hipf_batch(**kwargs)
+    monkeypatch.setattr(synthpop, 'fit_hipf_batch', fit_and_log)
+    return fitted_regions
+
+
+def test_unchanged_regions_are_not_fitted_again(seed, controls_households, controls_individuals,
+                                                weight_store, fitted_regions):
+    weights = run_hipf_batch(seed, controls_households, controls_individuals, weight_store)
+    cached_weights = run_hipf_batch(seed, controls_households, controls_individuals,
+                                    weight_store)
+    assert fitted_regions == REGIONS
+    for region in REGIONS:
+        assert_series_equal(weights[region], cached_weights[region])
+
+
+def test_changed_regions_are_fitted_again(seed, controls_households, controls_individuals,
+                                          weight_store, fitted_regions):
+    run_hipf_batch(seed, controls_households, controls_individuals, weight_store)
+    controls_individuals['GENDER'].ix['region2', 'X'] = 850
+    controls_individuals['GENDER'].ix['region2', 'Y'] = 858
+    run_hipf_batch(seed, controls_households, controls_individuals, weight_store)
+    assert fitted_regions == REGIONS + ['region2']
+
+
+def test_warm_started_fit_meets_controls(seed, controls_households, controls_individuals,
+                                         weight_store):
+    run_hipf_batch(seed, controls_households, controls_individuals, weight_store)
+    controls_individuals['GENDER'].ix['region2', 'X'] = 850
+    controls_individuals['GENDER'].ix['region2', 'Y'] = 858
+    weights = run_hipf_batch(seed, controls_households, controls_individuals, weight_store)
+    sample = _encode_reference_sample(
+        seed,
+        {name: controls.ix[['region2'], :] for name, controls in controls_individuals.items()},
+        {name: controls.ix[['region2'], :] for name, controls in controls_households.items()}
+    )
+    residuals = _all_residuals_encoded(sample, weights['region2'].values[np.newaxis, :])
+    assert abs(residuals).max() < 0.001
+
+
+def test_report_marks_cached_regions(seed, controls_households, controls_individuals,
+                                     weight_store, tmpdir):
+    path_to_report = Path(str(tmpdir)) / 'report.csv'
+    run_hipf_batch(seed, controls_households, controls_individuals, weight_store)
+    controls_individuals['GENDER'].ix['region2', 'X'] = 850
+    controls_individuals['GENDER'].ix['region2', 'Y'] = 858
+    run_hipf_batch(seed, controls_households, controls_individuals, weight_store,
+                   path_to_report=path_to_report)
+    report = pd.read_csv(str(path_to_report), index_col=0)
+    assert list(report.index) == REGIONS
+    assert list(report['cached']) == [True, False]
+    assert report.ix['region2', 'iterations'] > 0
+    assert report.ix['region2', 'max_residual'] < 0.0001 or \
+        report.ix['region2', 'max_weight_change'] < 0.0001
+    assert (abs(report['household deviation']) < 0.1).all()
+
+
+def test_control_cubes_give_same_weights(seed, controls_households, controls_individuals):
+    weights = run_hipf_batch(seed, controls_households, controls_individuals)
+    cube_weights = run_hipf_batch(
+        seed,
+        ControlCube.from_census_data(controls_households),
+        ControlCube.from_census_data(controls_individuals)
+    )
+    for region in REGIONS:
+        assert_series_equal(weights[region], cube_weights[region])
+
+
+def test_batches_in_pool_give_same_weights(seed, controls_households, controls_individuals,
+                                           fitted_regions):
+    weights = run_hipf_batch(seed, controls_households, controls_individuals)
+    with ThreadPool(2) as pool:
+        batch_weights = run_hipf_batch(seed, controls_households, controls_individuals,
+                                       pool=pool, number_batches=2)
+    assert sorted(fitted_regions) == sorted(REGIONS * 2)
+    for region in REGIONS:
+        assert_series_equal(weights[region], batch_weights[region])
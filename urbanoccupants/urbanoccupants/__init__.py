@@ -1,7 +1,7 @@
-from .person import Person, Activity, WeekMarkovChain
+from .person import Person, Activity, WeekMarkovChain, PopulationSimulator
 from .census import GeographicalLayer
-from .synthpop import PeopleFeature, HouseholdFeature, feature_id
+from .synthpop import PeopleFeature, HouseholdFeature, HouseholdSampling, feature_id
 from .version import __version__
 from .utils import read_simulation_config
 from .datamodel import MARKOV_CHAIN_INDEX_TABLE_NAME, DWELLINGS_TABLE_NAME, PEOPLE_TABLE_NAME, \
-    ENVIRONMENT_TABLE_NAME, PARAMETERS_TABLE_NAME
+    ENVIRONMENT_TABLE_NAME, PARAMETERS_TABLE_NAME, GOODNESS_OF_FIT_TABLE_NAME
@@ -6,16 +6,25 @@ For definitions of any of the terms see [the original glossary]
 
 Census data is retrieved from nomis, see https://www.nomisweb.co.uk.
 """
+from collections import namedtuple, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from enum import Enum
+import functools
+import hashlib
 import io
+import os
 from pathlib import Path
 import tempfile
+import threading
 import zipfile
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 import numpy as np
 import pandas as pd
 import geopandas as gpd
+import yaml
 
 from .types import AgeStructure, EconomicActivity, Qualification, HouseholdType, Pseudo
 
@@ -23,36 +32,15 @@ NOMIS_KS102EW_DATASET_ID = "NM_145_1"
 NOMIS_QS116EW_DATASET_ID = "NM_516_1"
 NOMIS_KS501EW_DATASET_ID = "NM_623_1"
 NOMIS_KS601EW_DATASET_ID = "NM_624_1"
-# the following are nomis geography codes for Haringey on different layer
-NOMIS_WARD_GEOGRAPHY = "1237319929...1237319939,1237319941,1237319940,1237319942...1237319947"
-NOMIS_MSOA_GEOGRPAHY = "1245708671...1245708705,1245714941"
-NOMIS_LSOA_GEOGRAPHY = ("1249904514,1249904516,1249904519,1249904520,1249904579,1249904580," +
-                        "1249904582,1249904583,1249904507,1249904515,1249904517,1249904518," +
-                        "1249904633,1249904636,1249904639,1249904640,1249904634,1249904635," +
-                        "1249904637,1249904638,1249904641,1249904644,1249904645,1249904648," +
-                        "1249904642,1249904643,1249904646,1249904647,1249904508...1249904511," +
-                        "1249904571,1249904572,1249904576,1249904577,1249904521...1249904524," +
-                        "1249904617,1249904620,1249904622,1249904624,1249904625,1249904629," +
-                        "1249904631,1249904632,1249904512,1249904513,1249904541,1249904542," +
-                        "1249904618,1249904619,1249904621,1249904623,1249904570," +
-                        "1249904573...1249904575,1249904536...1249904538,1249904540," +
-                        "1249904525...1249904528,1249904626...1249904628,1249904630,1249904558," +
-                        "1249904559,1249904562,1249934828,1249934829,1249904564,1249904566," +
-                        "1249904567,1249904569,1249904557,1249904563,1249904565,1249904568," +
-                        "1249904543,1249904544,1249904548,1249904549,1249904610,1249904612," +
-                        "1249904613,1249904616,1249904609,1249904611,1249904614,1249904615," +
-                        "1249904586,1249904588,1249904589,1249904592,1249904585,1249904587," +
-                        "1249904590,1249904591,1249904560,1249904561,1249904602,1249904603," +
-                        "1249904593...1249904595,1249904598,1249904539,1249904553,1249904555," +
-                        "1249904556,1249904545...1249904547,1249904601,1249904596,1249904597," +
-                        "1249904599,1249904600,1249904529,1249904530,1249904532,1249904534," +
-                        "1249904531,1249904533,1249904535,1249904605,1249904550...1249904552," +
-                        "1249904554,1249904604,1249904606...1249904608,1249904578,1249904581," +
-                        "1249904584,1249934354")
-NOMIS_OA_GEOGRAPHY = "1254106458...1254107181,1254258316,1254262366...1254262393"
 NOMIS_GEOGRAPHY_CODE_COLUMN_NAME = "GEOGRAPHY_CODE"
 NOMIS_VALUE_NAME_COLUMN_NAME = "CELL_NAME"
 NOMIS_VALUE_COLUMN_NAME = "OBS_VALUE"
+NOMIS_API_URL = "https://www.nomisweb.co.uk/api/v01"
+NOMIS_MAX_CONCURRENT_REQUESTS = 8
+NOMIS_MAX_RETRIES = 5
+NOMIS_RETRY_BACKOFF_FACTOR = 0.5 # [s], doubles with each retry
+NOMIS_RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+CENSUS_MEMO_SIZE = 32 # the number of census data sets kept in memory per process
 
 LONDON_BOUNDARY_FILE_URL = ('https://files.datapress.com/london/dataset/statistical-gis-boundary-'
                             'files-london/2016-10-03T13:52:28/statistical-gis-boundaries-'
@@ -67,23 +55,221 @@ WARD_ID_COLUMN_NAME = 'GSS_CODE'
 MSOA_ID_COLUMN_NAME = 'MSOA11CD'
 LSOA_ID_COLUMN_NAME = 'LSOA11CD'
 OA_ID_COLUMN_NAME = 'OA11CD'
+LOCAL_AUTHORITY_LOOKUP_PATH = Path(__file__).parent / 'local-authorities.yaml'
+DEFAULT_LOCAL_AUTHORITY = 'Haringey'
 
 
 class GeographicalLayer(Enum):
     """The geographical layer at which census data should be retrieved."""
-    OA = (NOMIS_OA_GEOGRAPHY, OA_SHAPE_FILE_PATH, BOROUGH_ID_COLUMN_NAME, OA_ID_COLUMN_NAME)
-    LSOA = (NOMIS_LSOA_GEOGRAPHY, LSOA_SHAPE_FILE_PATH, BOROUGH_ID_COLUMN_NAME, LSOA_ID_COLUMN_NAME)
-    MSOA = (NOMIS_MSOA_GEOGRPAHY, MSOA_SHAPE_FILE_PATH, BOROUGH_ID_COLUMN_NAME, MSOA_ID_COLUMN_NAME)
-    WARD = (NOMIS_WARD_GEOGRAPHY, WARD_SHAPE_FILE_PATH, BOROUGH_ID_IN_WARD_DATA_SET,
-            WARD_ID_COLUMN_NAME)
-
-    def __init__(self, nomis_geo_codes, shape_file_path, borough_col_name, index_col_name):
-        self.nomis_geo_codes = nomis_geo_codes
+    OA = (OA_SHAPE_FILE_PATH, BOROUGH_ID_COLUMN_NAME, OA_ID_COLUMN_NAME)
+    LSOA = (LSOA_SHAPE_FILE_PATH, BOROUGH_ID_COLUMN_NAME, LSOA_ID_COLUMN_NAME)
+    MSOA = (MSOA_SHAPE_FILE_PATH, BOROUGH_ID_COLUMN_NAME, MSOA_ID_COLUMN_NAME)
+    WARD = (WARD_SHAPE_FILE_PATH, BOROUGH_ID_IN_WARD_DATA_SET, WARD_ID_COLUMN_NAME)
+
+    def __init__(self, shape_file_path, borough_col_name, index_col_name):
         self.shape_file_path = shape_file_path
         self.borough_col_name = borough_col_name
         self.index_col_name = index_col_name
 
 
+LocalAuthority = namedtuple(
+    'LocalAuthority',
+    ['name', 'nomis_geography', 'number_households', 'number_usual_residents']
+)
+LocalAuthority.__doc__ = """A local authority, e.g. a London borough, as defined in the lookup.
+
+The nomis geography is a dict from `GeographicalLayer` to the nomis geography codes of all areas
+of the local authority on that layer.
+"""
+
+
+def read_local_authorities(names=None, path_to_lookup=LOCAL_AUTHORITY_LOOKUP_PATH):
+    """Reads local authorities from a local lookup file.
+
+    Parameters:
+        * names:          the names of the local authorities to read, all if None (optional)
+        * path_to_lookup: the path to the lookup file (optional, default: the lookup shipped
+                          with this package)
+
+    Returns:
+        a list of `LocalAuthority`s, in the order of the given names
+    """
+    with open(str(path_to_lookup), 'r') as lookup_file:
+        lookup = yaml.safe_load(lookup_file)
+    if names is None:
+        names = sorted(lookup.keys())
+    unknown_names = [name for name in names if name not in lookup]
+    if unknown_names:
+        raise ValueError("Unknown local authorities {}. Known are: {}.".format(
+            unknown_names, sorted(lookup.keys())
+        ))
+    return [LocalAuthority(
+        name=name,
+        nomis_geography={GeographicalLayer[layer]: codes
+                         for layer, codes in lookup[name]['nomis-geography'].items()},
+        number_households=lookup[name]['number-households'],
+        number_usual_residents=lookup[name]['number-usual-residents']
+    ) for name in names]
+
+
+def _local_authority(local_authority):
+    if local_authority is None:
+        return read_local_authorities([DEFAULT_LOCAL_AUTHORITY])[0]
+    return local_authority
+
+
+NomisTable = namedtuple('NomisTable', ['dataset_id', 'value_name_column', 'parameters'])
+NomisTable.__doc__ = """A census table of nomis, identified by its dataset and query parameters.
+
+The value name column is the column of the nomis data set that names the values, e.g. the age
+groups of the age structure table.
+"""
+NOMIS_KS102EW_TABLE = NomisTable(NOMIS_KS102EW_DATASET_ID, NOMIS_VALUE_NAME_COLUMN_NAME, "")
+NOMIS_QS116EW_TABLE = NomisTable(NOMIS_QS116EW_DATASET_ID, "C_AHTHUK11_NAME", "")
+NOMIS_KS501EW_TABLE = NomisTable(NOMIS_KS501EW_DATASET_ID, NOMIS_VALUE_NAME_COLUMN_NAME, "")
+NOMIS_KS601EW_TABLE = NomisTable(NOMIS_KS601EW_DATASET_ID, NOMIS_VALUE_NAME_COLUMN_NAME,
+                                 "&c_sex=0")
+
+
+class CensusStore():
+    """A persistent store of census tables retrieved from nomis.
+
+    Tables are stored parsed and pivoted, with geography codes as index and value names as
+    columns. They are keyed by a hash of the dataset, the geography, and the query parameters,
+    hence a table is retrieved from nomis only once for any geography.
+
+    In offline mode, the store never accesses the network and fails for tables it does not
+    contain.
+
+    The store is thread-safe. All requests share a pool of connections and are retried with
+    exponential backoff when nomis is unavailable. Concurrent requests for the same table are
+    sent only once, see `read_concurrently`.
+
+    Given a lookup of the areas of all OAs, tables of all geographical layers are aggregated
+    from OA tables, see `aggregate_oa_data`. Hence, tables are retrieved only once for all
+    layers.
+
+    Parameters:
+        * path:          the directory in which tables are stored (optional, default: tables
+                         are not stored and hence retrieved every time)
+        * offline:       whether the network must not be accessed (optional, default: False)
+        * nomis_api_url: the base url of the nomis API (optional), e.g. of a
+                         `urbanoccupants.nomisstandin.NomisStandIn`
+        * oa_lookup:     a DataFrame with OAs as index and the areas of each layer as columns,
+                         named like the `GeographicalLayer`, e.g. from `GeometryStore.oa_lookup`
+                         (optional, default: tables of all layers are retrieved separately)
+    """
+
+    def __init__(self, path=None, offline=False, nomis_api_url=NOMIS_API_URL, oa_lookup=None):
+        assert not (offline and path is None), "An offline store needs a path."
+        self.__path = Path(path) if path is not None else None
+        self.__offline = offline
+        self.__nomis_api_url = nomis_api_url
+        self.__oa_lookup = oa_lookup
+        self.__session = requests.Session()
+        self.__session.mount(nomis_api_url, HTTPAdapter(
+            pool_maxsize=NOMIS_MAX_CONCURRENT_REQUESTS,
+            max_retries=Retry(
+                total=NOMIS_MAX_RETRIES,
+                backoff_factor=NOMIS_RETRY_BACKOFF_FACTOR,
+                status_forcelist=NOMIS_RETRY_STATUS_CODES
+            )
+        ))
+        self.__in_flight = {}
+        self.__lock = threading.Lock()
+
+    def __getstate__(self):
+        # sessions and locks cannot be shared with other processes
+        return self.__path, self.__offline, self.__nomis_api_url, self.__oa_lookup
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def layer_table(self, nomis_table, geographical_layer, local_authority=None):
+        """Returns a census table of a local authority on a geographical layer.
+
+        Parameters:
+            * nomis_table:        the `NomisTable` to retrieve
+            * geographical_layer: the layer of the table
+            * local_authority:    the `LocalAuthority` of the table (optional, default: Haringey)
+
+        Returns:
+            a DataFrame with the areas of the layer as index and value names as columns
+        """
+        if not self.aggregates_from_oa(geographical_layer):
+            return self.table(nomis_table, _nomis_geography(geographical_layer, local_authority))
+        oa_table = self.table(nomis_table, _nomis_geography(GeographicalLayer.OA, local_authority))
+        return aggregate_oa_data(oa_table, self.__oa_lookup[geographical_layer.name])
+
+    def aggregates_from_oa(self, geographical_layer):
+        """Returns whether tables of the layer are aggregated from OA tables."""
+        return self.__oa_lookup is not None and geographical_layer != GeographicalLayer.OA
+
+    def table(self, nomis_table, geography):
+        """Returns a census table for a nomis geography.
+
+        Parameters:
+            * nomis_table: the `NomisTable` to retrieve
+            * geography:   the nomis geography codes of the areas to retrieve
+
+        Returns:
+            a DataFrame with geography codes as index and value names as columns
+        """
+        key = (nomis_table, geography)
+        with self.__lock:
+            in_flight = self.__in_flight.get(key)
+            is_first_request = in_flight is None
+            if is_first_request:
+                in_flight = self.__in_flight[key] = Future()
+        if not is_first_request:
+            return in_flight.result()
+        try:
+            in_flight.set_result(self._table(nomis_table, geography))
+        except Exception as exception:
+            in_flight.set_exception(exception)
+        finally:
+            with self.__lock:
+                del self.__in_flight[key]
+        return in_flight.result()
+
+    def _table(self, nomis_table, geography):
+        path_to_table = self._path_to_table(nomis_table, geography)
+        if path_to_table is not None and path_to_table.exists():
+            return pd.read_pickle(path_to_table.as_posix())
+        if self.__offline:
+            raise IOError("Census table {} for geography {} is not stored, but the census store "
+                          "is offline.".format(nomis_table.dataset_id, geography))
+        r = self.__session.get(self._url(nomis_table, geography))
+        r.raise_for_status()
+        df = pd.read_csv(io.BytesIO(r.content)).pivot(
+            index=NOMIS_GEOGRAPHY_CODE_COLUMN_NAME,
+            columns=nomis_table.value_name_column,
+            values=NOMIS_VALUE_COLUMN_NAME
+        ).astype(np.int64)
+        if path_to_table is not None:
+            _to_pickle(df, path_to_table)
+        return df
+
+    def _url(self, nomis_table, geography):
+        return ("{}/dataset/{}.data.csv" +
+                "?date=latest&geography={}&rural_urban=0&measures=20100{}" +
+                "&select=geography_code,{},obs_value").format(
+                    self.__nomis_api_url,
+                    nomis_table.dataset_id,
+                    geography,
+                    nomis_table.parameters,
+                    nomis_table.value_name_column.lower()
+                )
+
+    def _path_to_table(self, nomis_table, geography):
+        if self.__path is None:
+            return None
+        sha = hashlib.sha256()
+        sha.update(str(tuple(nomis_table)).encode())
+        sha.update(geography.encode())
+        return self.__path / '{}-{}.pickle'.format(nomis_table.dataset_id, sha.hexdigest())
+
+
 AGE_STRUCTURE_MAP = {
     "Age 0 to 4": AgeStructure.AGE_0_TO_4,
     "Age 5 to 7": AgeStructure.AGE_5_TO_7,
@@ -155,122 +341,340 @@ HOUSEHOLDTYPE_MAP = {
 }
 
 
-def read_haringey_shape_file(geographical_layer=GeographicalLayer.LSOA):
-    """Reads shape file of Haringey from London Data Store.
+def aggregate_oa_data(oa_data, oa_lookup):
+    """Aggregates census data of OAs to areas of a higher geographical layer.
+
+    Parameters:
+        * oa_data:   census data with OAs as index
+        * oa_lookup: a Series with OAs as index and their areas on the higher layer as values
+
+    Returns:
+        census data with the areas as index
+    """
+    areas = oa_lookup.ix[oa_data.index]
+    assert areas.notnull().all(), "Areas of OAs are missing in the lookup."
+    data = oa_data.groupby(areas.values).sum()
+    data.index.name = oa_data.index.name
+    return data
+
+
+class GeometryStore():
+    """A persistent store of the boundary geometries of London from the London Data Store.
+
+    The boundary files are downloaded once. Each geographical layer is extracted and read once,
+    and split into the geometries of single local authorities, which are stored separately.
+    Hence, reading the geometries of a local authority reads neither the boundary files nor
+    the geometries of other local authorities.
 
-    Make sure to use requests_cache to cache the retrieved data.
+    Parameters:
+        * path: the directory in which geometries are stored
     """
+
+    def __init__(self, path):
+        self.__path = Path(path)
+
+    def geometries(self, geographical_layer, local_authorities):
+        """Returns the geometries of local authorities on a geographical layer.
+
+        Parameters:
+            * geographical_layer: the layer of the geometries
+            * local_authorities:  a list of `LocalAuthority`s whose geometries to read
+
+        Returns:
+            a GeoDataFrame with the ids of the layer as index
+        """
+        if not self._path_to_layer(geographical_layer).exists():
+            self._split_layer(geographical_layer)
+        paths = [self._path_to_layer(geographical_layer) / '{}.pickle'.format(local_authority.name)
+                 for local_authority in local_authorities]
+        missing = [local_authority.name for local_authority, path in zip(local_authorities, paths)
+                   if not path.exists()]
+        if missing:
+            raise ValueError("There are no {} geometries of {}.".format(geographical_layer.name,
+                                                                         missing))
+        return pd.concat([pd.read_pickle(path.as_posix()) for path in paths])
+
+    def oa_lookup(self):
+        """Returns the LSOA, MSOA, and ward of each OA in London.
+
+        LSOAs and MSOAs are taken from the attributes of the OAs. Wards are those which contain
+        a representative point of the OAs, hence OAs that are not within any ward have none.
+
+        Returns:
+            a DataFrame with OAs as index and the layers LSOA, MSOA, and WARD as columns
+        """
+        path_to_lookup = self.__path / 'oa-lookup.pickle'
+        if not path_to_lookup.exists():
+            _to_pickle(self._create_oa_lookup(), path_to_lookup)
+        return pd.read_pickle(path_to_lookup.as_posix())
+
+    def _create_oa_lookup(self):
+        oas = self._layer(GeographicalLayer.OA)
+        wards = self._layer(GeographicalLayer.WARD)
+        oa_points = gpd.GeoDataFrame(geometry=oas.representative_point(), index=oas.index,
+                                     crs=oas.crs)
+        oa_wards = gpd.sjoin(oa_points, wards[['geometry']], how='left', op='within')
+        oa_wards = oa_wards[~oa_wards.index.duplicated(keep='first')]['index_right']
+        lookup = pd.DataFrame(
+            index=oas.index,
+            data={
+                GeographicalLayer.LSOA.name: oas[LSOA_ID_COLUMN_NAME],
+                GeographicalLayer.MSOA.name: oas[MSOA_ID_COLUMN_NAME],
+                GeographicalLayer.WARD.name: oa_wards
+            },
+            columns=[layer.name for layer in [GeographicalLayer.LSOA, GeographicalLayer.MSOA,
+                                              GeographicalLayer.WARD]]
+        )
+        lookup.index.name = OA_ID_COLUMN_NAME
+        return lookup
+
+    def _layer(self, geographical_layer):
+        if not self._path_to_layer(geographical_layer).exists():
+            self._split_layer(geographical_layer)
+        return pd.concat([pd.read_pickle(path.as_posix())
+                          for path in sorted(self._path_to_layer(geographical_layer).iterdir())])
+
+    def _split_layer(self, geographical_layer):
+        path_to_zip = self.__path / Path(LONDON_BOUNDARY_FILE_URL).name
+        if not path_to_zip.exists():
+            self.__path.mkdir(parents=True, exist_ok=True)
+            _to_bytes_file(_download_boundary_files(), path_to_zip)
+        data = _read_boundary_file(path_to_zip.read_bytes(), geographical_layer)
+        path_to_tmp_layer = self._path_to_layer(geographical_layer).with_suffix(
+            '.{}.tmp'.format(os.getpid())
+        )
+        path_to_tmp_layer.mkdir(parents=True, exist_ok=True)
+        for borough, borough_data in data.groupby(geographical_layer.borough_col_name):
+            _to_pickle(borough_data, path_to_tmp_layer / '{}.pickle'.format(borough))
+        os.replace(path_to_tmp_layer.as_posix(),
+                   self._path_to_layer(geographical_layer).as_posix())
+
+    def _path_to_layer(self, geographical_layer):
+        return self.__path / geographical_layer.name
+
+
+def _download_boundary_files():
     r = requests.get(LONDON_BOUNDARY_FILE_URL)
-    z = zipfile.ZipFile(io.BytesIO(r.content))
-    with tempfile.TemporaryDirectory(prefix='london-boundary-files') as tmpdir:
-        z.extractall(path=tmpdir)
-        shape_file = Path(tmpdir) / geographical_layer.shape_file_path
-        data = gpd.read_file(shape_file.as_posix())
-    data = data[data[geographical_layer.borough_col_name] == 'Haringey']
+    r.raise_for_status()
+    return r.content
+
+
+def _read_boundary_file(boundary_files, geographical_layer):
+    # extracts and reads only the files of the layer's shape file
+    shape_file_path = geographical_layer.shape_file_path
+    with zipfile.ZipFile(io.BytesIO(boundary_files)) as z,\
+            tempfile.TemporaryDirectory(prefix='london-boundary-files') as tmpdir:
+        z.extractall(path=tmpdir, members=[
+            member for member in z.namelist()
+            if Path(member).with_suffix('') == shape_file_path.with_suffix('')
+        ])
+        data = gpd.read_file((Path(tmpdir) / shape_file_path).as_posix())
     return data.set_index(geographical_layer.index_col_name)
 
 
-def read_age_structure_data(geographical_layer=GeographicalLayer.LSOA):
-    """Retrieves age structure date from Census 2011 for Haringey.
+def _to_pickle(obj, path):
+    # writing to a temporary file first ensures that concurrent processes never read partially
+    # written files
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path_to_tmp = path.with_suffix('.{}.tmp'.format(os.getpid()))
+    pd.to_pickle(obj, path_to_tmp.as_posix())
+    os.replace(path_to_tmp.as_posix(), path.as_posix())
+
+
+def _to_bytes_file(content, path):
+    path_to_tmp = path.with_suffix('.{}.tmp'.format(os.getpid()))
+    path_to_tmp.write_bytes(content)
+    os.replace(path_to_tmp.as_posix(), path.as_posix())
+
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _memoized(census_read_function):
+    # memoizes census data in this process, keyed by read function, nomis geography, and
+    # whether the data is aggregated from OA data, and returns copies so that callers cannot
+    # alter the memoized data
+    @functools.wraps(census_read_function)
+    def memoized_census_read_function(geographical_layer=GeographicalLayer.LSOA,
+                                      local_authority=None, census_store=None):
+        key = (census_read_function.__name__,
+               _nomis_geography(geographical_layer, local_authority),
+               census_store is not None and census_store.aggregates_from_oa(geographical_layer))
+        with _memo_lock:
+            data = _memo.get(key)
+            if data is not None:
+                _memo.move_to_end(key)
+        if data is None:
+            data = census_read_function(geographical_layer, local_authority, census_store)
+            with _memo_lock:
+                _memo[key] = data
+                while len(_memo) > CENSUS_MEMO_SIZE:
+                    _memo.popitem(last=False)
+        return data.copy()
+    return memoized_census_read_function
+
+
+def clear_memo():
+    """Removes all census data memoized in this process.
+
+    Census data is memoized by the `read_*_data` functions of this module, so that each data set
+    is read at most once per process. The memoized data does not depend on the `CensusStore`
+    it has been read from, other than on whether the store aggregates the data from OA data.
+    """
+    with _memo_lock:
+        _memo.clear()
+
+
+def read_shape_file(geographical_layer=GeographicalLayer.LSOA, local_authorities=None,
+                    geometry_store=None):
+    """Reads shape file of local authorities from London Data Store.
+
+    Without a `GeometryStore`, the boundary files are downloaded on every call.
+
+    Parameters:
+        * geographical_layer: the layer of the shapes
+        * local_authorities:  a list of `LocalAuthority`s whose shapes to read (optional,
+                              default: Haringey)
+        * geometry_store:     the `GeometryStore` to read from (optional)
+    """
+    if local_authorities is None:
+        local_authorities = [_local_authority(None)]
+    if geometry_store is not None:
+        return geometry_store.geometries(geographical_layer, local_authorities)
+    data = _read_boundary_file(_download_boundary_files(), geographical_layer)
+    names = [local_authority.name for local_authority in local_authorities]
+    return data[data[geographical_layer.borough_col_name].isin(names)]
+
+
+@_memoized
+def read_age_structure_data(geographical_layer=GeographicalLayer.LSOA, local_authority=None,
+                            census_store=None):
+    """Retrieves age structure date from Census 2011 for a local authority.
 
     Data is taken from the KS102EW table from the UK Census 2011.
     Data is retrieved from nomis, see https://www.nomisweb.co.uk.
+    Without a `LocalAuthority`, data is retrieved for Haringey. Without a `CensusStore`, data
+    is retrieved from nomis without being stored.
     """
-    url = ("https://www.nomisweb.co.uk/api/v01/dataset/{}.data.csv" +
-           "?date=latest&geography={}&rural_urban=0&measures=20100" +
-           "&select=geography_code,cell_name,obs_value").format(NOMIS_KS102EW_DATASET_ID,
-                                                                geographical_layer.nomis_geo_codes)
-    r = requests.get(url)
-    df = pd.read_csv(io.BytesIO(r.content))
-    df = df.pivot(
-        index='GEOGRAPHY_CODE',
-        columns='CELL_NAME',
-        values='OBS_VALUE'
-    )[list(AGE_STRUCTURE_MAP.keys())].astype(np.int64)
+    df = _census_store(census_store).layer_table(
+        NOMIS_KS102EW_TABLE,
+        geographical_layer,
+        local_authority
+    )[list(AGE_STRUCTURE_MAP.keys())]
     df = df.rename(columns=AGE_STRUCTURE_MAP).groupby(lambda x: x, axis=1).sum()
     return df
 
 
-def read_household_type_data(geographical_layer=GeographicalLayer.LSOA):
-    """Retrieves household type date from Census 2011 for Haringey.
+@_memoized
+def read_household_type_data(geographical_layer=GeographicalLayer.LSOA, local_authority=None,
+                             census_store=None):
+    """Retrieves household type date from Census 2011 for a local authority.
 
     Data is taken from the QS116EW table from the UK Census 2011.
     Data is retrieved from nomis, see https://www.nomisweb.co.uk.
+    Without a `LocalAuthority`, data is retrieved for Haringey. Without a `CensusStore`, data
+    is retrieved from nomis without being stored.
     """
-    url = ("https://www.nomisweb.co.uk/api/v01/dataset/{}.data.csv" +
-           "?date=latest&geography={}&rural_urban=0&measures=20100" +
-           "&select=geography_code,c_ahthuk11_name," +
-           "obs_value").format(NOMIS_QS116EW_DATASET_ID,
-                               geographical_layer.nomis_geo_codes)
-    r = requests.get(url)
-    df = pd.read_csv(io.BytesIO(r.content))
-    df = df.pivot(
-        index='GEOGRAPHY_CODE',
-        columns='C_AHTHUK11_NAME',
-        values='OBS_VALUE'
-    )[list(HOUSEHOLDTYPE_MAP.keys())].astype(np.int64)
+    df = _census_store(census_store).layer_table(
+        NOMIS_QS116EW_TABLE,
+        geographical_layer,
+        local_authority
+    )[list(HOUSEHOLDTYPE_MAP.keys())]
     df = df.rename(columns=HOUSEHOLDTYPE_MAP).groupby(lambda x: x, axis=1).sum()
     return df
 
 
-def read_qualification_level_data(geographical_layer=GeographicalLayer.LSOA):
-    """Retrieves highest qualification level data from Census 2011 for Haringey.
+@_memoized
+def read_qualification_level_data(geographical_layer=GeographicalLayer.LSOA,
+                                  local_authority=None, census_store=None):
+    """Retrieves highest qualification level data from Census 2011 for a local authority.
 
     Data is taken from the KS501EW table from the UK Census 2011.
     Data is retrieved from nomis, see https://www.nomisweb.co.uk.
+    Without a `LocalAuthority`, data is retrieved for Haringey. Without a `CensusStore`, data
+    is retrieved from nomis without being stored.
     """
-    url = ("https://www.nomisweb.co.uk/api/v01/dataset/{}.data.csv" +
-           "?date=latest&geography={}&rural_urban=0&measures=20100" +
-           "&select=geography_code,cell_name,obs_value").format(NOMIS_KS501EW_DATASET_ID,
-                                                                geographical_layer.nomis_geo_codes)
-    r = requests.get(url)
-    df = pd.read_csv(io.BytesIO(r.content))
-    df = df.pivot(
-        index='GEOGRAPHY_CODE',
-        columns='CELL_NAME',
-        values='OBS_VALUE'
-    )[list(QUALIFICATION_MAP.keys())].astype(np.int64)
+    df = _census_store(census_store).layer_table(
+        NOMIS_KS501EW_TABLE,
+        geographical_layer,
+        local_authority
+    )[list(QUALIFICATION_MAP.keys())]
     df = df.rename(columns=QUALIFICATION_MAP).groupby(lambda x: x, axis=1).sum()
     return df
 
 
-def read_economic_activity_data(geographical_layer=GeographicalLayer.LSOA):
-    """Retrieves economic activity data from Census 2011 for Haringey.
+@_memoized
+def read_economic_activity_data(geographical_layer=GeographicalLayer.LSOA, local_authority=None,
+                                census_store=None):
+    """Retrieves economic activity data from Census 2011 for a local authority.
 
     Data is taken from the KS601EW table from the UK Census 2011.
     Data is retrieved from nomis, see https://www.nomisweb.co.uk.
+    Without a `LocalAuthority`, data is retrieved for Haringey. Without a `CensusStore`, data
+    is retrieved from nomis without being stored.
     """
-    url = ("https://www.nomisweb.co.uk/api/v01/dataset/{}.data.csv" +
-           "?date=latest&geography={}&rural_urban=0&measures=20100" +
-           "&c_sex=0" +
-           "&select=geography_code,cell_name,obs_value").format(NOMIS_KS601EW_DATASET_ID,
-                                                                geographical_layer.nomis_geo_codes)
-    r = requests.get(url)
-    df = pd.read_csv(io.BytesIO(r.content))
-    df = df.pivot(
-        index='GEOGRAPHY_CODE',
-        columns='CELL_NAME',
-        values='OBS_VALUE'
-    )[list(ECONOMIC_ACTIVITY_MAP.keys())].astype(np.int64)
+    df = _census_store(census_store).layer_table(
+        NOMIS_KS601EW_TABLE,
+        geographical_layer,
+        local_authority
+    )[list(ECONOMIC_ACTIVITY_MAP.keys())]
     df = df.rename(columns=ECONOMIC_ACTIVITY_MAP).groupby(lambda x: x, axis=1).sum()
     return df
 
 
-def read_pseudo_individual_data(geographical_layer=GeographicalLayer.LSOA):
+def read_pseudo_individual_data(geographical_layer=GeographicalLayer.LSOA, local_authority=None,
+                                census_store=None):
     """Creates pseudo feature data for people.
 
     The data set will be equivalent to the population sum.
     """
-    data = read_age_structure_data(geographical_layer)
+    data = read_age_structure_data(geographical_layer, local_authority, census_store)
     data[Pseudo.SINGLETON] = data.sum(axis=1)
     return data[[Pseudo.SINGLETON]]
 
 
-def read_pseudo_household_data(geographical_layer=GeographicalLayer.LSOA):
+def read_pseudo_household_data(geographical_layer=GeographicalLayer.LSOA, local_authority=None,
+                               census_store=None):
     """Creates pseudo feature data for households.
 
     The data set will be equivalent to the household sum.
     """
-    data = read_household_type_data(geographical_layer)
+    data = read_household_type_data(geographical_layer, local_authority, census_store)
     data[Pseudo.SINGLETON] = data.sum(axis=1)
     return data[[Pseudo.SINGLETON]]
+
+
+def read_concurrently(census_read_functions, geographical_layer=GeographicalLayer.LSOA,
+                      local_authority=None, census_store=None):
+    """Reads several census data sets at once, with concurrent requests to nomis.
+
+    Identical requests of different read functions, e.g. for the age structure, are sent only
+    once. Hence, without stored tables, reading takes about as long as the slowest request.
+
+    Parameters:
+        * census_read_functions: read functions with the signature of the `read_*_data`
+                                 functions of this module, e.g. `read_age_structure_data` or
+                                 `urbanoccupants.PeopleFeature.read_census_data`
+        * geographical_layer:    the layer of the census data
+        * local_authority:       the `LocalAuthority` of the census data (optional, default:
+                                 Haringey)
+        * census_store:          the `CensusStore` to use (optional)
+
+    Returns:
+        a list of census data, in the order of the read functions
+    """
+    census_store = _census_store(census_store) # shared by all threads to join requests
+    with ThreadPoolExecutor(max_workers=NOMIS_MAX_CONCURRENT_REQUESTS) as executor:
+        data = [executor.submit(census_read_function, geographical_layer, local_authority,
+                                census_store)
+                for census_read_function in census_read_functions]
+        return [future.result() for future in data]
+
+
+def _census_store(census_store):
+    return census_store if census_store is not None else CensusStore()
+
+
+def _nomis_geography(geographical_layer, local_authority):
+    return _local_authority(local_authority).nomis_geography[geographical_layer]
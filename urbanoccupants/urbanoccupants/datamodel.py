@@ -3,3 +3,4 @@ DWELLINGS_TABLE_NAME = 'dwellings'
 PEOPLE_TABLE_NAME = 'people'
 ENVIRONMENT_TABLE_NAME = 'environment'
 PARAMETERS_TABLE_NAME = 'parameters'
+GOODNESS_OF_FIT_TABLE_NAME = 'goodnessOfFit'
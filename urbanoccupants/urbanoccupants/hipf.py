@@ -1,25 +1,93 @@
+from collections import namedtuple, defaultdict
+from contextlib import contextmanager
 from itertools import filterfalse, chain
-from functools import reduce
+from functools import reduce, partial
+import time
 
 import pandas as pd
 import numpy as np
 from numpy.polynomial import Polynomial
 
 
+ENGINES = ('pandas', 'numpy')
+SOLVERS = ('fixed-point', 'squarem', 'raking')
+PHASES = ('household fit', 'person fit', 'rescale', 'raking')
+
+
+class HipfTrace():
+    """The convergence trace of the HIPF fit of a single region.
+
+    Attributes:
+        * iterations:         the number of iterations performed
+        * max_residuals:      the maximum absolute residual after each iteration
+        * max_weight_changes: the maximum relative change of weights in each iteration
+        * durations:          dict from each phase in `PHASES` to the time in seconds spent in
+                              that phase in each iteration
+
+    When several regions are fitted at once, all regions that were updated in an iteration
+    share the durations of the iteration.
+    """
+
+    def __init__(self):
+        self.iterations = 0
+        self.max_residuals = []
+        self.max_weight_changes = []
+        self.durations = {phase: [] for phase in PHASES}
+
+    def __repr__(self):
+        return 'HipfTrace(iterations={}, max_residual={}, max_weight_change={})'.format(
+            self.iterations,
+            self.max_residuals[-1] if self.max_residuals else None,
+            self.max_weight_changes[-1] if self.max_weight_changes else None
+        )
+
+    @property
+    def total_durations(self):
+        """Dict from each phase in `PHASES` to the total time in seconds spent in that phase."""
+        return {phase: sum(durations) for phase, durations in self.durations.items()}
+
+    def _append(self, max_residual, max_weight_change, durations):
+        self.iterations += 1
+        self.max_residuals.append(max_residual)
+        self.max_weight_changes.append(max_weight_change)
+        for phase in PHASES:
+            self.durations[phase].append(durations[phase])
+
+
 def fit_hipf(reference_sample, controls_individuals, controls_households, maxiter,
-             weights_tol=None, residuals_tol=None):
+             weights_tol=None, residuals_tol=None, engine='pandas', compress=False,
+             initial_weights=None, solver='fixed-point', return_trace=False):
     """Hierarchical Iterative Proportional Fitting.
 
     Algorithm taken from
     Müller and Axhausen 2011: "Hierarchical IPF: Generating a synthetic population for Switzerland"
 
     Can be used to fit a reference sample of households and individuals to control variables
-    simultaneously. The algorithm supports only one dimensional control variables, and hence
-    multi-dimensional control variables must be transformed to one dimensional ones first.
+    simultaneously. With the 'pandas' engine, the algorithm supports only one dimensional control
+    variables, and hence multi-dimensional control variables must be transformed to one
+    dimensional ones first. The 'numpy' engine supports multi-dimensional control variables
+    natively: controls can be defined over a tuple of columns of the reference sample. They are
+    encoded into joint category codes internally, without adding columns to the reference sample.
 
     By default the algorithm runs exactly `maxiter` iterations. Convergence can be checked on
     residuals and changes in the weights by giving the corresponding tolerances.
 
+    By default all weights are initialised with 1. The fit can be warm-started from a previous
+    solution, e.g. of a similar region, by giving initial weights.
+
+    With the 'numpy' engine, different solvers can be chosen:
+        * 'fixed-point': the original algorithm, one iteration is one HIPF sweep over all controls
+        * 'squarem':     the HIPF sweep accelerated by squared extrapolation, see Varadhan and
+                         Roland 2008: "Simple and globally convergent methods for accelerating
+                         the convergence of any EM algorithm". One iteration comprises three
+                         HIPF sweeps.
+        * 'raking':      generalized raking, see Deville and Särndal 1992: "Calibration
+                         estimators in survey sampling". Household weights are of the form
+                         w = w0 * exp(X * lambda), where X holds the household categories and
+                         the number of members in each person category, and w0 are the initial
+                         weights. One iteration is one Newton step on lambda. The resulting
+                         weights meet the same controls, but differ from the ones of HIPF.
+
     Parameters:
         reference_sample:     The reference sample to be fited to the controls. Must be a pandas
                               DataFrame where the index is a multi index of (household_id,
@@ -28,6 +96,9 @@ def fit_hipf(reference_sample, controls_individuals, controls_households, maxite
         controls_individuals: The control variables for individuals. Must be a dict from control
                               name to a dict of its values.
                               e.g. {'age': {'below_50': 45, '50_or_older'}: 55}
+                              Only with the 'numpy' engine, the control name can be a tuple of
+                              column names, with tuples of their values as keys,
+                              e.g. {('age', 'sex'): {('below_50', 'f'): 22, ...}}
         controls_households:  The control variables for households. Must be in the same format as
                               the controls for individuals.
         weights_tol:          Convergence tolerance on the weights. Whenever the weights change
@@ -37,6 +108,27 @@ def fit_hipf(reference_sample, controls_individuals, controls_households, maxite
                               totals). Whenever the residuals are smaller than the given tolerance,
                               stop. (optional)
         maxiter:              Maximum number of iterations.
+        engine:               The implementation to use, one of `ENGINES`. The 'pandas' engine
+                              works on the reference sample directly. The 'numpy' engine encodes
+                              all controls once into integer category codes and performs the
+                              fitting on plain arrays, which is much faster and leads to the
+                              same weights. (optional, default: 'pandas')
+        compress:             Only with the 'numpy' engine: collapses identical households into
+                              household patterns weighted by their multiplicity before fitting,
+                              and expands the weights back to all households afterwards. The
+                              weights are the same, but the problem size shrinks.
+                              (optional, default: False)
+        initial_weights:      Weights to start the fitting from. Must be a pandas Series with
+                              the household ids as index. When compressing, the initial weights
+                              of identical households are averaged. (optional)
+        solver:               Only with the 'numpy' engine: the solver to use, one of `SOLVERS`.
+                              (optional, default: 'fixed-point')
+        return_trace:         Only with the 'numpy' engine: whether to return the `HipfTrace` of
+                              the fit in addition to the weights. (optional, default: False)
+
+    Returns:
+        a pandas Series of household weights, or a tuple of the weights and the `HipfTrace` if
+        `return_trace` is True
     """
     assert isinstance(reference_sample, pd.DataFrame)
     assert reference_sample.index.nlevels == 2
@@ -46,12 +138,41 @@ def fit_hipf(reference_sample, controls_individuals, controls_households, maxite
     assert _consistent_keys(controls_households, reference_sample)
     assert _consistent_grand_totals(controls_individuals)
     assert _consistent_grand_totals(controls_households)
-
+    assert engine in ENGINES
+    assert engine == 'numpy' or not compress
+    assert solver in SOLVERS
+    assert engine == 'numpy' or solver == 'fixed-point'
+    assert engine == 'numpy' or not return_trace
+    assert engine == 'numpy' or not _multi_dimensional(controls_individuals)
+    assert engine == 'numpy' or not _multi_dimensional(controls_households)
+
+    if engine == 'numpy':
+        if initial_weights is not None:
+            initial_weights = pd.DataFrame([initial_weights])
+        households, weights, traces = _fit_hipf_encoded(
+            reference_sample=reference_sample,
+            controls_individuals=controls_individuals,
+            controls_households=controls_households,
+            maxiter=maxiter,
+            weights_tol=weights_tol,
+            residuals_tol=residuals_tol,
+            compress=compress,
+            initial_weights=initial_weights,
+            solver=solver,
+            trace=return_trace
+        )
+        weights = pd.Series(weights[0], index=households)
+        if return_trace:
+            return weights, traces[0]
+        return weights
     weights = pd.Series(
         index=_household_groups(reference_sample).count().index.get_level_values(0),
         data=1.0,
         dtype=np.float64
     )
+    if initial_weights is not None:
+        weights = initial_weights.reindex(weights.index).astype(np.float64)
+        assert not weights.isnull().any()
     for i in range(1, maxiter + 1):
         next_weights = _fit(_household_groups(reference_sample).first(), weights,
                             controls_households)
@@ -72,9 +193,129 @@ def fit_hipf(reference_sample, controls_individuals, controls_households, maxite
     return weights
 
 
+def fit_hipf_batch(reference_sample, controls_individuals, controls_households, maxiter,
+                   weights_tol=None, residuals_tol=None, compress=True, initial_weights=None,
+                   solver='fixed-point', return_trace=False):
+    """Hierarchical Iterative Proportional Fitting of one reference sample to many regions.
+
+    Fits the same reference sample to the controls of all regions simultaneously, using the
+    'numpy' engine of `fit_hipf` on a (regions x households) weight matrix. The reference sample
+    is encoded only once for all regions. Convergence is checked for each region individually
+    and regions that have converged are not updated any further.
+
+    Parameters:
+        reference_sample:     The reference sample to be fited to the controls, see `fit_hipf`.
+        controls_individuals: The control variables for individuals. Must be a dict from control
+                              name to a pandas DataFrame with regions as index and the values of
+                              the control as columns.
+        controls_households:  The control variables for households. Must be in the same format as
+                              the controls for individuals, with the same regions.
+        weights_tol:          Convergence tolerance on the weights, see `fit_hipf`. (optional)
+        residuals_tol:        Convergence tolerance on the residuals, see `fit_hipf`. (optional)
+        maxiter:              Maximum number of iterations.
+        compress:             Whether to collapse identical households before fitting, see
+                              `fit_hipf`. (optional, default: True)
+        initial_weights:      Weights to start the fitting from, see `fit_hipf`. Must be a pandas
+                              DataFrame with regions as index and household ids as columns.
+                              Regions that are missing start from weights of 1. (optional)
+        solver:               The solver to use, see `fit_hipf`. (optional, default: 'fixed-point')
+        return_trace:         Whether to return the `HipfTrace` of each region in addition to
+                              the weights. (optional, default: False)
+
+    Returns:
+        a pandas DataFrame of weights with regions as index and households as columns, or a
+        tuple of the weights and a dict from region to its `HipfTrace` if `return_trace` is True
+    """
+    assert isinstance(reference_sample, pd.DataFrame)
+    assert reference_sample.index.nlevels == 2
+    assert len(controls_individuals) > 0
+    assert len(controls_households) > 0
+    assert _consistent_keys(controls_individuals, reference_sample)
+    assert _consistent_keys(controls_households, reference_sample)
+    regions = list(controls_households.values())[0].index
+    assert all(controls.index.equals(regions)
+               for controls in chain(controls_individuals.values(), controls_households.values()))
+    assert _consistent_grand_totals_per_region(controls_individuals)
+    assert _consistent_grand_totals_per_region(controls_households)
+    assert solver in SOLVERS
+
+    if initial_weights is not None:
+        initial_weights = initial_weights.reindex(regions).fillna(1.0)
+    households, weights, traces = _fit_hipf_encoded(
+        reference_sample=reference_sample,
+        controls_individuals=controls_individuals,
+        controls_households=controls_households,
+        maxiter=maxiter,
+        weights_tol=weights_tol,
+        residuals_tol=residuals_tol,
+        compress=compress,
+        initial_weights=initial_weights,
+        solver=solver,
+        trace=return_trace
+    )
+    weights = pd.DataFrame(weights, index=regions, columns=households)
+    if return_trace:
+        return weights, dict(zip(regions, traces))
+    return weights
+
+
+def sample_values(reference_sample, control_name):
+    """Returns the values of a control for each row of a reference sample.
+
+    Multi-dimensional controls are represented by the tuples of their columns' values, which
+    are matched to the control's categories without materialising a combined column.
+
+    Parameters:
+        reference_sample: The reference sample, see `fit_hipf`.
+        control_name:     The name of the control, a tuple of column names for
+                          multi-dimensional controls.
+
+    Returns:
+        an array of the control values, or a pandas MultiIndex for multi-dimensional controls
+    """
+    if isinstance(control_name, tuple):
+        return pd.MultiIndex.from_arrays([reference_sample[column].values
+                                          for column in control_name])
+    return reference_sample[control_name].values
+
+
+def encode_control(values, control_values):
+    """Encodes the values of a control as indices into its categories.
+
+    Parameters:
+        values:         The values of the control, see `sample_values`.
+        control_values: The control values of a single region as a dict from category to
+                        value, or of many regions as a pandas DataFrame with regions as index
+                        and categories as columns.
+
+    Returns:
+        a tuple of the category index of each value and a (regions x categories) array of
+        the control values
+    """
+    if isinstance(control_values, pd.DataFrame): # regions x categories
+        categories = list(control_values.columns)
+        targets = control_values.values.astype(np.float64)
+    else:
+        categories = list(control_values.keys())
+        targets = np.array([[control_values[category] for category in categories]],
+                           dtype=np.float64)
+    codes = pd.Index(categories).get_indexer(values)
+    assert (codes >= 0).all(), "Reference sample contains categories without control values."
+    return codes, targets
+
+
 def _consistent_keys(controls, reference_sample):
-    return [control_name for control_name in controls.keys()
-            if control_name not in reference_sample.columns] == []
+    return [column for column in chain(*[_control_columns(control_name)
+                                         for control_name in controls.keys()])
+            if column not in reference_sample.columns] == []
+
+
+def _multi_dimensional(controls):
+    return any(isinstance(control_name, tuple) for control_name in controls.keys())
+
+
+def _control_columns(control_name):
+    return control_name if isinstance(control_name, tuple) else (control_name, )
 
 
 def _consistent_grand_totals(controls):
@@ -83,6 +324,11 @@ def _consistent_grand_totals(controls):
     return len(set(grand_totals)) <= 1
 
 
+def _consistent_grand_totals_per_region(controls):
+    grand_totals = np.array([control.values.sum(axis=1) for control in controls.values()])
+    return (grand_totals == grand_totals[0]).all()
+
+
 def _household_groups(reference_sample):
     return reference_sample.groupby(reference_sample.index.get_level_values(0))
 
@@ -163,13 +409,317 @@ def _rescale_weights(reference_sample, weights, controls_individuals, controls_h
           for p in range(0, largest_household_size + 1)]
     polynom = [(grand_total_hh / grand_total_ind * p - 1) * Fp[p]
                for p in range(0, largest_household_size + 1)]
-    roots = Polynomial(polynom).roots()
-    dx = list(filter(lambda x: np.real(x) > 0, filterfalse(lambda x: np.iscomplex(x), roots)))
-    assert len(dx) == 1
-    d = np.real(dx[0])
+    d = _positive_real_root(polynom)
     c = grand_total_hh / sum(Fp[p] * d ** p for p in range(1, largest_household_size + 1))
     fhprime_by_fh = {p: c * d ** p for p in range(1, largest_household_size + 1)}
 
     fhprime_by_fh = household_sizes.map(fhprime_by_fh)
     new_weights = fhprime_by_fh * weights
     return new_weights
+
+
+def _positive_real_root(polynom):
+    roots = Polynomial(polynom).roots()
+    dx = list(filter(lambda x: np.real(x) > 0, filterfalse(lambda x: np.iscomplex(x), roots)))
+    assert len(dx) == 1
+    return np.real(dx[0])
+
+
+# The numpy engine. The reference sample is encoded once into integer category codes for all
+# controls, so that each iteration can be performed on plain arrays using `np.bincount` and
+# fancy indexing instead of boolean masks and dict mappings on pandas objects.
+#
+# Identical households (same household categories and same multiset of person categories)
+# always end up with identical weights. They can hence be collapsed into a single household
+# pattern which is weighted by its multiplicity in all sums.
+
+_EncodedSample = namedtuple(
+    '_EncodedSample',
+    ['households', 'person_household', 'household_sizes', 'household_multiplicity',
+     'household_codes', 'household_targets', 'person_codes', 'person_targets']
+)
+
+
+def _fit_hipf_encoded(reference_sample, controls_individuals, controls_households, maxiter,
+                      weights_tol, residuals_tol, compress, initial_weights, solver,
+                      trace=False):
+    # Fits all regions at once: the targets of each control are (regions x categories) arrays
+    # and the weights form a (regions x households) matrix. Converged regions are not updated
+    # any further. Returns the households, the weights, and a `HipfTrace` per region. Residuals,
+    # weight changes and durations are only recorded in the traces when tracing.
+    sample = _encode_reference_sample(reference_sample, controls_individuals, controls_households)
+    number_regions = sample.household_targets[0].shape[0]
+    if initial_weights is None:
+        weights = np.ones((number_regions, len(sample.households)), dtype=np.float64)
+    else:
+        weights = initial_weights.reindex(columns=sample.households).values.astype(np.float64)
+        assert weights.shape[0] == number_regions
+        assert not np.isnan(weights).any()
+    if compress:
+        sample, household_pattern = _compress_households(sample)
+        weights = (_grouped_sum(weights, household_pattern, len(sample.household_sizes)) /
+                   sample.household_multiplicity)
+    if solver == 'fixed-point':
+        step = _iterate_encoded
+    elif solver == 'squarem':
+        step = _squarem_step
+    else:
+        step = partial(_raking_step, design=_raking_design(sample))
+    traces = [HipfTrace() for _ in range(number_regions)]
+    active = np.ones(number_regions, dtype=np.bool_)
+    for _ in range(maxiter):
+        active_sample = _select_regions(sample, active)
+        previous_weights = weights[active]
+        durations = defaultdict(float) if trace else None
+        next_weights = step(active_sample, previous_weights, durations=durations)
+        weights[active] = next_weights
+        converged = np.zeros(len(next_weights), dtype=np.bool_)
+        max_residuals = np.full(len(next_weights), np.nan)
+        max_weight_changes = np.full(len(next_weights), np.nan)
+        if residuals_tol is not None or trace:
+            max_residuals = np.abs(_all_residuals_encoded(active_sample, next_weights)).max(axis=1)
+        if weights_tol is not None or trace:
+            max_weight_changes = np.abs(next_weights / previous_weights - 1).max(axis=1)
+        if residuals_tol is not None:
+            converged |= max_residuals < residuals_tol
+        if weights_tol is not None:
+            converged |= max_weight_changes < weights_tol
+        for region_trace, max_residual, max_weight_change in zip(
+                [traces[region] for region in np.flatnonzero(active)],
+                max_residuals,
+                max_weight_changes):
+            if trace:
+                region_trace._append(max_residual, max_weight_change, durations)
+            else:
+                region_trace.iterations += 1
+        active[active] = ~converged
+        if not active.any():
+            break
+    if compress:
+        weights = weights[:, household_pattern]
+    return sample.households, weights, traces
+
+
+def _encode_reference_sample(reference_sample, controls_individuals, controls_households):
+    person_household, households = pd.factorize(
+        reference_sample.index.get_level_values(0),
+        sort=True
+    )
+    households.name = reference_sample.index.names[0]
+    first_person = np.unique(person_household, return_index=True)[1]
+    household_codes, household_targets = zip(*[
+        encode_control(sample_values(reference_sample, control_name)[first_person],
+                        control_values)
+        for control_name, control_values in controls_households.items()
+    ])
+    person_codes, person_targets = zip(*[
+        encode_control(sample_values(reference_sample, control_name), control_values)
+        for control_name, control_values in controls_individuals.items()
+    ])
+    return _EncodedSample(
+        households=households,
+        person_household=person_household,
+        household_sizes=np.bincount(person_household),
+        household_multiplicity=np.ones(len(households), dtype=np.float64),
+        household_codes=household_codes,
+        household_targets=household_targets,
+        person_codes=person_codes,
+        person_targets=person_targets
+    )
+
+
+def _select_regions(sample, regions):
+    if regions.all():
+        return sample
+    return sample._replace(
+        household_targets=tuple(targets[regions] for targets in sample.household_targets),
+        person_targets=tuple(targets[regions] for targets in sample.person_targets)
+    )
+
+
+def _compress_households(sample):
+    """Collapses identical households of an encoded sample into weighted household patterns.
+
+    Returns:
+        a tuple of
+            * the encoded sample of household patterns, with the original `households`
+            * the pattern of each original household
+    """
+    person_codes = np.column_stack(sample.person_codes)
+    # bring members into a canonical order, so that member order does not matter
+    order = np.lexsort(tuple(person_codes.T[::-1]) + (sample.person_household, ))
+    person_household = sample.person_household[order]
+    first_member = np.concatenate([[0], np.cumsum(sample.household_sizes)[:-1]])
+    member_rank = np.arange(len(order)) - first_member[person_household]
+    members = np.full(
+        (len(sample.household_sizes), sample.household_sizes.max() * person_codes.shape[1]),
+        fill_value=-1,
+        dtype=np.int64
+    )
+    for control_number in range(person_codes.shape[1]):
+        members[person_household, member_rank * person_codes.shape[1] + control_number] = \
+            person_codes[order, control_number]
+    keys = np.ascontiguousarray(np.column_stack(sample.household_codes + (members, )))
+    keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel()
+    _, representative, household_pattern, multiplicity = np.unique(
+        keys,
+        return_index=True,
+        return_inverse=True,
+        return_counts=True
+    )
+    representative_member = np.in1d(sample.person_household, representative)
+    compressed_sample = sample._replace(
+        person_household=household_pattern[sample.person_household[representative_member]],
+        household_sizes=sample.household_sizes[representative],
+        household_multiplicity=multiplicity.astype(np.float64),
+        household_codes=tuple(codes[representative] for codes in sample.household_codes),
+        person_codes=tuple(codes[representative_member] for codes in sample.person_codes)
+    )
+    return compressed_sample, household_pattern
+
+
+@contextmanager
+def _timed(durations, phase):
+    """Adds the time spent in the context to the phase in durations, unless durations is None."""
+    if durations is None:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        durations[phase] += time.perf_counter() - start_time
+
+
+def _iterate_encoded(sample, weights, durations=None):
+    person_multiplicity = sample.household_multiplicity[sample.person_household]
+    with _timed(durations, 'household fit'):
+        weights = _fit_encoded(weights, sample.household_multiplicity,
+                               sample.household_codes, sample.household_targets)
+    with _timed(durations, 'person fit'):
+        weights_person = weights[:, sample.person_household]
+        weights_person = _fit_encoded(weights_person, person_multiplicity,
+                                      sample.person_codes, sample.person_targets)
+        weights = (_grouped_sum(weights_person, sample.person_household,
+                                len(sample.household_sizes)) /
+                   sample.household_sizes)
+    with _timed(durations, 'rescale'):
+        return _rescale_weights_encoded(sample, weights)
+
+
+def _fit_encoded(weights, multiplicity, codes, targets):
+    for control_codes, control_targets in zip(codes, targets):
+        summed_weights = _grouped_sum(weights * multiplicity, control_codes,
+                                      control_targets.shape[1])
+        weights = (weights * control_targets[:, control_codes] /
+                   summed_weights[:, control_codes])
+    return weights
+
+
+def _grouped_sum(weights, codes, number_categories):
+    """Sums (regions x n) weights by the categories of the n elements, for each region."""
+    number_regions = weights.shape[0]
+    region_offsets = np.arange(number_regions)[:, np.newaxis] * number_categories
+    return np.bincount(
+        (codes + region_offsets).ravel(),
+        weights=weights.ravel(),
+        minlength=number_regions * number_categories
+    ).reshape(number_regions, number_categories)
+
+
+def _rescale_weights_encoded(sample, weights):
+    grand_total_hh = sample.household_targets[0].sum(axis=1)
+    grand_total_ind = sample.person_targets[0].sum(axis=1)
+    household_sizes = sample.household_sizes
+    largest_household_size = household_sizes.max()
+    Fp = _grouped_sum(weights * sample.household_multiplicity, household_sizes,
+                      largest_household_size + 1)
+    p = np.arange(0, largest_household_size + 1)
+    polynoms = (grand_total_hh[:, np.newaxis] / grand_total_ind[:, np.newaxis] * p - 1) * Fp
+    d = np.array([_positive_real_root(polynom) for polynom in polynoms])[:, np.newaxis]
+    c = grand_total_hh[:, np.newaxis] / (Fp[:, 1:] * d ** p[1:]).sum(axis=1, keepdims=True)
+    return weights * c * d ** household_sizes
+
+
+def _squarem_step(sample, weights, durations=None):
+    # SqS3 scheme of Varadhan and Roland 2008, with a stabilising HIPF sweep at the end.
+    # Falls back to two plain HIPF sweeps wherever the extrapolation is not applicable.
+    weights1 = _iterate_encoded(sample, weights, durations)
+    weights2 = _iterate_encoded(sample, weights1, durations)
+    r = weights1 - weights
+    v = weights2 - weights1 - r
+    # norms over all households, so that compression does not change the extrapolation
+    norm_r = np.sqrt((sample.household_multiplicity * r ** 2).sum(axis=1, keepdims=True))
+    norm_v = np.sqrt((sample.household_multiplicity * v ** 2).sum(axis=1, keepdims=True))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        alpha = np.minimum(-norm_r / norm_v, -1)
+    extrapolated = weights - 2 * alpha * r + alpha ** 2 * v
+    valid = (norm_v[:, 0] > 0) & (extrapolated > 0).all(axis=1)
+    next_weights = weights2.copy()
+    if valid.any():
+        next_weights[valid] = _iterate_encoded(_select_regions(sample, valid), extrapolated[valid],
+                                               durations)
+    return next_weights
+
+
+def _raking_design(sample):
+    """The (households x categories) design matrix of all controls for generalized raking.
+
+    Household controls contribute indicator columns, person controls contribute the number of
+    members of each household in the category.
+    """
+    number_households = len(sample.household_sizes)
+    columns = []
+    for codes, targets in zip(sample.household_codes, sample.household_targets):
+        indicators = np.zeros((number_households, targets.shape[1]))
+        indicators[np.arange(number_households), codes] = 1
+        columns.append(indicators)
+    for codes, targets in zip(sample.person_codes, sample.person_targets):
+        columns.append(_grouped_sum(
+            np.ones((1, len(codes))),
+            sample.person_household * targets.shape[1] + codes,
+            number_households * targets.shape[1]
+        ).reshape(number_households, targets.shape[1]))
+    return np.concatenate(columns, axis=1)
+
+
+def _raking_step(sample, weights, design, durations=None):
+    # one Newton step of the raking equations X' * (w * m) = t for w = w0 * exp(X * lambda)
+    with _timed(durations, 'raking'):
+        return _raking_newton_step(sample, weights, design)
+
+
+def _raking_newton_step(sample, weights, design):
+    targets = np.concatenate(sample.household_targets + sample.person_targets, axis=1)
+    weighted = weights * sample.household_multiplicity
+    residuals = weighted.dot(design) - targets
+    next_weights = np.empty_like(weights)
+    for region in range(weights.shape[0]):
+        jacobian = (design.T * weighted[region]).dot(design)
+        delta = np.linalg.lstsq(jacobian, -residuals[region], rcond=-1)[0]
+        next_weights[region] = weights[region] * np.exp(design.dot(delta))
+    return next_weights
+
+
+def _all_residuals_encoded(sample, weights):
+    """Residuals of all controls, as a (regions x residuals) array."""
+    residuals_household = _residuals_encoded(
+        weights * sample.household_multiplicity,
+        sample.household_codes,
+        sample.household_targets
+    )
+    residuals_individual = _residuals_encoded(
+        (weights * sample.household_multiplicity)[:, sample.person_household],
+        sample.person_codes,
+        sample.person_targets
+    )
+    return np.concatenate([residuals_household, residuals_individual], axis=1)
+
+
+def _residuals_encoded(weights, codes, targets):
+    residuals = [weights.sum(axis=1, keepdims=True) /
+                 targets[0].sum(axis=1, keepdims=True) - 1]
+    for control_codes, control_targets in zip(codes, targets):
+        actual_values = _grouped_sum(weights, control_codes, control_targets.shape[1])
+        residuals.append(actual_values / control_targets - 1)
+    return np.concatenate(residuals, axis=1)
@@ -0,0 +1,119 @@
+"""A local stand-in for the nomis API, serving recorded census tables.
+
+The stand-in allows to test and benchmark the retrieval of census data without network access.
+It serves the csv data API of nomis, `<url>/dataset/<dataset id>.data.csv?<query>`, from a
+directory of recordings that contains one csv file per dataset, named `<dataset id>.csv`. The
+geography of a query is not evaluated, hence a recording should contain the areas of a single
+geography only.
+
+Usage:
+
+    with NomisStandIn(path_to_recordings) as nomis:
+        census_store = CensusStore(nomis_api_url=nomis.url)
+"""
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from socketserver import ThreadingMixIn
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+API_PATH = '/api/v01'
+DATASET_PATH_PREFIX = API_PATH + '/dataset/'
+DATASET_PATH_SUFFIX = '.data.csv'
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # serves requests concurrently, like the real API
+    daemon_threads = True
+
+
+class NomisStandIn():
+    """A nomis API stand-in running on localhost in a background thread.
+
+    Parameters:
+        * path_to_recordings: the directory of the recorded csv files
+        * latency:            seconds to wait before each response, to mimic a remote server
+                              (optional, default: 0)
+        * failures:           the number of first requests that fail with status 503, to mimic
+                              an unavailable server (optional, default: 0)
+    """
+
+    def __init__(self, path_to_recordings, latency=0, failures=0):
+        self.__path_to_recordings = Path(path_to_recordings)
+        self.__latency = latency
+        self.__failures = failures
+        self.__server = None
+        self.__thread = None
+        self.__requests_lock = threading.Lock()
+        self.requests = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def url(self):
+        """The base url of the API, to be used instead of `urbanoccupants.census.NOMIS_API_URL`."""
+        assert self.__server is not None, "Stand-in is not running."
+        host, port = self.__server.server_address
+        return 'http://{}:{}{}'.format(host, port, API_PATH)
+
+    def start(self):
+        """Starts serving on a free port."""
+        self.__server = _ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        # a short poll interval lets the stand-in stop quickly
+        self.__thread = threading.Thread(target=self.__server.serve_forever, args=(0.05, ),
+                                         daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """Stops serving."""
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+        self.__server = None
+
+    def _handler_class(self):
+        stand_in = self
+        latency = self.__latency
+        failures = self.__failures
+        requests_lock = self.__requests_lock
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                # requests are handled concurrently, hence the position of this request
+                # decides whether it fails
+                with requests_lock:
+                    stand_in.requests.append((url.path, parse_qs(url.query)))
+                    fails = len(stand_in.requests) <= failures
+                time.sleep(latency)
+                if fails:
+                    self.send_error(503)
+                    return
+                path_to_recording = stand_in._path_to_recording(url.path)
+                if path_to_recording is None or not path_to_recording.exists():
+                    self.send_error(404)
+                    return
+                content = path_to_recording.read_bytes()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/csv')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass # keep test and benchmark output clean
+
+        return Handler
+
+    def _path_to_recording(self, path):
+        if not (path.startswith(DATASET_PATH_PREFIX) and path.endswith(DATASET_PATH_SUFFIX)):
+            return None
+        dataset_id = path[len(DATASET_PATH_PREFIX):-len(DATASET_PATH_SUFFIX)]
+        return self.__path_to_recordings / '{}.csv'.format(dataset_id)
@@ -1,17 +1,21 @@
+from bisect import bisect_right
 from collections import OrderedDict
 import datetime
 from enum import Enum
-import math
 
-import pykov
+import numpy as np
 import pandas as pd
 
+from .rng import RandomStream
+
 
 MARKOV_CHAIN_DAY_COLUMN_NAME = 'day'
 MARKOV_CHAIN_TIME_OF_DAY_COLUMN_NAME = 'time'
 MARKOV_CHAIN_FROM_ACTIVITY_COLUMN_NAME = 'fromActivity'
 MARKOV_CHAIN_TO_ACTIVITY_COLUMN_NAME = 'toActivity'
 MARKOV_CHAIN_PROBABILITY_COLUMN_NAME = 'probability'
+DAY_TYPES = ['weekday', 'weekend']
+ACTIVITY_RANDOM_STREAM_NAME = 'activities'
 
 
 class OrderedEnum(Enum):
@@ -46,6 +50,9 @@ class Activity(OrderedEnum):
         return self.name
 
 
+ACTIVITIES = list(Activity)
+
+
 class Person():
     """The model of a citizen making choices on activities and locations.
 
@@ -100,6 +107,10 @@ class Person():
 class WeekMarkovChain():
     """A time heterogeneous markov chain of people activities for one week.
 
+    The chain is held as a dense (day types x time steps x activities x activities) array of
+    transition probabilities, with the current activity on the third and the next activity
+    on the fourth axis, and activities in the order of `Activity`.
+
     Parameters:
         * weekday_time_series: 24h time series of Activities with given time step size of a
                                weekday. The index should be instances of time, and there can
@@ -115,58 +126,69 @@ class WeekMarkovChain():
             raise ValueError('Weekday time series contains missing values.')
         if weekend_time_series.isnull().any().any():
             raise ValueError('Weekend time series contains missing values.')
-        self.__chain = {
-            'weekday': WeekMarkovChain._day_markov_chain(weekday_time_series, time_step_size),
-            'weekend': WeekMarkovChain._day_markov_chain(weekend_time_series, time_step_size)
-        }
+        self.__probabilities = np.stack([
+            WeekMarkovChain._day_markov_chain(weekday_time_series, time_step_size),
+            WeekMarkovChain._day_markov_chain(weekend_time_series, time_step_size)
+        ])
+        # transitions which are added to handle dead locks come after the estimated ones
+        self.__added = np.zeros(self.__probabilities.shape[:3], dtype=bool)
         self._add_missing_transitions()
-        # there is a chance that after the first round of adding transitions, the markov chain is
-        # still not valid (the first element could have a new element now that the second doesn't
-        # have). This is ignored for the moment, as the chain is validated anyway again.
         self._validate()
+        self.__cumulative_probabilities = np.cumsum(self.__probabilities, axis=3)
+        # moving a single person is faster on plain lists than on numpy arrays
+        self.__cumulative_rows = self.__cumulative_probabilities.tolist()
+        self.__last_next_states = _last_next_states(self.__probabilities).tolist()
 
     @property
     def time_step_size(self):
         return self.__time_step_size
 
+    @property
+    def probabilities(self):
+        """The (day types x time steps x activities x activities) transition probabilities."""
+        return self.__probabilities
+
+    @property
+    def cumulative_probabilities(self):
+        """The transition probabilities cumulated over the next activities."""
+        return self.__cumulative_probabilities
+
     def move(self, current_state, current_time, random_func):
-        return self.__chain[WeekMarkovChain._weekday(current_time)][current_time.time()].move(
-            state=current_state,
-            random_func=random_func
-        )
+        day, time_step = self._position(current_time)
+        current = WeekMarkovChain._state_index(current_state)
+        cumulative_probabilities = self.__cumulative_rows[day][time_step][current]
+        if cumulative_probabilities[-1] == 0:
+            raise ValueError('No transition from {} at {}.'.format(current_state, current_time))
+        next_state = bisect_right(cumulative_probabilities, random_func(0, 1))
+        # rounding can let the cumulative probability end slightly below 1
+        return ACTIVITIES[min(next_state, self.__last_next_states[day][time_step][current])]
 
     def valid_states(self, time_stamp):
         """Returns all valid states at given time stamp."""
-        return [item[0][0] for item in
-                self.__chain[WeekMarkovChain._weekday(time_stamp)][time_stamp.time()].items()]
+        day, time_step = self._position(time_stamp)
+        return [ACTIVITIES[state] for state in self._start_states(day, time_step)]
 
     def to_dataframe(self):
         """Creates a dataframe representation of a time heterogeneous markov chain.
 
         Can be used to serialise the markov chain into csv or sql.
         """
-        df = pd.DataFrame(columns=[
+        time_steps = list(WeekMarkovChain._day_time_step_generator(self.__time_step_size))
+        rows = [
+            (day_type, time_stamp, ACTIVITIES[from_state], ACTIVITIES[to_state],
+             self.__probabilities[day, time_step, from_state, to_state])
+            for day, day_type in enumerate(DAY_TYPES)
+            for time_step, time_stamp in enumerate(time_steps)
+            for from_state in self._start_states(day, time_step)
+            for to_state in np.flatnonzero(self.__probabilities[day, time_step, from_state] > 0)
+        ]
+        df = pd.DataFrame(rows, columns=[
             MARKOV_CHAIN_DAY_COLUMN_NAME,
             MARKOV_CHAIN_TIME_OF_DAY_COLUMN_NAME,
             MARKOV_CHAIN_FROM_ACTIVITY_COLUMN_NAME,
             MARKOV_CHAIN_TO_ACTIVITY_COLUMN_NAME,
             MARKOV_CHAIN_PROBABILITY_COLUMN_NAME
         ])
-        for day, day_chain in self.__chain.items():
-            assert day in ['weekday', 'weekend']
-            for time_stamp, single_markov_chain in day_chain.items():
-                assert isinstance(time_stamp, datetime.time)
-                single_df = pd.DataFrame({
-                    MARKOV_CHAIN_DAY_COLUMN_NAME: day,
-                    MARKOV_CHAIN_TIME_OF_DAY_COLUMN_NAME: time_stamp,
-                    MARKOV_CHAIN_FROM_ACTIVITY_COLUMN_NAME: [element[0]
-                                                             for element in single_markov_chain],
-                    MARKOV_CHAIN_TO_ACTIVITY_COLUMN_NAME: [element[1]
-                                                           for element in single_markov_chain],
-                    MARKOV_CHAIN_PROBABILITY_COLUMN_NAME: [single_markov_chain[element]
-                                                           for element in single_markov_chain]
-                })
-                df = df.append(single_df, ignore_index=True)
         assert not df.isnull().any().any()
         df.set_index(
             [MARKOV_CHAIN_DAY_COLUMN_NAME, MARKOV_CHAIN_TIME_OF_DAY_COLUMN_NAME],
@@ -174,73 +196,86 @@ class WeekMarkovChain():
         )
         return df
 
+    def to_pykov(self, time_stamp):
+        """Returns the markov chain of the given time stamp as `pykov.Chain`.
+
+        Requires pykov, which is not needed otherwise.
+        """
+        import pykov
+        day, time_step = self._position(time_stamp)
+        return pykov.Chain(OrderedDict(
+            ((ACTIVITIES[from_state], ACTIVITIES[to_state]),
+             self.__probabilities[day, time_step, from_state, to_state])
+            for from_state in self._start_states(day, time_step)
+            for to_state in np.flatnonzero(self.__probabilities[day, time_step, from_state] > 0)
+        ))
+
     def _validate(self):
-        assert 'weekday' in self.__chain.keys()
-        assert 'weekend' in self.__chain.keys()
-        assert all(isinstance(time_step, datetime.time)
-                   for time_step in self.__chain['weekday'].keys())
-        assert all(isinstance(time_step, datetime.time)
-                   for time_step in self.__chain['weekend'].keys())
-        assert all(isinstance(activity, Activity)
-                   for chain in self.__chain['weekday'].values()
-                   for activity in chain.states())
-        assert all(isinstance(activity, Activity)
-                   for chain in self.__chain['weekend'].values()
-                   for activity in chain.states())
+        number_time_steps = len(list(
+            WeekMarkovChain._day_time_step_generator(self.__time_step_size)
+        ))
+        assert self.__probabilities.shape == (len(DAY_TYPES), number_time_steps,
+                                              len(ACTIVITIES), len(ACTIVITIES))
+        assert (self.__probabilities >= 0).all()
         assert self._valid_transitions()
         assert self._valid_probabilities()
 
     def _valid_probabilities(self):
-        return all(WeekMarkovChain._probabilities_add_to_one(self.__chain[day][time])
-                   for day in ['weekday', 'weekend']
-                   for time in WeekMarkovChain._day_time_step_generator(self.__time_step_size))
-
-    @staticmethod
-    def _probabilities_add_to_one(markov_chain):
-        start_states = [item[0][0] for item in markov_chain.items()]
-        return all(math.isclose(
-                   sum(item[1] for item in markov_chain.items() if item[0][0] == start_state),
-                   1.0,
-                   abs_tol=0.001
-                   ) for start_state in start_states)
+        sums = self.__probabilities.sum(axis=3)
+        return np.isclose(sums[sums > 0], 1.0, rtol=0, atol=0.001).all()
 
     def _valid_transitions(self):
-        flags = [WeekMarkovChain._valid_transition(self.__chain[day][time],
-                                                   self.__chain[next_day][next_time])
-                 for day, time, next_day, next_time
-                 in WeekMarkovChain._all_possible_time_combinations(self.__time_step_size)]
-        return all(flags)
+        return not self._missing_start_states(self._all_possible_slot_combinations()).any()
 
-    @staticmethod
-    def _valid_transition(single_markov_chain, next_single_markov_chain):
-        end_states_first = [x[0][1] for x in single_markov_chain.items()]
-        start_states_second = [x[0][0] for x in next_single_markov_chain.items()]
-        return all([state in start_states_second for state in end_states_first])
+    def _missing_start_states(self, slot_combinations):
+        # (slot combinations x activities), true where an activity can be reached in the
+        # first time step, but not left in the second time step
+        day, time_step, next_day, next_time_step = slot_combinations
+        end_states_current_chain = (self.__probabilities[day, time_step] > 0).any(axis=1)
+        start_states_next_chain = (self.__probabilities[next_day, next_time_step] > 0).any(axis=2)
+        return end_states_current_chain & ~start_states_next_chain
 
     def _add_missing_transitions(self):
-        for day, time in WeekMarkovChain._week_time_steps_generator(self.__time_step_size):
-            next_day, next_time = WeekMarkovChain._add_delta_to_day_and_time(day, time,
-                                                                             self.__time_step_size)
-            current_chain = self.__chain[day][time].items()
-            next_chain = self.__chain[next_day][next_time].items()
-            end_states_current_chain = [x[0][1] for x in current_chain]
-            start_states_next_chain = [x[0][0] for x in next_chain]
-            missing_start_states = [state for state in end_states_current_chain
-                                    if state not in start_states_next_chain]
-            for missing_state in missing_start_states:
-                self._add_transition(
-                    day=next_day,
-                    time=next_time,
-                    from_activity=missing_state,
-                    to_activity=missing_state,
-                    probability=1.0
-                )
+        # As we don't know any likelihood of state transition for states which can be reached,
+        # but not left, we assume the state remains the same. This can lead to further missing
+        # transitions in the following time step, hence transitions are added until none
+        # are missing.
+        slot_combinations = self._all_possible_slot_combinations()
+        _, _, next_day, next_time_step = slot_combinations
+        missing_start_states = self._missing_start_states(slot_combinations)
+        while missing_start_states.any():
+            combination, missing_state = np.nonzero(missing_start_states)
+            day, time_step = next_day[combination], next_time_step[combination]
+            self.__probabilities[day, time_step, missing_state, missing_state] = 1.0
+            self.__added[day, time_step, missing_state] = True
+            missing_start_states = self._missing_start_states(slot_combinations)
+
+    def _start_states(self, day, time_step):
+        # estimated states first, then added ones, each in the order of Activity
+        has_transitions = (self.__probabilities[day, time_step] > 0).any(axis=1)
+        added = self.__added[day, time_step]
+        return (list(np.flatnonzero(has_transitions & ~added)) +
+                list(np.flatnonzero(has_transitions & added)))
+
+    def _position(self, time_stamp):
+        return _time_step_position(time_stamp, self.__time_step_size)
+
+    def _all_possible_slot_combinations(self):
+        # arrays of day, time step, next day, and next time step of all distinct combinations
+        time_steps = list(WeekMarkovChain._day_time_step_generator(self.__time_step_size))
+        time_step_index = {time_step: index for index, time_step in enumerate(time_steps)}
+        combinations = sorted(set(
+            (DAY_TYPES.index(day), time_step_index[time_step],
+             DAY_TYPES.index(next_day), time_step_index[next_time_step])
+            for day, time_step, next_day, next_time_step
+            in WeekMarkovChain._all_possible_time_combinations(self.__time_step_size)
+        ))
+        return tuple(np.array(column) for column in zip(*combinations))
 
-    def _add_transition(self, day, time, from_activity, to_activity, probability):
-        chain = self.__chain[day][time]
-        elements = OrderedDict(chain)
-        elements[(from_activity, to_activity)] = probability
-        self.__chain[day][time] = pykov.Chain(elements)
+    @staticmethod
+    def _state_index(state):
+        assert isinstance(state, Activity)
+        return ACTIVITIES.index(state)
 
     @staticmethod
     def _weekday(time_stamp):
@@ -253,10 +288,10 @@ class WeekMarkovChain():
 
     @staticmethod
     def _day_markov_chain(day_time_series, time_step_size):
-        return {
-            time_step: WeekMarkovChain._markov_chain(time_step, day_time_series, time_step_size)
-            for time_step in WeekMarkovChain._day_time_step_generator(time_step_size)
-        }
+        time_steps = list(WeekMarkovChain._day_time_step_generator(time_step_size))
+        return WeekMarkovChain._transition_probabilities(
+            WeekMarkovChain._encode_states(day_time_series.ix[time_steps].values)
+        )
 
     @staticmethod
     def _day_time_step_generator(time_step_size):
@@ -266,13 +301,6 @@ class WeekMarkovChain():
             yield WeekMarkovChain._add_delta_to_time(start_time,
                                                      datetime.timedelta(minutes=minutes))
 
-    @staticmethod
-    def _week_time_steps_generator(time_step_size):
-        # starts Tuesday so that there are all possible combinations between work and weekend days
-        for day in ['weekday', 'weekday', 'weekday', 'weekday', 'weekend', 'weekend', 'weekday']:
-            for time_step in WeekMarkovChain._day_time_step_generator(time_step_size):
-                yield day, time_step
-
     @staticmethod
     def _all_possible_time_combinations(time_step_size):
         # starts Tuesday so that there are all possible combinations between work and weekend days
@@ -284,28 +312,42 @@ class WeekMarkovChain():
                 yield day, time_step, next_day, next_time
 
     @staticmethod
-    def _markov_chain(time_step, day_time_series, time_step_size):
-        next_time_step = WeekMarkovChain._add_delta_to_time(time_step, time_step_size)
-        current_vector = day_time_series.ix[time_step]
-        next_vector = day_time_series.ix[next_time_step]
-        chain_elements = [((current_state, next_state), WeekMarkovChain._probability(current_state,
-                                                                                     next_state,
-                                                                                     current_vector,
-                                                                                     next_vector))
-                          for current_state in Activity
-                          for next_state in Activity]
-        return pykov.Chain(OrderedDict(chain_elements))
+    def _encode_states(states):
+        # codes activities by their position in Activity; anything else gets the code
+        # len(Activity), so that it still counts as an instance of the previous state
+        codes = np.full(states.shape, len(Activity), dtype=np.int64)
+        for code, activity in enumerate(Activity):
+            codes[states == activity] = code
+        return codes
 
     @staticmethod
-    def _probability(current_state, next_state, current_vector, next_vector):
-        if current_state in current_vector.unique():
-            current_mask = current_vector == current_state
-            next_mask = next_vector == next_state
-            next_instances = (current_mask & next_mask).sum()
-            current_instances = current_mask.sum()
-            return next_instances / current_instances
-        else:
-            return 0
+    def _transition_probabilities(codes):
+        """Estimates the transition probabilities of all time steps of a day at once.
+
+        Parameters:
+            * codes: (time steps x diaries) array of states, coded by `_encode_states`; the
+                     last time step transitions into the first
+
+        Returns:
+            (time steps x activities x activities) array of the probabilities to move from
+            the current activity (second axis) to the next activity (third axis); 0 for
+            activities that no diary is in at a time step
+        """
+        number_codes = len(Activity) + 1
+        number_time_steps = codes.shape[0]
+        transition_codes = ((np.arange(number_time_steps)[:, np.newaxis] * number_codes + codes) *
+                            number_codes + np.roll(codes, -1, axis=0))
+        transitions = np.bincount(
+            transition_codes.ravel(),
+            minlength=number_time_steps * number_codes ** 2
+        ).reshape(number_time_steps, number_codes, number_codes)
+        current_instances = transitions.sum(axis=2, keepdims=True)
+        probabilities = np.where(
+            current_instances > 0,
+            transitions / np.maximum(current_instances, 1),
+            0.0
+        )
+        return probabilities[:, :len(Activity), :len(Activity)]
 
     @staticmethod
     def _add_delta_to_time(time_step, delta):
@@ -322,3 +364,152 @@ class WeekMarkovChain():
         else:
             next_day = 'weekend' if day == 'weekday' else 'weekday'
             return next_day, updated_date.time()
+
+
+class PopulationSimulator():
+    """Simulates the activities of an entire population at once.
+
+    All people move like a `Person` with the same markov chain and initial activity. The
+    activities of all people are held as one integer array, and each time step moves all of
+    them at once with one random number per person. The random number of a person is the one
+    of its random seed in the random stream of the time step, hence the activities of a person
+    are reproducible, independent of the rest of the population.
+
+    Parameters:
+        * markov_chains:      a dict from markov chain id to `WeekMarkovChain`
+        * markov_ids:         the markov chain id of each person
+        * initial_activities: the `Activity` of each person at initial time
+        * random_seeds:       the non-negative integer random seed of each person
+        * initial_time:       the initial time
+        * time_step_size:     the time step size of the simulation, must be consistent with
+                              time step size of markov chains
+    """
+
+    def __init__(self, markov_chains, markov_ids, initial_activities, random_seeds,
+                 initial_time, time_step_size):
+        assert all(chain.time_step_size == time_step_size for chain in markov_chains.values())
+        chain_ids = list(markov_chains.keys())
+        chain_indices = pd.Index(chain_ids).get_indexer(markov_ids)
+        assert (chain_indices >= 0).all(), "Markov chain id of a person is unknown."
+        # grouping people by their markov chain keeps the memory access per time step local
+        self.__order = np.argsort(chain_indices, kind='mergesort')
+        self.__chain_indices = chain_indices[self.__order]
+        self.__random_seeds = np.asarray(random_seeds, dtype=np.int64)[self.__order]
+        self.__activities = np.array(
+            [WeekMarkovChain._state_index(activity) for activity in initial_activities],
+            dtype=np.int64
+        )[self.__order]
+        assert len(self.__chain_indices) == len(self.__random_seeds) == len(self.__activities)
+        probabilities = np.stack([markov_chains[chain_id].probabilities
+                                  for chain_id in chain_ids])
+        # The rows of all chains are flattened, so that a single index per person addresses
+        # the row of its chain, day, time step, and activity. Each next activity is held as a
+        # separate array of that index, as gathering 1-dimensional arrays is fastest.
+        self.__rows_per_chain = np.prod(probabilities.shape[1:4])
+        self.__rows_per_day = np.prod(probabilities.shape[2:4])
+        self.__cumulative_probabilities = [
+            np.ascontiguousarray(column) for column
+            in np.cumsum(probabilities, axis=4).reshape(-1, len(ACTIVITIES)).T
+        ]
+        self.__last_next_states = np.where(
+            (probabilities > 0).any(axis=4),
+            _last_next_states(probabilities),
+            -1
+        ).ravel()
+        self.__time = initial_time
+        self.__time_step_size = time_step_size
+        self.__time_step = 0
+
+    @property
+    def time(self):
+        return self.__time
+
+    @property
+    def number_people(self):
+        return len(self.__activities)
+
+    @property
+    def activities(self):
+        """The activity of each person, as index into `ACTIVITIES`, in the order of people."""
+        activities = np.empty_like(self.__activities)
+        activities[self.__order] = self.__activities
+        return activities
+
+    def step(self):
+        """Run simulation for one time step.
+
+        Chooses new activities of all people.
+        Updates internal time by time step.
+        """
+        day, time_step = _time_step_position(self.__time, self.__time_step_size)
+        rows = (self.__chain_indices * self.__rows_per_chain + day * self.__rows_per_day +
+                time_step * len(ACTIVITIES) + self.__activities)
+        last_next_activities = self.__last_next_states.take(rows)
+        assert (last_next_activities >= 0).all(), \
+            'No transition from the activity of a person at {}.'.format(self.__time)
+        random_numbers = activity_random_numbers(self.__random_seeds, self.__time_step)
+        # like WeekMarkovChain.move, the next activity is the first one whose cumulative
+        # probability exceeds the random number
+        next_activities = np.zeros_like(self.__activities)
+        for cumulative_probabilities in self.__cumulative_probabilities:
+            next_activities += cumulative_probabilities.take(rows) <= random_numbers
+        self.__activities = np.minimum(next_activities, last_next_activities)
+        self.__time += self.__time_step_size
+        self.__time_step += 1
+
+    def occupancy(self, number_time_steps, groups=None):
+        """Simulates a number of time steps and yields the number of people per activity.
+
+        The counts are yielded before each step, starting with the current time.
+
+        Parameters:
+            * number_time_steps: the number of time steps to simulate
+            * groups:            the group of each person, as integer from 0 to number of
+                                 groups - 1, e.g. the dwelling (optional)
+
+        Returns:
+            a generator of tuples of time and an array of the number of people per activity,
+            in the order of `ACTIVITIES`; if groups are given, an array of (groups x activities)
+        """
+        if groups is None:
+            group_codes = np.zeros(self.number_people, dtype=np.int64)
+            number_groups = 1
+        else:
+            group_codes = np.asarray(groups, dtype=np.int64)[self.__order]
+            assert len(group_codes) == self.number_people and (group_codes >= 0).all()
+            number_groups = group_codes.max() + 1 if len(group_codes) > 0 else 0
+        group_codes = group_codes * len(ACTIVITIES)
+        for _ in range(number_time_steps):
+            counts = np.bincount(
+                group_codes + self.__activities,
+                minlength=number_groups * len(ACTIVITIES)
+            ).reshape(number_groups, len(ACTIVITIES))
+            yield self.__time, (counts[0] if groups is None else counts)
+            self.step()
+
+
+def activity_random_numbers(random_seeds, time_step):
+    """The random numbers by which people choose their activity in a time step.
+
+    Parameters:
+        * random_seeds: the random seed of a person, or an array of random seeds
+        * time_step:    the number of the time step, starting with 0 at initial time
+
+    Returns:
+        a random number in [0, 1) for each random seed
+    """
+    return RandomStream(ACTIVITY_RANDOM_STREAM_NAME, time_step).uniform(random_seeds)
+
+
+def _time_step_position(time_stamp, time_step_size):
+    # the day type and the time step of a time stamp
+    minutes = time_stamp.hour * 60 + time_stamp.minute
+    step_minutes = int(time_step_size.total_seconds() / 60)
+    assert minutes % step_minutes == 0 and time_stamp.second == 0,\
+        'Time stamp {} is not a time step of the markov chain.'.format(time_stamp)
+    return DAY_TYPES.index(WeekMarkovChain._weekday(time_stamp)), minutes // step_minutes
+
+
+def _last_next_states(probabilities):
+    # the last activity with positive probability along the last axis
+    return len(ACTIVITIES) - 1 - np.argmax(probabilities[..., ::-1] > 0, axis=-1)
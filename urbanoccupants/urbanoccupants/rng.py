@@ -0,0 +1,75 @@
+"""Counter-based random numbers.
+
+Random numbers are a pure function of a key and one or more counters, instead of the state of a
+sequential generator. The key is derived from a seed and the name of a stream, e.g. a region,
+and the counters identify the random number within the stream, e.g. a household. Hence, any
+part of a stream can be generated independently and in any order, on any process or machine,
+always resulting in the same numbers.
+
+Counters are mixed into the key using the splitmix64 finaliser, see Steele et al. 2014: "Fast
+splittable pseudorandom number generators".
+"""
+import hashlib
+
+import numpy as np
+
+_GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX_MULTIPLIER_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_MULTIPLIER_2 = np.uint64(0x94D049BB133111EB)
+
+
+class RandomStream():
+    """A reproducible stream of random numbers, identified by a seed and a name.
+
+    Parameters:
+        * seed:  the seed of all streams, e.g. an int or a string
+        * names: one or more names identifying the stream, e.g. 'households' and the region
+    """
+
+    def __init__(self, seed, *names):
+        self.__key = _key(seed, names)
+
+    def __repr__(self):
+        return 'RandomStream(key={:#018x})'.format(int(self.__key))
+
+    def uniform(self, *counters):
+        """Random numbers in [0, 1), one for each element of the broadcast counters.
+
+        Parameters:
+            * counters: one or more non-negative integers or integer arrays, which are
+                        broadcast against each other
+
+        Returns:
+            a float or an array of floats in the shape of the broadcast counters
+        """
+        return self._bits(counters, 53) / 2 ** 53
+
+    def integers(self, *counters):
+        """Random non-negative 63 bit integers, one for each element of the broadcast counters.
+
+        See `uniform` for the parameters.
+        """
+        return self._bits(counters, 63).astype(np.int64)
+
+    def _bits(self, counters, number_bits):
+        state = np.full(np.broadcast(*counters).shape, self.__key, dtype=np.uint64)
+        for counter in counters:
+            state = _mix(state ^ _mix(np.asarray(counter).astype(np.uint64) + _GOLDEN_GAMMA))
+        bits = state >> np.uint64(64 - number_bits)
+        return bits if bits.ndim > 0 else bits[()]
+
+
+def _key(seed, names):
+    sha = hashlib.sha256()
+    for part in (seed, ) + tuple(names):
+        sha.update(repr(part).encode())
+        sha.update(b'\0')
+    return np.uint64(int.from_bytes(sha.digest()[:8], byteorder='little'))
+
+
+def _mix(z):
+    # splitmix64 finaliser; overflows are the intended modulo 2 ** 64 arithmetic
+    with np.errstate(over='ignore'):
+        z = (z ^ (z >> np.uint64(30))) * _MIX_MULTIPLIER_1
+        z = (z ^ (z >> np.uint64(27))) * _MIX_MULTIPLIER_2
+    return z ^ (z >> np.uint64(31))
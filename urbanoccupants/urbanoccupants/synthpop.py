@@ -1,11 +1,15 @@
 from collections import namedtuple
 from enum import Enum
+import hashlib
 from itertools import chain
 import math
+from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
-from .hipf import fit_hipf
+from .hipf import fit_hipf, fit_hipf_batch, PHASES, sample_values, encode_control
+from .rng import RandomStream
 from .types import AgeStructure, EconomicActivity, HouseholdType, Qualification, Pseudo, Carer,\
     PersonalIncome, PopulationDensity, Region
 from .tus import AGE_MAP, ECONOMIC_ACTIVITY_MAP, HOUSEHOLDTYPE_MAP, QUALIFICATION_MAP, PSEUDO_MAP,\
@@ -17,12 +21,15 @@ from .census import read_age_structure_data, read_household_type_data, \
 Household = namedtuple('Household', ['id', 'seedId', 'region'])
 Citizen = namedtuple('Citizen', ['householdId', 'markovId', 'initialActivity',
                                  'activeMetabolicRate', 'passiveMetabolicRate', 'randomSeed'])
+SeedMembers = namedtuple('SeedMembers', ['households', 'offsets', 'sizes', 'markov_id',
+                                         'initial_activity', 'metabolic_heat_gain_active',
+                                         'metabolic_heat_gain_passive'])
 
 RANDOM_SEED = 123456789
-MAX_HOUSEHOLD_SIZE = 70
 
 
-def _unimplemented_census_read_function(geographical_layer):
+def _unimplemented_census_read_function(geographical_layer, local_authority=None,
+                                        census_store=None):
     # lambda function cannot raise errors, hence the function definition here
     raise NotImplementedError()
 
@@ -48,8 +55,8 @@ class HouseholdFeature(Enum):
         return feature_values.map(self.tus_mapping)
         return new_values
 
-    def read_census_data(self, geographical_layer):
-        return self._census_read_function(geographical_layer)
+    def read_census_data(self, geographical_layer, local_authority=None, census_store=None):
+        return self._census_read_function(geographical_layer, local_authority, census_store)
 
 
 class PeopleFeature(Enum):
@@ -88,19 +95,51 @@ class PeopleFeature(Enum):
             new_values[age > 74] = self.uo_type.ABOVE_74
         return new_values
 
-    def read_census_data(self, geographical_layer):
-        data = self._census_read_function(geographical_layer)
+    def read_census_data(self, geographical_layer, local_authority=None, census_store=None):
+        data = self._census_read_function(geographical_layer, local_authority, census_store)
         if not self._includes_below_16:
-            usual_residents = PeopleFeature.AGE.read_census_data(geographical_layer)
+            usual_residents = PeopleFeature.AGE.read_census_data(geographical_layer,
+                                                                 local_authority,
+                                                                 census_store)
             younger_than_sixteen = usual_residents.ix[:, :AgeStructure.AGE_15].sum(axis=1)
             data[self.uo_type.BELOW_16] = younger_than_sixteen
         if not self._includes_above_74:
-            usual_residents = PeopleFeature.AGE.read_census_data(geographical_layer)
+            usual_residents = PeopleFeature.AGE.read_census_data(geographical_layer,
+                                                                 local_authority,
+                                                                 census_store)
             older_than_74 = usual_residents.ix[:, AgeStructure.AGE_75_TO_84:].sum(axis=1)
             data[self.uo_type.ABOVE_74] = older_than_74
         return data
 
 
+class HouseholdSampling(Enum):
+    """Methods to create the households of a region from the fitted weights of the seed.
+
+    * RANDOM: draws each household randomly from the seed, with probabilities proportional to
+              the weights, see `sample_households`
+    * TRS:    integerises the weights by truncate, replicate, sample, drawing only the fractional
+              remainders randomly, see `integerise_households`
+    """
+    RANDOM = 1
+    TRS = 2
+
+    @property
+    def sample_function(self):
+        """The function creating households, with the parameters of `sample_households`."""
+        return {
+            HouseholdSampling.RANDOM: sample_households,
+            HouseholdSampling.TRS: integerise_households
+        }[self]
+
+    @property
+    def sample_replicates_function(self):
+        """The function creating replicates of households, see `sample_household_replicates`."""
+        return {
+            HouseholdSampling.RANDOM: sample_household_replicates,
+            HouseholdSampling.TRS: integerise_household_replicates
+        }[self]
+
+
 def _pairing_function(x, y):
     # cantor pairing function, http://stackoverflow.com/a/919661/1856079
     return int(1 / 2 * (x + y) * (x + y + 1) + y)
@@ -141,13 +180,15 @@ def run_hipf(param_tuple):
         * param_tuple(1): the controls for the households
         * param_tuple(2): the controls for the individuals
         * param_tuple(3): the region string, not used here, only bypassed
+        * param_tuple(4): initial weights for the households in the seed (optional)
 
     Returns:
         a tuple of
             * param_tuple(3)
             * the fitted weights for the households in the seed
     """
-    seed, controls_hh, controls_ppl, region = param_tuple
+    seed, controls_hh, controls_ppl, region = param_tuple[:4]
+    initial_weights = param_tuple[4] if len(param_tuple) > 4 else None
     number_households = list(controls_hh.values())[0].sum()
     household_weights = fit_hipf(
         reference_sample=seed,
@@ -155,13 +196,433 @@ def run_hipf(param_tuple):
         controls_individuals=controls_ppl,
         residuals_tol=0.0001,
         weights_tol=0.0001,
-        maxiter=100
+        maxiter=100,
+        engine='numpy',
+        compress=True,
+        initial_weights=initial_weights
     )
     assert number_households - household_weights.sum() < 0.1
     assert not any(household_weights.isnull())
     return (region, household_weights)
 
 
+class ControlCube():
+    """The controls of several features for all regions, held in one contiguous integer array.
+
+    The categories of all controls are laid out side by side along the second axis of a
+    (regions x categories) array. Hence, the controls of a region are a single row, and the
+    controls of a feature are a contiguous block of columns.
+
+    Parameters:
+        * regions:  the regions along the first axis
+        * controls: a list of (control name, categories) tuples, in the order of their blocks
+        * values:   the (regions x categories) array of controls
+    """
+
+    def __init__(self, regions, controls, values):
+        self.__regions = pd.Index(regions)
+        self.__control_names = [control_name for control_name, _ in controls]
+        self.__categories = [list(categories) for _, categories in controls]
+        assert all(len(categories) > 0 for categories in self.__categories)
+        self.__offsets = np.cumsum([0] + [len(categories) for categories in self.__categories])
+        self.__values = np.ascontiguousarray(values, dtype=np.int64)
+        assert self.__values.shape == (len(self.__regions), self.__offsets[-1])
+
+    @classmethod
+    def from_census_data(cls, census_data):
+        """Creates a cube from census data of several features.
+
+        Parameters:
+            * census_data: a dict from control name to a DataFrame with regions as index and
+                           categories as columns; all DataFrames must have the same regions
+
+        Returns:
+            a `ControlCube` with the regions in the order of the first DataFrame
+        """
+        control_names = list(census_data.keys())
+        regions = census_data[control_names[0]].index
+        for data in census_data.values():
+            assert len(data.index) == len(regions) and data.index.isin(regions).all(),\
+                "Census data of all features must have the same regions."
+        return cls(
+            regions=regions,
+            controls=[(control_name, census_data[control_name].columns)
+                      for control_name in control_names],
+            values=np.hstack([census_data[control_name].ix[regions, :].values
+                              for control_name in control_names])
+        )
+
+    @property
+    def regions(self):
+        return self.__regions
+
+    @property
+    def control_names(self):
+        return list(self.__control_names)
+
+    @property
+    def values(self):
+        """The (regions x categories) array of all controls."""
+        return self.__values
+
+    def categories(self, control_name):
+        return list(self.__categories[self.__control_names.index(control_name)])
+
+    def control(self, control_name):
+        """Returns the controls of a single feature as DataFrame with regions as index."""
+        position = self.__control_names.index(control_name)
+        return pd.DataFrame(
+            self.__values[:, self.__offsets[position]:self.__offsets[position + 1]],
+            index=self.__regions,
+            columns=self.__categories[position]
+        )
+
+    def to_dict(self):
+        """Returns the controls as dict from control name to DataFrame with regions as index."""
+        return {control_name: self.control(control_name)
+                for control_name in self.__control_names}
+
+    def select_regions(self, regions):
+        """Returns a cube of the given regions only."""
+        positions = self.__regions.get_indexer(pd.Index(regions))
+        assert (positions >= 0).all(), "Unknown regions."
+        return ControlCube(
+            regions=self.__regions[positions],
+            controls=list(zip(self.__control_names, self.__categories)),
+            values=self.__values[positions]
+        )
+
+    def grand_totals(self):
+        """Returns the sum of each control in each region as (regions x controls) array."""
+        return np.add.reduceat(self.__values, self.__offsets[:-1], axis=1)
+
+    def consistent_grand_totals(self):
+        """Returns for each region whether the grand totals of all controls are the same."""
+        grand_totals = self.grand_totals()
+        return (grand_totals == grand_totals[:, :1]).all(axis=1)
+
+
+def _controls_dict(controls):
+    return controls.to_dict() if isinstance(controls, ControlCube) else controls
+
+
+def run_hipf_batch(seed, controls_hh, controls_ppl, weight_store=None, path_to_report=None,
+                   pool=None, number_batches=1):
+    """Performs HIPF for all geographical regions at once.
+
+    In contrast to `run_hipf` the seed is encoded only once, and all regions are fitted
+    simultaneously as a (regions x households) weight matrix.
+
+    When given a `WeightStore`, only regions whose inputs have changed since they have been
+    stored are fitted. These are warm-started from the nearest stored solution.
+
+    See `urbanoccupants.hipf.fit_hipf_batch` for further information on the algorithm and
+    parameters.
+
+    When given a path to a report, the convergence traces of all regions are aggregated into
+    a per-region report, see `hipf_report`, which is written as csv before the fitted weights
+    are checked.
+
+    When given a pool, the regions to fit are divided into batches which are fitted in
+    parallel. As convergence is checked for each region individually, the weights do not
+    depend on the batches.
+
+    Parameters:
+        * seed:           the seed for the fitting
+        * controls_hh:    the controls for the households, a `ControlCube` or a dict from
+                          control name to a DataFrame with regions as index
+        * controls_ppl:   the controls for the individuals, in the same format as controls_hh
+        * weight_store:   a `WeightStore` of previously fitted weights (optional)
+        * path_to_report: the path of the csv file the report is written to (optional)
+        * pool:           a `multiprocessing.Pool` to fit batches of regions in (optional)
+        * number_batches: the number of batches the regions are divided into (optional,
+                          default: 1)
+
+    Returns:
+        a dict from region to the fitted weights for the households in the seed
+    """
+    controls_hh = _controls_dict(controls_hh)
+    controls_ppl = _controls_dict(controls_ppl)
+    number_households = list(controls_hh.values())[0].sum(axis=1)
+    if weight_store is None:
+        cached_weights = pd.DataFrame()
+        initial_weights = None
+    else:
+        cached_weights = weight_store.cached_weights(seed, controls_hh, controls_ppl)
+        initial_weights = weight_store.initial_weights(seed, controls_hh, controls_ppl)
+    regions_to_fit = number_households.index.difference(cached_weights.index)
+    if len(regions_to_fit) > 0:
+        controls_hh = {name: controls.ix[regions_to_fit, :]
+                       for name, controls in controls_hh.items()}
+        controls_ppl = {name: controls.ix[regions_to_fit, :]
+                        for name, controls in controls_ppl.items()}
+        batch_params = ( # imap allows only one parameter, hence the tuple
+            (seed,
+             {name: controls.ix[batch, :] for name, controls in controls_hh.items()},
+             {name: controls.ix[batch, :] for name, controls in controls_ppl.items()},
+             None if initial_weights is None else initial_weights.reindex(batch))
+            for batch in np.array_split(regions_to_fit, min(number_batches, len(regions_to_fit)))
+        )
+        batches = list((map if pool is None else pool.imap)(_fit_hipf_region_batch,
+                                                            batch_params))
+        fitted_weights = pd.concat([weights for weights, _ in batches])
+        traces = dict(chain.from_iterable(batch_traces.items() for _, batch_traces in batches))
+        if weight_store is not None:
+            weight_store.add(seed, controls_hh, controls_ppl, fitted_weights)
+    else:
+        fitted_weights = pd.DataFrame()
+        traces = {}
+    household_weights = pd.concat([cached_weights, fitted_weights]).ix[number_households.index]
+    if path_to_report is not None:
+        hipf_report(traces, household_weights, number_households).to_csv(str(path_to_report))
+    assert ((number_households - household_weights.sum(axis=1)) < 0.1).all()
+    assert not household_weights.isnull().any().any()
+    return {region: household_weights.ix[region, :] for region in household_weights.index}
+
+
+def _fit_hipf_region_batch(param_tuple):
+    seed, controls_hh, controls_ppl, initial_weights = param_tuple
+    return fit_hipf_batch(
+        reference_sample=seed,
+        controls_households=controls_hh,
+        controls_individuals=controls_ppl,
+        residuals_tol=0.0001,
+        weights_tol=0.0001,
+        maxiter=100,
+        initial_weights=initial_weights,
+        return_trace=True
+    )
+
+
+def hipf_report(traces, household_weights, number_households):
+    """Aggregates the convergence traces of HIPF into a per-region report.
+
+    Parameters:
+        * traces:            a dict from region to its `urbanoccupants.hipf.HipfTrace`; regions
+                             without trace are reported as cached
+        * household_weights: a DataFrame of the fitted weights with regions as index
+        * number_households: a Series of the number of households in each region
+
+    Returns:
+        a DataFrame with regions as index and the following columns
+            * cached:               whether the weights have not been fitted but read from cache
+            * iterations:           the number of iterations
+            * max_residual:         the maximum absolute residual after the last iteration
+            * max_weight_change:    the maximum relative weight change in the last iteration
+            * <phase> duration [s]: the time spent in each phase of `urbanoccupants.hipf.PHASES`
+            * households:           the number of households in the region
+            * household deviation:  the number of households minus the sum of the fitted weights
+    """
+    report = pd.DataFrame(
+        index=number_households.index,
+        columns=['cached', 'iterations', 'max_residual', 'max_weight_change'] +
+                ['{} duration [s]'.format(phase) for phase in PHASES] +
+                ['households', 'household deviation']
+    )
+    report['cached'] = [region not in traces for region in report.index]
+    for region, trace in traces.items():
+        report.ix[region, 'iterations'] = trace.iterations
+        if trace.iterations > 0:
+            report.ix[region, 'max_residual'] = trace.max_residuals[-1]
+            report.ix[region, 'max_weight_change'] = trace.max_weight_changes[-1]
+        for phase, duration in trace.total_durations.items():
+            report.ix[region, '{} duration [s]'.format(phase)] = duration
+    report['households'] = number_households
+    report['household deviation'] = number_households - household_weights.sum(axis=1)
+    return report
+
+
+class WeightStore():
+    """A persistent store of fitted household weights of single regions.
+
+    Weights are keyed by a hash of the seed, the features, and the controls of a region. Hence,
+    the weights of a region are found again as long as none of its inputs has changed. The
+    solutions stored for the same seed and features can further be used to warm-start the
+    fitting of regions whose controls have changed.
+
+    Parameters:
+        * path: the directory in which the weights are stored
+    """
+
+    def __init__(self, path):
+        self.__path = Path(path)
+
+    def cached_weights(self, seed, controls_hh, controls_ppl):
+        """Returns the stored weights of all regions with unchanged inputs.
+
+        Returns:
+            a DataFrame with regions as index and households as columns
+        """
+        stored_controls, stored_weights = self._read(seed, controls_hh, controls_ppl)
+        region_keys = WeightStore._region_keys(controls_hh, controls_ppl)
+        region_keys = region_keys[region_keys.isin(stored_weights.index)]
+        weights = stored_weights.ix[region_keys.values, :]
+        weights.index = region_keys.index
+        return weights
+
+    def initial_weights(self, seed, controls_hh, controls_ppl):
+        """Returns initial weights from the nearest stored solution of each region.
+
+        The nearest solution is the one whose controls have the smallest absolute difference in
+        shares. Its weights are scaled to the number of households of the region.
+
+        Returns:
+            a DataFrame with regions as index and households as columns, or None if there are
+            no stored solutions for the seed and features
+        """
+        stored_controls, stored_weights = self._read(seed, controls_hh, controls_ppl)
+        if stored_weights.empty:
+            return None
+        controls = WeightStore._controls_vectors(controls_hh, controls_ppl)
+        shares = controls.values / controls.values.sum(axis=1, keepdims=True)
+        stored_shares = stored_controls.values / stored_controls.values.sum(axis=1, keepdims=True)
+        distances = np.abs(shares[:, np.newaxis, :] - stored_shares[np.newaxis, :, :]).sum(axis=2)
+        nearest = distances.argmin(axis=1)
+        scaling = (WeightStore._number_households(controls_hh).values /
+                   stored_weights.values[nearest].sum(axis=1))
+        return pd.DataFrame(
+            stored_weights.values[nearest] * scaling[:, np.newaxis],
+            index=controls.index,
+            columns=stored_weights.columns
+        )
+
+    def add(self, seed, controls_hh, controls_ppl, weights):
+        """Stores the fitted weights of all regions, given as regions x households DataFrame."""
+        stored_controls, stored_weights = self._read(seed, controls_hh, controls_ppl)
+        region_keys = WeightStore._region_keys(controls_hh, controls_ppl)
+        controls = WeightStore._controls_vectors(controls_hh, controls_ppl)
+        controls.index = region_keys.values
+        weights = weights.ix[region_keys.index, :]
+        weights.index = region_keys.values
+        stored_controls = pd.concat([stored_controls, controls])
+        stored_weights = pd.concat([stored_weights, weights])
+        unique = ~stored_weights.index.duplicated(keep='last')
+        self.__path.mkdir(parents=True, exist_ok=True)
+        pd.to_pickle(
+            (stored_controls[unique], stored_weights[unique]),
+            self._path_to_store(seed, controls_hh, controls_ppl).as_posix()
+        )
+
+    def _read(self, seed, controls_hh, controls_ppl):
+        path_to_store = self._path_to_store(seed, controls_hh, controls_ppl)
+        if path_to_store.exists():
+            return pd.read_pickle(path_to_store.as_posix())
+        else:
+            return pd.DataFrame(), pd.DataFrame()
+
+    def _path_to_store(self, seed, controls_hh, controls_ppl):
+        features = sorted(chain(controls_hh.keys(), controls_ppl.keys()))
+        sha = hashlib.sha256()
+        sha.update(str(features).encode())
+        sha.update(seed[features].to_csv().encode())
+        return self.__path / '{}.pickle'.format(sha.hexdigest())
+
+    @staticmethod
+    def _controls_vectors(controls_hh, controls_ppl):
+        controls = dict(chain(controls_hh.items(), controls_ppl.items()))
+        return pd.concat([controls[name] for name in sorted(controls.keys())], axis=1)
+
+    @staticmethod
+    def _number_households(controls_hh):
+        return list(controls_hh.values())[0].sum(axis=1)
+
+    @staticmethod
+    def _region_keys(controls_hh, controls_ppl):
+        controls = dict(chain(controls_hh.items(), controls_ppl.items()))
+        keys = {}
+        for region in list(controls_hh.values())[0].index:
+            sha = hashlib.sha256()
+            for name in sorted(controls.keys()):
+                sha.update(str(name).encode())
+                sha.update(str(list(controls[name].columns)).encode())
+                sha.update(controls[name].ix[region, :].values.astype(np.int64).tobytes())
+            keys[region] = sha.hexdigest()
+        return pd.Series(keys)
+
+
+class Population():
+    """A synthetic population of households and their citizens, stored column-wise.
+
+    Each field of `Household` and of `Citizen` is stored as one numpy array over all
+    households and citizens respectively, instead of as lists of tuples. Populations of
+    several regions or chunks can be concatenated, and the columns can be handed over to
+    pandas or database writers without touching single households or citizens.
+
+    Parameters:
+        * households: a dict from each field of `Household` to an array of its values
+        * citizens:   a dict from each field of `Citizen` to an array of its values
+                      (optional, default: no citizens)
+    """
+
+    def __init__(self, households, citizens=None):
+        if citizens is None:
+            citizens = {field: np.empty(0) for field in Citizen._fields}
+        self.__households = {field: _column(households[field]) for field in Household._fields}
+        self.__citizens = {field: _column(citizens[field]) for field in Citizen._fields}
+        assert len(set(len(column) for column in self.__households.values())) == 1
+        assert len(set(len(column) for column in self.__citizens.values())) == 1
+
+    @classmethod
+    def from_households(cls, region, household_ids, seed_household_ids):
+        """Creates a population of households of a single region, without citizens."""
+        return cls(households={
+            'id': np.asarray(household_ids, dtype=np.int64),
+            'seedId': seed_household_ids,
+            'region': np.repeat(np.array([region], dtype=object), len(household_ids))
+        })
+
+    @staticmethod
+    def concat(populations):
+        """Concatenates the households and citizens of several populations."""
+        populations = list(populations)
+        assert len(populations) > 0
+        return Population(
+            households={field: np.concatenate([population.household_column(field)
+                                               for population in populations])
+                        for field in Household._fields},
+            citizens={field: np.concatenate([population.citizen_column(field)
+                                             for population in populations])
+                      for field in Citizen._fields}
+        )
+
+    @property
+    def number_households(self):
+        return len(self.__households['id'])
+
+    @property
+    def number_citizens(self):
+        return len(self.__citizens['householdId'])
+
+    @property
+    def households(self):
+        """The households as a DataFrame with the fields of `Household` as columns."""
+        return pd.DataFrame(self.__households, columns=Household._fields)
+
+    @property
+    def citizens(self):
+        """The citizens as a DataFrame with the fields of `Citizen` as columns."""
+        return pd.DataFrame(self.__citizens, columns=Citizen._fields)
+
+    def household_column(self, field):
+        """The array of the given `Household` field of all households, not copied."""
+        return self.__households[field]
+
+    def citizen_column(self, field):
+        """The array of the given `Citizen` field of all citizens, not copied."""
+        return self.__citizens[field]
+
+    def with_citizens(self, citizens):
+        """Returns a population of the same households with the given citizens."""
+        return Population(self.__households, citizens)
+
+
+def _column(values):
+    # values like tuple ids must become a one dimensional object array, not a two dimensional one
+    if isinstance(values, np.ndarray):
+        return values
+    return pd.Index(values, tupleize_cols=False).values
+
+
 def sample_households(param_tuple):
     """Samples households from a seed with fitted weights.
 
@@ -176,45 +637,360 @@ def sample_households(param_tuple):
         * param_tuple(4): an id for each household, to ensure reproducibility
 
     Returns:
-        a list of Households
+        a `Population` of the sampled households, without citizens
     """
     region, seed, household_weights, random_numbers, household_ids = param_tuple
     assert len(random_numbers) == len(household_ids)
 
+    seed_hh_ids = household_weights.index[_sample_positions(household_weights, random_numbers)]
+    return Population.from_households(region, household_ids, seed_hh_ids)
+
+
+def sample_household_replicates(param_tuple):
+    """Samples several replicates of households from a seed with fitted weights at once.
+
+    Each replicate is sampled like in `sample_households`, but all replicates are drawn in a
+    single vectorised pass.
+
+    This function is intened to be used with `multiprocessing.imap_unordered` which allows
+    only one parameter, hence the inconvenient tuple parameter design.
+
+    Parameters:
+        * param_tuple(0): the region string
+        * param_tuple(1): the seed from which to sample
+        * param_tuple(2): the fitted weights on household level
+        * param_tuple(3): a random number for each replicate and household, as a nested list or
+                          array of shape (replicates x households), to ensure reproducibility
+        * param_tuple(4): an id for each household, to ensure reproducibility; the ids are the
+                          same in all replicates
+
+    Returns:
+        a list of replicates, each a `Population` of the sampled households, without citizens
+    """
+    region, seed, household_weights, random_numbers, household_ids = param_tuple
+    random_numbers = np.asarray(random_numbers, dtype=np.float64)
+    assert random_numbers.ndim == 2
+    assert random_numbers.shape[1] == len(household_ids)
+
+    positions = _sample_positions(household_weights, random_numbers)
+    return [Population.from_households(region, household_ids,
+                                       household_weights.index[replicate_positions])
+            for replicate_positions in positions]
+
+
+def _sample_positions(household_weights, random_numbers):
+    # the position of the first seed household whose cumulative weight reaches the random
+    # number, for random numbers of any shape at once; random numbers beyond the last
+    # cumulative weight due to rounding are mapped to the last household
     norm_hh_weights = household_weights / household_weights.sum()
     cum_norm_hh_weights = norm_hh_weights.cumsum()
     assert math.isclose(cum_norm_hh_weights[-1], 1, abs_tol=0.001)
 
-    seed_hh_ids = (cum_norm_hh_weights[cum_norm_hh_weights >= random_number].index[0]
-                   for random_number in random_numbers)
-    return [Household(household_id, seed_hh_ids, region)
-            for household_id, seed_hh_ids in zip(household_ids, seed_hh_ids)]
+    positions = np.searchsorted(cum_norm_hh_weights.values, random_numbers, side='left')
+    return np.minimum(positions, len(cum_norm_hh_weights) - 1)
+
+
+def integerise_households(param_tuple):
+    """Integerises fitted weights of a seed to households by truncate, replicate, sample.
+
+    Algorithm taken from
+    Lovelace and Ballas 2013: "'Truncate, replicate, sample': A method for creating integer
+    weights for spatial microsimulation"
+
+    Weights are scaled to the number of households, and each seed household is replicated
+    as often as the integer part of its weight. The remaining households are sampled
+    systematically with probabilities equal to the fractional parts of the weights, which
+    requires a single random number only. Hence, compared to `sample_households`, the runtime
+    depends on the size of the seed only and the sampling noise is much lower.
+
+    This function is intened to be used with `multiprocessing.imap_unordered` which allows
+    only one parameter, hence the inconvenient tuple parameter design.
+
+    Parameters:
+        * param_tuple(0): the region string
+        * param_tuple(1): the seed from which to sample
+        * param_tuple(2): the fitted weights on household level
+        * param_tuple(3): a random number for each household, to ensure reproducibility; only
+                          the first one is used
+        * param_tuple(4): an id for each household, to ensure reproducibility
+
+    Returns:
+        a `Population` of the sampled households, without citizens
+    """
+    region, seed, household_weights, random_numbers, household_ids = param_tuple
+    assert len(random_numbers) == len(household_ids)
+    number_households = len(household_ids)
+
+    weights = household_weights.values * number_households / household_weights.sum()
+    counts = np.floor(weights).astype(np.int64)
+    number_remainders = number_households - counts.sum()
+    if number_remainders > 0:
+        cum_remainders = np.cumsum(weights - counts)
+        # all remainders are smaller than 1, hence no household is sampled twice, and households
+        # without remainder are never sampled
+        positions = np.searchsorted(
+            cum_remainders,
+            (random_numbers[0] + np.arange(number_remainders)) * cum_remainders[-1] /
+            number_remainders,
+            side='right'
+        )
+        positions = np.minimum(positions, len(counts) - 1)
+        np.add.at(counts, positions, 1)
+    seed_hh_ids = household_weights.index[np.repeat(np.arange(len(counts)), counts)]
+    assert len(seed_hh_ids) == number_households
+    return Population.from_households(region, household_ids, seed_hh_ids)
+
+
+def integerise_household_replicates(param_tuple):
+    """Integerises fitted weights of a seed to several replicates of households.
+
+    Each replicate is integerised like in `integerise_households`, using the first random
+    number of the replicate.
+
+    Parameters:
+        see `sample_household_replicates`
+
+    Returns:
+        a list of replicates, each a `Population` of the sampled households, without citizens
+    """
+    region, seed, household_weights, random_numbers, household_ids = param_tuple
+    return [integerise_households((region, seed, household_weights, replicate_random_numbers,
+                                   household_ids))
+            for replicate_random_numbers in random_numbers]
+
+
+def index_seed_members(seed):
+    """Indexes the members of all seed households for the sampling of citizens.
+
+    The members of each seed household are stored contiguously, so that the members of any
+    seed household are given by its offset and size.
+
+    Parameters:
+        * seed: the seed, with a multi index of (household_id, person_id)
+
+    Returns:
+        a `SeedMembers` tuple of
+            * households: the seed household ids
+            * offsets:    the position of the first member of each seed household
+            * sizes:      the number of members of each seed household
+            * the member attributes needed for Citizens, as arrays of all members
+    """
+    households, sizes, order = _seed_member_order(seed)
+    return SeedMembers(
+        households=households,
+        offsets=np.cumsum(sizes) - sizes,
+        sizes=sizes,
+        markov_id=seed['markov_id'].values[order],
+        initial_activity=seed['initial_activity'].values[order],
+        metabolic_heat_gain_active=seed['metabolic_heat_gain_active'].values[order],
+        metabolic_heat_gain_passive=seed['metabolic_heat_gain_passive'].values[order]
+    )
+
+
+def _seed_member_order(seed):
+    member_household, households = pd.factorize(seed.index.get_level_values(0), sort=True)
+    order = np.argsort(member_household, kind='mergesort') # keeps the order of members
+    sizes = np.bincount(member_household, minlength=len(households))
+    return households, sizes, order
 
 
 def sample_citizen(param_tuple):
     """Samples citizens from a seed for a given set of sampled households.
 
+    All citizens of the given households are created at once, by gathering the members of the
+    households' seed households from the indexed seed, see `index_seed_members`.
+
     This function is intened to be used with `multiprocessing.imap_unordered` which allows
     only one parameter, hence the inconvenient tuple parameter design.
 
     Parameters:
-        * param_tuple(0): the households for which citizens should be sampled
-        * param_tuple(1): the seed from which to sample
+        * param_tuple(0): the `Population` of households for which citizens should be sampled
+        * param_tuple(1): the seed from which to sample, either as `SeedMembers` or as the
+                          seed DataFrame itself, which is then indexed for this call only
+
+    Returns:
+        the `Population` of the given households and their citizens
+    """
+    population, seed_members = param_tuple
+    if not isinstance(seed_members, SeedMembers):
+        seed_members = index_seed_members(seed_members)
+    seed_households, sizes, occupant_ids, members = _member_positions(population, seed_members)
+    household_ids = np.repeat(population.household_column('id'), sizes)
+    return population.with_citizens({
+        'householdId': household_ids,
+        'markovId': seed_members.markov_id[members],
+        'initialActivity': seed_members.initial_activity[members],
+        'activeMetabolicRate': seed_members.metabolic_heat_gain_active[members],
+        'passiveMetabolicRate': seed_members.metabolic_heat_gain_passive[members],
+        'randomSeed': _citizen_random_seed(household_ids, occupant_ids)
+    })
+
+
+def _member_positions(population, seed_members):
+    # the seed households of all households of the population, their sizes, and for all
+    # citizens the occupant id within the household and the position of its seed member
+    seed_households = seed_members.households.get_indexer(
+        pd.Index(population.household_column('seedId'), tupleize_cols=False)
+    )
+    assert (seed_households >= 0).all(), "Households are sampled from an unknown seed household."
+    sizes = seed_members.sizes[seed_households]
+    first_citizen = np.repeat(np.cumsum(sizes) - sizes, sizes)
+    occupant_ids = np.arange(sizes.sum()) - first_citizen
+    members = np.repeat(seed_members.offsets[seed_households], sizes) + occupant_ids
+    return seed_households, sizes, occupant_ids, members
+
+
+def stream_population(households, seed_members, chunk_size):
+    """Samples citizens for a stream of households, chunk by chunk.
+
+    Households, e.g. of single regions, are collected until there are at least `chunk_size`
+    of them. Then the citizens of the chunk are sampled, and the chunk is yielded. Chunks are
+    never split, hence a chunk is at most as large as `chunk_size` plus the largest of the
+    given populations, and so is the memory held by this generator.
+
+    Parameters:
+        * households:   an iterable of `Population`s of households without citizens
+        * seed_members: the seed from which to sample citizens, see `sample_citizen`
+        * chunk_size:   the minimum number of households in each chunk, apart from the last
+
+    Yields:
+        `Population`s of households and their citizens
+    """
+    assert chunk_size > 0
+    if not isinstance(seed_members, SeedMembers):
+        seed_members = index_seed_members(seed_members)
+    pending = []
+    number_pending_households = 0
+    for population in households:
+        pending.append(population)
+        number_pending_households += population.number_households
+        if number_pending_households >= chunk_size:
+            yield sample_citizen((Population.concat(pending), seed_members))
+            pending = []
+            number_pending_households = 0
+    if len(pending) > 0:
+        yield sample_citizen((Population.concat(pending), seed_members))
+
+
+class GoodnessOfFit():
+    """The goodness of fit of a synthetic population to the census controls of its regions.
+
+    The numbers of households and citizens of each region in each category of each control are
+    accumulated population by population, hence the fit of a population that is sampled in
+    chunks can be assessed without holding the entire population in memory. All counts of a
+    population are gathered in a single `bincount` over the combined codes of region and
+    category.
+
+    Parameters:
+        * seed:         the seed from which the population has been sampled
+        * controls_hh:  the controls for the households, a `ControlCube` or a dict from control
+                        name to a DataFrame with regions as index and categories as columns
+        * controls_ppl: the controls for the individuals, in the same format as controls_hh
+    """
+
+    def __init__(self, seed, controls_hh, controls_ppl):
+        controls_hh = _controls_dict(controls_hh)
+        controls_ppl = _controls_dict(controls_ppl)
+        self.__regions = list(controls_hh.values())[0].index
+        self.__seed_members = index_seed_members(seed)
+        _, _, order = _seed_member_order(seed)
+        self.__controls = []
+        offset = 0
+        for controls, on_household_level in [(controls_hh, True), (controls_ppl, False)]:
+            for control_name, control_values in controls.items():
+                codes, targets = encode_control(sample_values(seed, control_name),
+                                                control_values.ix[self.__regions, :])
+                codes = codes[order]
+                if on_household_level: # household values are constant for all members
+                    codes = codes[self.__seed_members.offsets]
+                self.__controls.append(
+                    (control_name, on_household_level, codes, offset, targets)
+                )
+                offset += targets.shape[1]
+        self.__number_categories = offset
+        self.__counts = np.zeros(len(self.__regions) * offset, dtype=np.int64)
+
+    def add(self, population):
+        """Adds the households and citizens of a population.
+
+        Parameters:
+            * population: a `Population` of households and their citizens
+        """
+        regions = self.__regions.get_indexer(
+            pd.Index(population.household_column('region'), tupleize_cols=False)
+        )
+        assert (regions >= 0).all(), "Population contains regions without controls."
+        seed_households, sizes, _, members = _member_positions(population, self.__seed_members)
+        assert population.number_citizens == sizes.sum()
+        citizen_regions = np.repeat(regions, sizes)
+        codes = [
+            (regions if on_household_level else citizen_regions) * self.__number_categories +
+            offset +
+            category_codes[seed_households if on_household_level else members]
+            for _, on_household_level, category_codes, offset, _ in self.__controls
+        ]
+        self.__counts += np.bincount(np.concatenate(codes), minlength=len(self.__counts))
+
+    def report(self):
+        """Compares the accumulated population to the controls.
+
+        For any region and control with target values t_i and synthetic values s_i of its n
+        categories, the following statistics are reported:
+            * srmse:                the standardised root mean square error,
+                                    sqrt(sum((s_i - t_i)^2) / n) / (sum(t_i) / n)
+            * total_absolute_error: sum(|s_i - t_i|)
+            * max_relative_error:   max(|s_i - t_i| / t_i), infinite if there are synthetic
+                                    values in a category without target values
+
+        Returns:
+            a DataFrame with region and control name as index and the statistics as columns
+        """
+        counts = self.__counts.reshape(len(self.__regions), self.__number_categories)
+        reports = []
+        for control_name, _, _, offset, targets in self.__controls:
+            errors = counts[:, offset:offset + targets.shape[1]] - targets
+            absolute_errors = np.abs(errors)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                srmse = np.sqrt((errors ** 2).mean(axis=1)) / targets.mean(axis=1)
+                relative_errors = np.where(targets > 0, absolute_errors / targets,
+                                           np.where(absolute_errors > 0, np.inf, 0.0))
+            reports.append(pd.DataFrame(
+                index=pd.MultiIndex.from_arrays(
+                    [self.__regions, [str(control_name)] * len(self.__regions)],
+                    names=['region', 'control']
+                ),
+                data={
+                    'srmse': srmse,
+                    'total_absolute_error': absolute_errors.sum(axis=1),
+                    'max_relative_error': relative_errors.max(axis=1)
+                },
+                columns=['srmse', 'total_absolute_error', 'max_relative_error']
+            ))
+        return pd.concat(reports)
+
+
+def household_random_numbers(seed, region, number_households, replicates=1):
+    """Random numbers for the sampling of households of a region, see `sample_households`.
+
+    The random numbers are drawn from a counter-based stream keyed by the seed and the region,
+    with the replicate and the position of the household within the region as counters. Hence,
+    they do not depend on any other region, nor on the order in which regions are sampled.
+
+    Parameters:
+        * seed:              the seed of the random numbers
+        * region:            the region string
+        * number_households: the number of households in the region
+        * replicates:        the number of replicates (optional, default: 1)
 
     Returns:
-        a list of Citizens
+        an array of random numbers in [0, 1) of shape (replicates x households)
     """
-    households, seed = param_tuple
-    return list(chain(
-        *([Citizen(householdId=household.id,
-                   markovId=row.markov_id,
-                   initialActivity=row.initial_activity,
-                   activeMetabolicRate=row.metabolic_heat_gain_active,
-                   passiveMetabolicRate=row.metabolic_heat_gain_passive,
-                   randomSeed=_citizen_random_seed(household.id, occupant_id))
-          for occupant_id, (index, row) in enumerate(seed.ix[household.seedId, :].iterrows())]
-          for household in households)))
+    return RandomStream(seed, 'households', region).uniform(
+        np.arange(replicates)[:, np.newaxis],
+        np.arange(number_households)[np.newaxis, :]
+    )
 
 
 def _citizen_random_seed(household_id, occupant_id):
-    return RANDOM_SEED + household_id * MAX_HOUSEHOLD_SIZE + occupant_id
+    # works element-wise on arrays of household and occupant ids as well
+    return RandomStream(RANDOM_SEED, 'citizens').integers(household_id, occupant_id)
@@ -2,7 +2,8 @@ from datetime import timedelta, datetime
 
 import yaml
 
-from . import PeopleFeature, HouseholdFeature, GeographicalLayer
+from . import PeopleFeature, HouseholdFeature, HouseholdSampling, GeographicalLayer
+from .census import read_local_authorities
 
 
 def read_simulation_config(path_to_settings):
@@ -16,6 +17,8 @@ def read_simulation_config(path_to_settings):
     settings['time-step-size'] = timedelta(minutes=settings['time-step-size-minutes'])
     settings['start-time'] = datetime.strptime(settings['start-time'], '%Y-%m-%d %H:%M')
     settings['spatial-resolution'] = GeographicalLayer[settings['spatial-resolution']]
+    settings['local-authorities'] = read_local_authorities(settings['local-authorities'])
+    settings['household-sampling'] = HouseholdSampling[settings['household-sampling']]
     for time_str in ['wake-up-time', 'leave-home-time', 'come-home-time', 'bed-time']:
         settings[time_str] = datetime.strptime(settings[time_str], '%H:%M').time()
     return settings